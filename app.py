@@ -2,126 +2,58 @@
 # coding: utf-8
 
 import numpy as np
-import pandas as pd
-from flask import Flask, request, render_template
-import pickle
+from flask import Flask, request, render_template, jsonify, Response, g
 import warnings
+import hmac
 import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from prediction_cache import PredictionCache, quantize_form
+from model_registry import ModelRegistry
+from model_artifact import SERVING_DTYPE, scale_with_imputation
+import serving_metrics
+import request_profiler
+import resource_config
+import ensemble
+from trend_features import TREND_FEATURES, TrendFeatureStore
+from lstm_state import LSTMStateStore
+from serving_metrics import stage
 warnings.filterwarnings('ignore')
 
 # ============ Model Loading Configuration ============
 SKIP_MODEL_LOADING = False  # Set to True to skip model loading for testing
 
-# Try to import Phase 3 LSTM support
-PHASE3_AVAILABLE = False
-if not SKIP_MODEL_LOADING:
-    try:
-        from tensorflow.keras.models import load_model
-        from sklearn.preprocessing import StandardScaler as SSScaler
-        PHASE3_AVAILABLE = True
-    except Exception as e:
-        print(f"[WARNING] TensorFlow not available: {e}")
-        PHASE3_AVAILABLE = False
+# When served by gunicorn with preload_app, the master imports this module and
+# forks workers. TensorFlow's runtime threads do not survive fork(), so the
+# LSTM is loaded per worker in gunicorn's post_fork hook instead (see gunicorn.conf.py).
+# Otherwise importing this module loads the LSTM (and with the float model,
+# TensorFlow) right away, so the first forecast request does not pay for it;
+# tools that do not need it set SEPSIS_DEFER_PHASE3=1 (batch_score.py, gunicorn.conf.py).
+DEFER_PHASE3_LOADING = os.environ.get('SEPSIS_DEFER_PHASE3', '0') == '1'
 
-app = Flask(__name__, template_folder='templates', static_folder='static', static_url_path='/static')
-
-# Model and scaler placeholders
-model = None
-scaler = None
-scaling_params = None
-phase3_lstm_model = None
-phase3_scaler = None
-phase3_available = False
-threshold_info = None
-optimal_threshold = 0.5
+# Seconds between checks of the artifact files for a new model (0 = off).
+# Reloads can also be triggered with POST /admin/reload.
+RELOAD_INTERVAL = float(os.environ.get('SEPSIS_RELOAD_INTERVAL', 0))
 
-if not SKIP_MODEL_LOADING:
-    # List available model files
-    print("[INFO] Checking available model files...")
-    model_files = {
-        'model_calibrated.pkl': os.path.exists('model_calibrated.pkl'),
-        'scaler_calibrated.pkl': os.path.exists('scaler_calibrated.pkl'),
-        'model_phase2.pkl': os.path.exists('model_phase2.pkl'),
-        'model.pkl': os.path.exists('model.pkl'),
-        'scaler.pkl': os.path.exists('scaler.pkl'),
-        'model_phase3_lstm.h5': os.path.exists('model_phase3_lstm.h5'),
-        'scaler_phase3.pkl': os.path.exists('scaler_phase3.pkl'),
-    }
-    for f, exists in model_files.items():
-        print(f"  - {f}: {'✓ Found' if exists else '✗ Missing'}")
-    
-    # Try to load models in order of preference
-    model_loaded = False
-    
-    # Option 1: Calibrated model
-    if model_files['model_calibrated.pkl'] and model_files['scaler_calibrated.pkl']:
-        try:
-            model = pickle.load(open('model_calibrated.pkl', 'rb'))
-            scaler = pickle.load(open('scaler_calibrated.pkl', 'rb'))
-            if os.path.exists('scaling_params.pkl'):
-                scaling_params = pickle.load(open('scaling_params.pkl', 'rb'))
-            print("[INFO] Using Calibrated model with probability scaling")
-            model_loaded = True
-        except Exception as e:
-            print(f"[WARNING] Failed to load calibrated model: {e}")
-    
-    # Option 2: Phase 2 model
-    if not model_loaded and model_files['model_phase2.pkl']:
-        try:
-            model = pickle.load(open('model_phase2.pkl', 'rb'))
-            if hasattr(model, 'n_features_in_') and model.n_features_in_ == 43:
-                print("[INFO] Phase 2 model requires trend features - skipping")
-                model = None
-            else:
-                if model_files['scaler.pkl']:
-                    scaler = pickle.load(open('scaler.pkl', 'rb'))
-                print("[INFO] Using Phase 2 model")
-                model_loaded = True
-        except Exception as e:
-            print(f"[WARNING] Failed to load Phase 2 model: {e}")
-    
-    # Option 3: Phase 1 model (fallback)
-    if not model_loaded and model_files['model.pkl']:
-        try:
-            model = pickle.load(open('model.pkl', 'rb'))
-            if model_files['scaler.pkl']:
-                scaler = pickle.load(open('scaler.pkl', 'rb'))
-            print("[INFO] Using Phase 1 model (model.pkl)")
-            model_loaded = True
-        except Exception as e:
-            print(f"[ERROR] Failed to load Phase 1 model: {e}")
-    
-    if not model_loaded:
-        print("[ERROR] No ML model could be loaded! Server will return test responses.")
-    
-    # Load Phase 2 threshold info if available
-    if os.path.exists('threshold_info.pkl'):
-        try:
-            threshold_info = pickle.load(open('threshold_info.pkl', 'rb'))
-            optimal_threshold = threshold_info.get('optimal_threshold', 0.5)
-        except:
-            pass
+app = Flask(__name__, template_folder='templates', static_folder='static', static_url_path='/static')
 
-    # Load Phase 3 LSTM model if available
-    if PHASE3_AVAILABLE and model_files['model_phase3_lstm.h5'] and model_files['scaler_phase3.pkl']:
-        try:
-            phase3_lstm_model = load_model('model_phase3_lstm.h5')
-            phase3_scaler = pickle.load(open('scaler_phase3.pkl', 'rb'))
-            phase3_available = True
-            print("[INFO] Phase 3 LSTM model loaded - 6-hour advance prediction available")
-        except Exception as e:
-            print(f"[WARNING] Phase 3 LSTM not available: {e}")
-            phase3_available = False
-else:
-    print("[INFO] SKIP_MODEL_LOADING=True - Running without ML models for testing")
+# Phase 1 result cache (per worker). SEPSIS_CACHE_SIZE=0 disables it.
+prediction_cache = PredictionCache(
+    maxsize=int(os.environ.get('SEPSIS_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('SEPSIS_CACHE_TTL', 300))
+)
 
-# Phase 3 LSTM feature columns
+# Phase 3 LSTM feature columns (must match FEATURE_COLUMNS in train_model_phase3_lstm.py)
 PHASE3_FEATURES = [
-    'HR', 'O2Sat', 'Temp', 'SBP', 'MAP', 'DBP', 'Resp',
-    'BaseExcess', 'HCO3', 'FiO2', 'PaCO2', 'SaO2', 'Creatinine',
-    'Bilirubin_direct', 'Glucose', 'Lactate', 'Magnesium', 'Phosphate',
-    'Bilirubin_total', 'Hgb', 'WBC', 'Fibrinogen', 'Platelets'
+    'HR', 'O2Sat', 'Temp', 'SBP', 'MAP', 'DBP', 'Resp', 'EtCO2', 'BaseExcess', 'HCO3',
+    'FiO2', 'pH', 'PaCO2', 'SaO2', 'AST', 'BUN', 'Alkalinephos', 'Calcium', 'Chloride', 
+    'Creatinine', 'Bilirubin_direct', 'Glucose', 'Lactate', 'Magnesium', 'Phosphate', 
+    'Potassium', 'Hgb'
 ]
+PHASE3_SEQUENCE_LENGTH = 12
+# Hours ahead forecast by the LSTM (FORECAST_STEPS in train_model_phase3_lstm.py)
+PHASE3_HORIZONS = 6
 
 # Base features (27 features)
 FEATURE_NAMES = [
@@ -132,13 +64,32 @@ FEATURE_NAMES = [
     'Age', 'Gender', 'HospAdmTime', 'ICULOS'
 ]
 
-# Phase 2 trend features (optional)
-TREND_FEATURES = [
-    'HR_trend_1h', 'HR_volatility', 'O2Sat_trend_1h', 'O2Sat_volatility',
-    'Temp_trend_1h', 'Temp_volatility', 'Lactate_trend_1h', 'Lactate_volatility',
-    'SBP_trend_1h', 'SBP_volatility', 'Creatinine_trend_1h', 'Creatinine_volatility',
-    'WBC_trend_1h', 'WBC_volatility', 'Glucose_trend_1h', 'Glucose_volatility'
-]
+# Per-patient constants; everything else in FEATURE_NAMES is measured hourly
+STATIC_FEATURES = ['Age', 'Gender', 'HospAdmTime', 'ICULOS']
+
+# Hourly columns accepted by /predict_combined: every time-varying column either
+# model needs, so one parsed history array serves both Phase 1 and Phase 3
+HISTORY_FEATURES = [f for f in FEATURE_NAMES if f not in STATIC_FEATURES] + \
+    [f for f in PHASE3_FEATURES if f not in FEATURE_NAMES]
+PHASE1_HISTORY_INDEX = np.array([HISTORY_FEATURES.index(f) for f in FEATURE_NAMES if f not in STATIC_FEATURES])
+PHASE3_HISTORY_INDEX = np.array([HISTORY_FEATURES.index(f) for f in PHASE3_FEATURES])
+
+# Phase 2 model inputs: the base features followed by the trend features
+# (TREND_FEATURES, maintained per patient by trend_store)
+PHASE2_FEATURES = FEATURE_NAMES + TREND_FEATURES
+
+# Per-patient rolling state for the Phase 2 trend features (per worker)
+trend_store = TrendFeatureStore(
+    maxsize=int(os.environ.get('SEPSIS_TREND_PATIENTS', 10000)),
+    ttl=float(os.environ.get('SEPSIS_TREND_TTL', 86400))
+)
+
+# Per-patient LSTM state for the stateful Phase 3 forecast (per worker)
+lstm_state_store = LSTMStateStore(
+    maxsize=int(os.environ.get('SEPSIS_STATEFUL_PATIENTS', 10000)),
+    ttl=float(os.environ.get('SEPSIS_STATEFUL_TTL', 86400)),
+    max_hours=PHASE3_SEQUENCE_LENGTH
+)
 
 # Clinical reference ranges for warning indicators
 CLINICAL_RANGES = {
@@ -491,260 +442,1050 @@ def get_clinical_instability_label(severity_score, abnormal_count):
         return 'Stable', '#51cf66', 'green'
 
 
-@app.route('/predict', methods=['POST'])
-def predict():
-    '''
-    Predict CURRENT sepsis risk - optimized for clarity and clinical sense.
-    '''
-    prediction_status = "unknown"
-    
-    try:
-        if model is None:
-            return render_template('index.html',
-                prediction_text="Model Not Loaded",
-                confidence="0.00%",
-                explanation="<div style='color: #ff6b6b;'>ML model unavailable. Check server.</div>",
-                risk_level="Error",
-                model_version="No Model",
-                phase3_risk="",
-                is_normal_state=True,
-                prediction_status="error"
-            )
-        
-        form_data = request.form.to_dict()
-        
-        # Fast feature extraction
+# ============ Scoring Pipeline ============
+# Pure functions shared by the Flask views below and the async app in asgi.py.
+# They take parsed form data / arrays and return template context dicts.
+
+MODEL_NOT_LOADED_CONTEXT = {
+    'prediction_text': "Model Not Loaded",
+    'confidence': "0.00%",
+    'explanation': "<div style='color: #ff6b6b;'>ML model unavailable. Check server.</div>",
+    'risk_level': "Error",
+    'model_version': "No Model",
+    'phase3_risk': "",
+    'is_normal_state': True,
+    'prediction_status': "error"
+}
+
+
+def error_context(error_message):
+    """Template context for a failed Phase 1 prediction."""
+    return {
+        'prediction_text': "Prediction Error",
+        'confidence': "0.00%",
+        'explanation': f"<div style='color: #ff6b6b;'>Error: {error_message}</div>",
+        'risk_level': "Error",
+        'model_version': "Error",
+        'phase3_risk': "",
+        'is_normal_state': True,
+        'prediction_status': "error"
+    }
+
+
+def parse_phase1_features(form_data):
+    """
+    Build the (1, 27) Phase 1 feature row from form fields, in FEATURE_NAMES order.
+    Missing or invalid fields are NaN; score_phase1() imputes them.
+    """
+    with stage('parse'):
         features = []
         for feature_name in FEATURE_NAMES:
             try:
-                val = float(form_data.get(feature_name, 0))
+                val = float(form_data.get(feature_name, ''))
             except (ValueError, TypeError):
-                val = 0
+                val = np.nan
             features.append(val)
         
-        final_features = np.array(features).reshape(1, -1)
-        
-        # Scale if available
-        if scaler is not None:
-            final_features = scaler.transform(final_features)
-        
-        # Make prediction
-        probability = model.predict_proba(final_features)[0]
-        prob_sepsis = float(probability[1])
-        
-        # Apply probability scaling if available
-        if scaling_params is not None:
-            prob_min = scaling_params['prob_min']
-            prob_max = scaling_params['prob_max']
-            prob_sepsis = (prob_sepsis - prob_min) / (prob_max - prob_min)
-        
-        current_risk = max(0.0, min(1.0, prob_sepsis))
-        
-        # Get abnormal features
+        return np.array(features, dtype=SERVING_DTYPE).reshape(1, -1)
+
+
+def score_phase1(final_features, bundle=None):
+    """
+    Scale and score a (n, 27) feature matrix with the Phase 1 model.
+    NaN entries are missing values: they take the artifact's imputation
+    values (training medians), or 0 with older models.
+    Returns an array of sepsis risks in [0, 1], one per row.
+    """
+    bundle = bundle or registry.current()
+    
+    # Scale if available
+    with stage('scale'):
+        if bundle.scaler is not None:
+            final_features = scale_with_imputation(bundle.scaler, final_features)
+        else:
+            final_features = np.where(np.isnan(final_features), 0.0, final_features)
+    
+    # Make prediction
+    with stage('inference'):
+        prob_sepsis = bundle.model.predict_proba(final_features)[:, 1]
+    
+    # Calibrated probabilities from the offline lookup table (training_pipeline.py),
+    # otherwise the older min/max probability scaling if available
+    if bundle.calibration is not None:
+        prob_sepsis = np.interp(prob_sepsis, *bundle.calibration)
+    elif bundle.scaling_params is not None:
+        prob_min = bundle.scaling_params['prob_min']
+        prob_max = bundle.scaling_params['prob_max']
+        prob_sepsis = (prob_sepsis - prob_min) / (prob_max - prob_min)
+    
+    return np.clip(prob_sepsis, 0.0, 1.0).astype(SERVING_DTYPE, copy=False)
+
+
+def assess_phase1(form_data, current_risk, threshold=0.5):
+    """
+    Combine the ML risk with the rule-based checks into a prediction status.
+    threshold is the model's decision threshold (bundle.optimal_threshold).
+    Returns a dict with prediction_status, prediction_text, risk_label,
+    color, abnormal_features and vital_instability.
+    """
+    # Get abnormal features
+    with stage('rules'):
         abnormal_features = get_abnormal_features(form_data)
         vital_instability = detect_vital_instability(form_data)
-        
-        # Simple, sensible logic
-        is_high_risk = current_risk >= 0.5
-        is_unstable = vital_instability['severity_score'] >= 2 or len(abnormal_features) >= 3
-        is_normal = current_risk < 0.2 and len(abnormal_features) == 0
-        
-        # Determine output
-        if is_high_risk:
-            # HIGH SEPSIS RISK
-            prediction_status = "high_risk"
-            prediction_text = "HIGH SEPSIS RISK"
-            confidence_display = f"{current_risk * 100:.1f}%"
-            
-            if current_risk >= 0.8:
-                risk_label = "Critical Risk (>80%)"
-                color = "#ff4444"
-            elif current_risk >= 0.65:
-                risk_label = "High Risk (65-80%)"
-                color = "#ff9234"
-            else:
-                risk_label = "Moderate-High Risk (50-65%)"
-                color = "#ffb81c"
-            
-            explanation_html = f"""
-            <div style="background: rgba(255, 68, 68, 0.15); border: 2px solid {color}; 
-                        border-radius: 10px; padding: 20px; margin-bottom: 15px;">
-                <h4 style="color: {color}; margin-top: 0;">⚠️ High Sepsis Risk Detected</h4>
-                <p style="color: #b0b0b0;"><strong>ML Risk Score:</strong> {current_risk * 100:.1f}% — {risk_label}</p>
-                <p style="color: #b0b0b0;"><strong>Clinical Recommendation:</strong> 
-                    Immediate clinical evaluation and sepsis protocol initiation recommended.
-                </p>
-            </div>
-            """
-            
-        elif is_unstable and not is_high_risk:
-            # UNSTABLE BUT NOT SEPSIS
-            prediction_status = "unstable"
-            prediction_text = "CLINICALLY UNSTABLE (Non-Sepsis)"
-            confidence_display = f"{current_risk * 100:.1f}%"
-            risk_label = "Clinical Instability Detected"
-            color = "#ff9f43"
-            
-            explanation_html = f"""
-            <div style="background: rgba(255, 159, 67, 0.15); border: 2px solid {color}; 
-                        border-radius: 10px; padding: 20px; margin-bottom: 15px;">
-                <h4 style="color: {color}; margin-top: 0;">⚠️ Clinical Instability (Non-Sepsis)</h4>
-                <p style="color: #b0b0b0;"><strong>ML Sepsis Risk:</strong> {current_risk * 100:.1f}% (below sepsis threshold)</p>
-                <p style="color: #b0b0b0;"><strong>Clinical Note:</strong> 
-                    Abnormal vitals detected. Investigate underlying cause. Do NOT automatically initiate sepsis protocols.
-                </p>
-            </div>
-            """
-            
-        elif is_normal:
-            # NORMAL PATIENT
-            prediction_status = "normal"
-            prediction_text = "No Current Evidence of Sepsis"
-            confidence_display = f"{current_risk * 100:.1f}%"
-            risk_label = "Low Risk (Normal)"
-            color = "#4ade80"
-            
-            explanation_html = f"""
-            <div style="background: rgba(74, 222, 128, 0.15); border: 2px solid {color}; 
-                        border-radius: 10px; padding: 20px; margin-bottom: 15px;">
-                <h4 style="color: {color}; margin-top: 0;">✓ Patient Status Normal</h4>
-                <p style="color: #b0b0b0;"><strong>ML Sepsis Risk:</strong> {current_risk * 100:.1f}% — No current evidence of sepsis.</p>
-                <p style="color: #b0b0b0;"><strong>Clinical Recommendation:</strong> 
-                    Continue routine monitoring.
-                </p>
-            </div>
-            """
-            
+    
+    # Band edges around the decision threshold: a calibrated threshold may fall
+    # below 20% or above 65%, and the bands must not overlap it
+    low_edge = min(0.2, threshold)
+    high_edge = max(0.65, threshold)
+    critical_edge = max(0.8, threshold)
+    
+    # Simple, sensible logic
+    is_high_risk = current_risk >= threshold
+    is_unstable = vital_instability['severity_score'] >= 2 or len(abnormal_features) >= 3
+    is_normal = current_risk < low_edge and len(abnormal_features) == 0
+    
+    if is_high_risk:
+        prediction_status = "high_risk"
+        prediction_text = "HIGH SEPSIS RISK"
+        if current_risk >= critical_edge:
+            risk_label = f"Critical Risk (>{critical_edge * 100:.0f}%)"
+            color = "#ff4444"
+        elif current_risk >= high_edge:
+            risk_label = f"High Risk ({high_edge * 100:.0f}-{critical_edge * 100:.0f}%)"
+            color = "#ff9234"
         else:
-            # MODERATE RISK
-            prediction_status = "moderate_risk"
-            prediction_text = "Moderate Sepsis Risk"
-            confidence_display = f"{current_risk * 100:.1f}%"
-            risk_label = "Moderate Risk (20-50%)"
-            color = "#ffd700"
-            
-            explanation_html = f"""
-            <div style="background: rgba(255, 215, 0, 0.15); border: 2px solid {color}; 
-                        border-radius: 10px; padding: 20px; margin-bottom: 15px;">
-                <h4 style="color: {color}; margin-top: 0;">⚠️ Moderate Sepsis Risk</h4>
-                <p style="color: #b0b0b0;"><strong>ML Risk Score:</strong> {current_risk * 100:.1f}% — {risk_label}</p>
-                <p style="color: #b0b0b0;"><strong>Clinical Recommendation:</strong> 
-                    Enhanced monitoring recommended. Prepare for possible sepsis protocols.
-                </p>
-            </div>
-            """
-        
-        explanation_html += generate_explanation(form_data, 1 if is_high_risk else 0, current_risk * 100)
-        
-        return render_template(
-            'index.html',
-            prediction_text=prediction_text,
-            confidence=confidence_display,
-            explanation=explanation_html,
-            risk_level=risk_label,
-            model_version="Optimized Phase 1",
-            phase3_risk="",
-            is_normal_state=(prediction_status == "normal"),
-            prediction_status=prediction_status
-        )
+            risk_label = f"Moderate-High Risk ({threshold * 100:.0f}-{high_edge * 100:.0f}%)"
+            color = "#ffb81c"
+    elif is_unstable:
+        prediction_status = "unstable"
+        prediction_text = "CLINICALLY UNSTABLE (Non-Sepsis)"
+        risk_label = "Clinical Instability Detected"
+        color = "#ff9f43"
+    elif is_normal:
+        prediction_status = "normal"
+        prediction_text = "No Current Evidence of Sepsis"
+        risk_label = "Low Risk (Normal)"
+        color = "#4ade80"
+    else:
+        prediction_status = "moderate_risk"
+        prediction_text = "Moderate Sepsis Risk"
+        if low_edge < threshold:
+            risk_label = f"Moderate Risk ({low_edge * 100:.0f}-{threshold * 100:.0f}%)"
+        else:
+            risk_label = f"Moderate Risk (<{threshold * 100:.0f}%)"
+        color = "#ffd700"
     
-    except Exception as e:
-        error_message = str(e)
-        print(f"[ERROR] {error_message}")
-        
-        return render_template(
-            'index.html',
-            prediction_text="Prediction Error",
-            confidence="0.00%",
-            explanation=f"<div style='color: #ff6b6b;'>Error: {error_message}</div>",
-            risk_level="Error",
-            model_version="Error",
-            phase3_risk="",
-            is_normal_state=True,
-            prediction_status="error"
-        )
+    return {
+        'prediction_status': prediction_status,
+        'prediction_text': prediction_text,
+        'risk_label': risk_label,
+        'color': color,
+        'abnormal_features': abnormal_features,
+        'vital_instability': vital_instability
+    }
 
 
-@app.route('/predict_phase3', methods=['POST'])
-def predict_phase3():
+def build_phase1_context(form_data, current_risk, details_html=None, threshold=0.5):
     """
-    Phase 3: LSTM-based 6-hour advance prediction
-    Requires 12-hour historical patient data (sequence of measurements)
+    Turn a Phase 1 risk into the index.html template context.
+    details_html is the output of generate_explanation(); it is computed here
+    when the caller has not already produced it (e.g. on another thread).
     """
-    try:
-        if not phase3_available:
-            return render_template('index.html', 
-                error="Phase 3 LSTM model not available. Using Phase 1/2 prediction instead.")
+    assessment = assess_phase1(form_data, current_risk, threshold)
+    prediction_status = assessment['prediction_status']
+    prediction_text = assessment['prediction_text']
+    risk_label = assessment['risk_label']
+    color = assessment['color']
+    is_high_risk = prediction_status == "high_risk"
+    confidence_display = f"{current_risk * 100:.1f}%"
+    
+    # Determine output
+    if prediction_status == "high_risk":
+        # HIGH SEPSIS RISK
+        explanation_html = f"""
+        <div style="background: rgba(255, 68, 68, 0.15); border: 2px solid {color}; 
+                    border-radius: 10px; padding: 20px; margin-bottom: 15px;">
+            <h4 style="color: {color}; margin-top: 0;">⚠️ High Sepsis Risk Detected</h4>
+            <p style="color: #b0b0b0;"><strong>ML Risk Score:</strong> {current_risk * 100:.1f}% — {risk_label}</p>
+            <p style="color: #b0b0b0;"><strong>Clinical Recommendation:</strong> 
+                Immediate clinical evaluation and sepsis protocol initiation recommended.
+            </p>
+        </div>
+        """
         
-        form_data = request.form.to_dict()
+    elif prediction_status == "unstable":
+        # UNSTABLE BUT NOT SEPSIS
+        explanation_html = f"""
+        <div style="background: rgba(255, 159, 67, 0.15); border: 2px solid {color}; 
+                    border-radius: 10px; padding: 20px; margin-bottom: 15px;">
+            <h4 style="color: {color}; margin-top: 0;">⚠️ Clinical Instability (Non-Sepsis)</h4>
+            <p style="color: #b0b0b0;"><strong>ML Sepsis Risk:</strong> {current_risk * 100:.1f}% (below sepsis threshold)</p>
+            <p style="color: #b0b0b0;"><strong>Clinical Note:</strong> 
+                Abnormal vitals detected. Investigate underlying cause. Do NOT automatically initiate sepsis protocols.
+            </p>
+        </div>
+        """
         
-        # Build 12-timestep sequence from historical data
+    elif prediction_status == "normal":
+        # NORMAL PATIENT
+        explanation_html = f"""
+        <div style="background: rgba(74, 222, 128, 0.15); border: 2px solid {color}; 
+                    border-radius: 10px; padding: 20px; margin-bottom: 15px;">
+            <h4 style="color: {color}; margin-top: 0;">✓ Patient Status Normal</h4>
+            <p style="color: #b0b0b0;"><strong>ML Sepsis Risk:</strong> {current_risk * 100:.1f}% — No current evidence of sepsis.</p>
+            <p style="color: #b0b0b0;"><strong>Clinical Recommendation:</strong> 
+                Continue routine monitoring.
+            </p>
+        </div>
+        """
+        
+    else:
+        # MODERATE RISK
+        explanation_html = f"""
+        <div style="background: rgba(255, 215, 0, 0.15); border: 2px solid {color}; 
+                    border-radius: 10px; padding: 20px; margin-bottom: 15px;">
+            <h4 style="color: {color}; margin-top: 0;">⚠️ Moderate Sepsis Risk</h4>
+            <p style="color: #b0b0b0;"><strong>ML Risk Score:</strong> {current_risk * 100:.1f}% — {risk_label}</p>
+            <p style="color: #b0b0b0;"><strong>Clinical Recommendation:</strong> 
+                Enhanced monitoring recommended. Prepare for possible sepsis protocols.
+            </p>
+        </div>
+        """
+    
+    if details_html is None:
+        with stage('rules'):
+            details_html = generate_explanation(form_data, 1 if is_high_risk else 0, current_risk * 100)
+    explanation_html += details_html
+    
+    return {
+        'prediction_text': prediction_text,
+        'confidence': confidence_display,
+        'explanation': explanation_html,
+        'risk_level': risk_label,
+        'model_version': "Optimized Phase 1",
+        'phase3_risk': "",
+        'is_normal_state': (prediction_status == "normal"),
+        'prediction_status': prediction_status
+    }
+
+
+def phase1_context(form_data, bundle=None):
+    """
+    Full Phase 1 pipeline: parse, scale, score and build the template context.
+    Results are served from prediction_cache when the same (quantized) vitals
+    were scored recently by the same model version.
+    """
+    bundle = bundle or registry.current()
+    if not prediction_cache.enabled:
+        current_risk = float(score_phase1(parse_phase1_features(form_data), bundle)[0])
+        return build_phase1_context(form_data, current_risk, threshold=bundle.optimal_threshold)
+    
+    with stage('parse'):
+        key, canonical = quantize_form(form_data, FEATURE_NAMES, bundle.version)
+    context = prediction_cache.get(key) if key is not None else None
+    if context is None:
+        current_risk = float(score_phase1(parse_phase1_features(canonical), bundle)[0])
+        context = build_phase1_context(canonical, current_risk, threshold=bundle.optimal_threshold)
+        if key is not None:
+            prediction_cache.put(key, context)
+    return context
+
+
+def parse_phase3_sequence(form_data):
+    """
+    Build the (1, 12, n_features) LSTM input from `<feature>_t<step>` form fields.
+    Missing or invalid fields are NaN; forecast_phase3() imputes them.
+    """
+    with stage('parse'):
         sequence = []
-        for t in range(12):
+        for t in range(PHASE3_SEQUENCE_LENGTH):
             timestep = []
             for feature in PHASE3_FEATURES:
                 field_name = f"{feature}_t{t}"
                 try:
-                    val = float(form_data.get(field_name, 0))
+                    val = float(form_data.get(field_name, ''))
                 except (ValueError, TypeError):
-                    val = 0
+                    val = np.nan
                 timestep.append(val)
             sequence.append(timestep)
         
-        # Convert to numpy array and reshape
-        X_sequence = np.array([sequence])  # Shape: (1, 12, 20)
-        
-        # Scale the sequence
-        n_samples, n_timesteps, n_features = X_sequence.shape
+        return np.array([sequence], dtype=SERVING_DTYPE)
+
+
+def forecast_phase3_curve(X_sequence, bundle=None):
+    """
+    Scale a (n, 12, n_features) batch of sequences and run the LSTM once.
+    NaN entries are imputed as in score_phase1().
+    Returns an (n, k) array of sepsis risks in [0, 1]: risk at +1h ... +6h for
+    multi-horizon models (k = PHASE3_HORIZONS), k = 1 for single-output models.
+    """
+    bundle = bundle or registry.current()
+    n_samples, n_timesteps, n_features = X_sequence.shape
+    with stage('scale'):
         X_reshaped = X_sequence.reshape(-1, n_features)
-        X_scaled = phase3_scaler.transform(X_reshaped)
+        X_scaled = scale_with_imputation(bundle.phase3_scaler, X_reshaped)
         X_sequence_scaled = X_scaled.reshape(n_samples, n_timesteps, n_features)
+    
+    # Make prediction
+    with stage('inference'):
+        predictions = bundle.phase3_model.predict(X_sequence_scaled, verbose=0)
+    
+    predictions = predictions.reshape(n_samples, -1)[:, :PHASE3_HORIZONS]
+    return np.clip(predictions, 0.0, 1.0).astype(SERVING_DTYPE, copy=False)
+
+
+def phase3_risk(curves):
+    """6-hour sepsis risk of each forecast_phase3_curve() row: the mean over the hours ahead."""
+    return curves.mean(axis=1)
+
+
+def forecast_phase3(X_sequence, bundle=None):
+    """
+    Run the LSTM on a (n, 12, n_features) batch of sequences.
+    Returns an array of 6-hour sepsis risks in [0, 1], one per sequence.
+    """
+    return phase3_risk(forecast_phase3_curve(X_sequence, bundle))
+
+
+def get_phase3_risk_level(sepsis_risk_6h):
+    """Risk label for a Phase 3 6-hour forecast."""
+    return "HIGH RISK (6-hour)" if sepsis_risk_6h >= 0.5 else "LOW RISK (6-hour)"
+
+
+def phase3_curve_html(curve):
+    """Inline SVG chart of an hourly forecast (risk at +1h ... +kh), with the 50% line."""
+    width, height, pad = 320, 130, 26
+    step = (width - 2 * pad) / max(len(curve) - 1, 1)
+    points = [(pad + i * step, height - pad - float(risk) * (height - 2 * pad)) for i, risk in enumerate(curve)]
+    polyline = ' '.join(f"{x:.1f},{y:.1f}" for x, y in points)
+    half = height / 2
+    markers = ''.join(
+        f'<circle cx="{x:.1f}" cy="{y:.1f}" r="3.5" fill="#c0392b"><title>+{i + 1}h: {float(risk)*100:.1f}%</title></circle>'
+        f'<text x="{x:.1f}" y="{height - 8}" text-anchor="middle" font-size="10">+{i + 1}h</text>'
+        for i, ((x, y), risk) in enumerate(zip(points, curve))
+    )
+    return f"""
+        <svg class="phase3-curve" viewBox="0 0 {width} {height}" width="{width}" height="{height}" role="img"
+             aria-label="Hourly sepsis risk forecast">
+            <line x1="{pad}" y1="{half}" x2="{width - pad}" y2="{half}" stroke="#999" stroke-dasharray="4 3"/>
+            <text x="{width - pad}" y="{half - 4}" text-anchor="end" font-size="9" fill="#999">50%</text>
+            <polyline points="{polyline}" fill="none" stroke="#c0392b" stroke-width="2"/>
+            {markers}
+        </svg>
+        <p class="phase3-hourly">{' · '.join(f"+{i + 1}h {float(risk)*100:.0f}%" for i, risk in enumerate(curve))}</p>"""
+
+
+def build_phase3_context(sepsis_risk_6h, curve=None):
+    """
+    Turn a Phase 3 6-hour risk into the index.html template context.
+    curve: hourly risks from a multi-horizon model, shown as a chart
+    """
+    # Determine risk level
+    risk_level = get_phase3_risk_level(sepsis_risk_6h)
+    if sepsis_risk_6h >= 0.5:
+        prediction_text = f"⚠️ 6-Hour Advance Warning: {sepsis_risk_6h*100:.1f}% Sepsis Risk"
+        confidence = sepsis_risk_6h * 100
+    else:
+        prediction_text = f"✓ 6-Hour Outlook: {(1-sepsis_risk_6h)*100:.1f}% Probability of Remaining Stable"
+        confidence = (1 - sepsis_risk_6h) * 100
+    
+    # Generate Phase 3 specific explanation
+    explanation = f"""
+    <div class="phase3-explanation">
+        <h4><i class="fas fa-clock"></i> 6-Hour Advance Prediction (Phase 3 LSTM)</h4>
+        <p>This prediction analyzes the temporal patterns from the past 12 hours of patient data
+        to forecast sepsis risk for the next 6 hours.</p>
+        <div class="risk-details">
+            <p><strong>Predicted Risk (6h ahead):</strong> {sepsis_risk_6h*100:.1f}%</p>
+            {phase3_curve_html(curve) if curve is not None and len(curve) > 1 else ''}
+            <p><strong>Clinical Action:</strong> 
+            {'Start prophylactic monitoring and prepare early interventions' if sepsis_risk_6h >= 0.5 else 'Continue standard monitoring'}
+            </p>
+        </div>
+    </div>
+    """
+    
+    return {
+        'prediction_text': prediction_text,
+        'confidence': f"{confidence:.2f}%",
+        'explanation': explanation,
+        'risk_level': risk_level,
+        'model_version': "LSTM Time-Series (6-hour forecast)",
+        'is_phase3': True
+    }
+
+
+def phase3_context(form_data, bundle=None):
+    """Full Phase 3 pipeline: parse, scale, forecast and build the template context."""
+    curves = forecast_phase3_curve(parse_phase3_sequence(form_data), bundle)
+    return build_phase3_context(float(phase3_risk(curves)[0]), curves[0])
+
+
+# ============ Phase 2 Trend Pipeline ============
+# One request per patient-hour. trend_store updates the patient's trend
+# features from the new observation in constant time and the 43-feature
+# Phase 2 model scores the base features plus those trends.
+
+def score_phase2(X, bundle=None):
+    """
+    Scale and score a (n, 43) PHASE2_FEATURES matrix with the Phase 2 model.
+    NaN entries are imputed as in score_phase1().
+    Returns an array of sepsis risks in [0, 1], one per row.
+    """
+    bundle = bundle or registry.current()
+    with stage('scale'):
+        if bundle.phase2_scaler is not None:
+            X = scale_with_imputation(bundle.phase2_scaler, X)
+        else:
+            X = np.where(np.isnan(X), 0.0, X)
+    with stage('inference'):
+        prob_sepsis = bundle.phase2_model.predict_proba(X)[:, 1]
+    return np.clip(prob_sepsis, 0.0, 1.0).astype(SERVING_DTYPE, copy=False)
+
+
+def observe_phase2(form_data, bundle=None):
+    """
+    Record one hour of a patient's measurements and score it with the Phase 2 model.
+    
+    Args:
+        form_data: dict with 'patient_id' and the hour's FEATURE_NAMES values
+    
+    Returns:
+        dict: JSON-serialisable result with the risk and the trend features
+    """
+    patient_id = form_data.get('patient_id')
+    if patient_id in (None, ''):
+        raise ValueError("patient_id is required")
+    
+    X_base = parse_phase1_features(form_data)
+    with stage('trend'):
+        trends, hours_observed = trend_store.update(str(patient_id), form_data)
+    risk = float(score_phase2(np.hstack([X_base, trends[np.newaxis].astype(SERVING_DTYPE)]), bundle)[0])
+    return {
+        'patient_id': patient_id,
+        'risk': risk,
+        'risk_level': get_sepsis_risk_label(risk)[0],
+        'trend_features': dict(zip(TREND_FEATURES, trends.tolist())),
+        'hours_observed': hours_observed
+    }
+
+
+# ============ Stateful Phase 3 Pipeline ============
+# One request per patient-hour. lstm_state_store keeps each patient's LSTM
+# state and the causal Phase 3 variant advances it by the new hour only,
+# instead of re-running the 12-hour window.
+
+def advance_stateful(x, state, bundle=None):
+    """
+    Scale one hour of PHASE3_FEATURES values (NaN imputed as in score_phase1())
+    and advance the stateful LSTM by it.
+    Returns ((k,) hourly risks as in forecast_phase3_curve(), new state).
+    """
+    bundle = bundle or registry.current()
+    with stage('scale'):
+        x_scaled = scale_with_imputation(bundle.stateful_scaler, x[np.newaxis])
+    with stage('inference'):
+        outputs, state = bundle.stateful_model.step(x_scaled, state)
+    curve = np.clip(outputs.reshape(-1)[:PHASE3_HORIZONS], 0.0, 1.0).astype(SERVING_DTYPE, copy=False)
+    return curve, state
+
+
+def observe_phase3(form_data, bundle=None):
+    """
+    Record one hour of a patient's measurements and update their forecast
+    with the stateful LSTM.
+    
+    Args:
+        form_data: dict with 'patient_id' and the hour's PHASE3_FEATURES values
+    
+    Returns:
+        dict: JSON-serialisable result with the 6-hour risk and the hourly curve
+    """
+    patient_id = form_data.get('patient_id')
+    if patient_id in (None, ''):
+        raise ValueError("patient_id is required")
+    
+    bundle = bundle or registry.current()
+    model = bundle.stateful_model
+    x = np.array([_to_float(form_data.get(f)) for f in PHASE3_FEATURES], dtype=SERVING_DTYPE)
+    curve, hours_observed = lstm_state_store.update(
+        str(patient_id), x, model.version, model.initial_state,
+        lambda x_filled, state: advance_stateful(x_filled, state, bundle)
+    )
+    risk = float(phase3_risk(curve[np.newaxis])[0])
+    result = {
+        'patient_id': patient_id,
+        'risk': risk,
+        'risk_level': get_phase3_risk_level(risk),
+        'hours_observed': hours_observed
+    }
+    if len(curve) > 1:
+        result['hourly'] = [float(r) for r in curve]
+    return result
+
+
+# ============ Combined Current + 6-Hour Pipeline ============
+# One request carries the patient's recent hourly history. It is parsed once
+# into a (hours, HISTORY_FEATURES) array; the Phase 1 row and the Phase 3
+# sequence are both slices of that array.
+
+# The LSTM releases the GIL inside TensorFlow, so it can overlap with the MLP
+FORECAST_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='phase3-forecast')
+
+
+def _to_float(value):
+    """float(value), NaN (missing) if it is absent or not a number."""
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def history_from_form(form_data):
+    """
+    Convert `<feature>_t<step>` form fields (t0 = oldest) into the JSON
+    payload layout accepted by parse_patient_history().
+    """
+    history = []
+    for t in range(PHASE3_SEQUENCE_LENGTH):
+        hour = {}
+        for feature in HISTORY_FEATURES:
+            field_name = f"{feature}_t{t}"
+            if form_data.get(field_name, '') != '':
+                hour[feature] = form_data[field_name]
+        if hour:
+            history.append(hour)
+    
+    payload = {'history': history}
+    for feature in STATIC_FEATURES:
+        if feature in form_data:
+            payload[feature] = form_data[feature]
+    return payload
+
+
+def parse_patient_history(payload):
+    """
+    Parse a patient's recent history once for both models.
+    
+    Args:
+        payload: {'history': [{feature: value, ...}, ...] oldest hour first,
+                  'Age': ..., 'Gender': ..., 'HospAdmTime': ..., 'ICULOS': ...}
+    
+    Returns:
+        tuple: (history array (hours, len(HISTORY_FEATURES)),
+                static array (len(STATIC_FEATURES),), both NaN where not given,
+                latest-hour dict of raw values for the rule checks)
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("payload must be a JSON object")
+    hours = payload.get('history') or []
+    if not isinstance(hours, list):
+        raise ValueError("history must be a list of hourly measurements")
+    if not hours:
+        raise ValueError("history must contain at least one hourly measurement")
+    if not all(isinstance(hour, dict) for hour in hours):
+        raise ValueError("each hour of history must be a JSON object of feature values")
+    
+    history = np.empty((len(hours), len(HISTORY_FEATURES)), dtype=SERVING_DTYPE)
+    for i, hour in enumerate(hours):
+        for j, feature in enumerate(HISTORY_FEATURES):
+            history[i, j] = _to_float(hour.get(feature))
+    
+    static = np.array([_to_float(payload.get(feature)) for feature in STATIC_FEATURES], dtype=SERVING_DTYPE)
+    
+    latest = {feature: str(value) for feature, value in hours[-1].items()}
+    for feature in STATIC_FEATURES:
+        if feature in payload:
+            latest[feature] = str(payload[feature])
+    
+    return history, static, latest
+
+
+def phase1_features_from_history(history, static):
+    """Latest hour of the parsed history as a (1, 27) Phase 1 feature row."""
+    row = np.empty(len(FEATURE_NAMES), dtype=history.dtype)
+    row[:len(PHASE1_HISTORY_INDEX)] = history[-1, PHASE1_HISTORY_INDEX]
+    row[len(PHASE1_HISTORY_INDEX):] = static
+    return row.reshape(1, -1)
+
+
+def phase3_sequence_from_history(history):
+    """
+    Last PHASE3_SEQUENCE_LENGTH hours of the parsed history as a
+    (1, 12, n_features) LSTM input. Short histories are padded with the
+    oldest hour, as in Phase3LSTMPredictor.create_sequence.
+    """
+    sequence = history[-PHASE3_SEQUENCE_LENGTH:, PHASE3_HISTORY_INDEX]
+    if len(sequence) < PHASE3_SEQUENCE_LENGTH:
+        padding = np.repeat(sequence[:1], PHASE3_SEQUENCE_LENGTH - len(sequence), axis=0)
+        sequence = np.concatenate([padding, sequence])
+    return sequence[np.newaxis]
+
+
+def score_combined(X_current, X_sequence, bundle=None):
+    """
+    Score the current risk and the hourly forecast, overlapping the LSTM with
+    the MLP. Returns (current_risks, forecast_curves); forecast_curves is the
+    (n, k) forecast_phase3_curve() output, None when the Phase 3 model is not loaded.
+    """
+    bundle = bundle or registry.current()
+    forecast_future = None
+    if bundle.phase3_available:
+        # Run in a copy of this context so its stage timings count towards the request
+        forecast_future = FORECAST_EXECUTOR.submit(contextvars.copy_context().run, forecast_phase3_curve,
+                                                  X_sequence, bundle)
+    
+    current_risks = score_phase1(X_current, bundle)
+    forecast_curves = forecast_future.result() if forecast_future is not None else None
+    return current_risks, forecast_curves
+
+
+def build_combined_result(latest, current_risk, forecast_curve, hours_received, threshold=0.5):
+    """
+    JSON-serialisable result for /predict_combined.
+    forecast_curve: one forecast_phase3_curve() row, or None without the Phase 3 model
+    """
+    assessment = assess_phase1(latest, current_risk, threshold)
+    result = {
+        'current': {
+            'risk': current_risk,
+            'prediction_status': assessment['prediction_status'],
+            'prediction_text': assessment['prediction_text'],
+            'risk_level': assessment['risk_label'],
+            'abnormal_features': assessment['abnormal_features'],
+            'vital_instability': assessment['vital_instability']
+        },
+        'forecast_6h': None,
+        'hours_received': hours_received
+    }
+    if forecast_curve is not None:
+        forecast_risk = float(phase3_risk(forecast_curve[np.newaxis])[0])
+        result['forecast_6h'] = {
+            'risk': forecast_risk,
+            'risk_level': get_phase3_risk_level(forecast_risk)
+        }
+        if len(forecast_curve) > 1:
+            result['forecast_6h']['hourly'] = [float(risk) for risk in forecast_curve]
+    return result
+
+
+# ============ Ensemble Pipeline ============
+# MLP, rule score and LSTM for a batch of patient histories, each component
+# scored once for the whole batch and combined by ensemble.combine().
+
+def parse_patient_batch(payload):
+    """
+    Parse {'patients': [history payload, ...]} (or a single history payload)
+    into batched model inputs.
+    
+    Returns:
+        tuple: (X_current (n, 27), X_sequence (n, 12, n_features),
+                X_rules (n, len(ensemble.RULE_FEATURES)), hours received per patient)
+    """
+    if isinstance(payload, dict) and 'patients' in payload:
+        patients = payload['patients']
+        if not isinstance(patients, list) or not patients:
+            raise ValueError("patients must be a non-empty list")
+    else:
+        patients = [payload]
+    
+    X_current, X_sequence, latest_hours, hours_received = [], [], [], []
+    for patient in patients:
+        history, static, latest = parse_patient_history(patient)
+        X_current.append(phase1_features_from_history(history, static))
+        X_sequence.append(phase3_sequence_from_history(history))
+        latest_hours.append(latest)
+        hours_received.append(len(history))
+    return (np.concatenate(X_current), np.concatenate(X_sequence),
+            ensemble.rule_features(latest_hours), hours_received)
+
+
+def score_ensemble(X_current, X_sequence, X_rules, bundle=None, weights=None):
+    """
+    Ensemble risk for a batch. The LSTM overlaps with the MLP as in score_combined().
+    Returns (risks, components dict, weights used).
+    """
+    current_risks, forecast_curves = score_combined(X_current, X_sequence, bundle)
+    with stage('rules'):
+        rules_risks = ensemble.rule_risk_scores(X_rules)
+    forecast_risks = phase3_risk(forecast_curves) if forecast_curves is not None else None
+    components = {'mlp': current_risks, 'rules': rules_risks, 'lstm': forecast_risks}
+    risks, used_weights = ensemble.combine(components, weights)
+    return risks, components, used_weights
+
+
+def build_ensemble_result(risks, components, used_weights, hours_received, model_version):
+    """JSON-serialisable result for /predict_ensemble."""
+    patients = ensemble.breakdown(components, risks, used_weights)
+    for patient, hours in zip(patients, hours_received):
+        patient['risk_level'] = get_sepsis_risk_label(patient['risk'])[0]
+        patient['hours_received'] = hours
+    return {'patients': patients, 'weights': used_weights, 'model_version': model_version}
+
+
+def request_payload():
+    """Combined-endpoint payload from a JSON body or `<feature>_t<step>` form fields."""
+    if request.is_json:
+        return request.get_json()
+    return history_from_form(request.form.to_dict())
+
+
+
+# ============ Model Registry / Hot Reload ============
+
+# A clearly normal and a clearly septic patient; every new bundle must score
+# both to finite probabilities before it is allowed to go live
+CANARY_PATIENTS = [
+    {'HR': '72', 'O2Sat': '98', 'Temp': '36.9', 'SBP': '118', 'MAP': '85', 'DBP': '72', 'Resp': '14',
+     'Glucose': '95', 'Lactate': '1.0', 'WBC': '7.0', 'Age': '45', 'Gender': '1', 'ICULOS': '2'},
+    {'HR': '128', 'O2Sat': '89', 'Temp': '39.4', 'SBP': '82', 'MAP': '58', 'DBP': '45', 'Resp': '29',
+     'Glucose': '180', 'Lactate': '4.8', 'WBC': '19.5', 'Creatinine': '2.6', 'Age': '71', 'Gender': '0',
+     'ICULOS': '30'},
+]
+
+
+def validate_bundle(bundle):
+    """Canary check run by the registry before a new bundle is swapped in."""
+    if getattr(bundle.model, 'n_features_in_', len(FEATURE_NAMES)) != len(FEATURE_NAMES):
+        raise ValueError(f"model expects {bundle.model.n_features_in_} features, server provides {len(FEATURE_NAMES)}")
+    
+    X = np.vstack([parse_phase1_features(patient) for patient in CANARY_PATIENTS])
+    risks = score_phase1(X, bundle)
+    if risks.shape != (len(CANARY_PATIENTS),) or not np.all(np.isfinite(risks)):
+        raise ValueError(f"Phase 1 canary produced invalid risks: {risks}")
+    
+    if bundle.phase3_available:
+        sequence = np.zeros((1, PHASE3_SEQUENCE_LENGTH, len(PHASE3_FEATURES)), dtype=SERVING_DTYPE)
+        forecast = forecast_phase3_curve(sequence, bundle)
+        if forecast.shape[0] != 1 or forecast.shape[1] not in (1, PHASE3_HORIZONS) or not np.all(np.isfinite(forecast)):
+            raise ValueError(f"Phase 3 canary produced invalid risks: {forecast}")
+    
+    if bundle.stateful_available:
+        model = bundle.stateful_model
+        outputs, _ = model.step(np.zeros((1, len(PHASE3_FEATURES)), dtype=SERVING_DTYPE), model.initial_state())
+        if not np.all(np.isfinite(outputs)):
+            raise ValueError(f"Stateful LSTM canary produced invalid risks: {outputs}")
+    
+    if bundle.phase2_available:
+        X = np.hstack([np.vstack([parse_phase1_features(patient) for patient in CANARY_PATIENTS]),
+                       np.zeros((len(CANARY_PATIENTS), len(TREND_FEATURES)))])
+        risks = score_phase2(X, bundle)
+        if risks.shape != (len(CANARY_PATIENTS),) or not np.all(np.isfinite(risks)):
+            raise ValueError(f"Phase 2 canary produced invalid risks: {risks}")
+
+
+def _on_model_swap(bundle):
+    # Cached results belong to the previous model
+    prediction_cache.clear()
+
+
+registry = ModelRegistry(canary=validate_bundle, on_swap=_on_model_swap)
+
+
+def load_models():
+    """
+    Load (or reload) the Phase 1/2 sklearn model, scaler and calibration files.
+    Safe to call before fork: the loaded objects are shared copy-on-write by
+    every worker.
+    """
+    return registry.load()
+
+
+def load_phase3_model():
+    """
+    Load the Phase 3 LSTM and its scaler into the live bundle.
+    Must run in the process that will call it (i.e. after fork under gunicorn).
+    """
+    return registry.load(include_phase3=True)
+
+
+def init_worker():
+    """Per-process setup: load the LSTM and start the artifact watcher."""
+    load_phase3_model()
+    registry.start_watcher(RELOAD_INTERVAL)
+
+
+def render_index(**context):
+    """Render index.html, timed as the 'render' stage."""
+    with stage('render'):
+        return render_template('index.html', **context)
+
+
+# Endpoints the request profiler may sample, and its ring buffer (per worker)
+PROFILED_ENDPOINTS = {'predict', 'predict_phase3', 'predict_combined', 'predict_ensemble', 'predict_trend'}
+profile_store = request_profiler.ProfileStore()
+
+
+@app.before_request
+def start_request_timer():
+    serving_metrics.start_request(request.endpoint, registry.current().version)
+    if request.endpoint in PROFILED_ENDPOINTS and request_profiler.should_profile(
+            request_profiler.PROFILE_HEADER in request.headers and admin_authorized()):
+        g.profiler = request_profiler.SamplingProfiler().start()
+        g.profile_started = time.perf_counter()
+
+
+def stop_request_profile(status):
+    """Stop the current request's profiler, if any, and store its profile (returned)."""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return None
+    profiler.stop()
+    return profile_store.add(request.endpoint, status, time.perf_counter() - g.profile_started, profiler)
+
+
+@app.after_request
+def record_request_metrics(response):
+    serving_metrics.finish_request(response.status_code)
+    profile = stop_request_profile(response.status_code)
+    if profile is not None:
+        response.headers['X-Sepsis-Profile-Id'] = str(profile['id'])
+    return response
+
+
+@app.teardown_request
+def finish_failed_request(error):
+    # after_request is skipped when a view's exception propagates (debug,
+    # PROPAGATE_EXCEPTIONS) or a hook fails; the profiler would keep sampling
+    # with the switch interval lowered. No-op when after_request has run.
+    stop_request_profile(500)
+    serving_metrics.finish_request(500)
+
+
+def admin_authorized(headers=None):
+    """
+    Admin calls need SEPSIS_ADMIN_TOKEN in X-Admin-Token. Without a token set
+    the admin routes are refused: behind a reverse proxy every request would
+    appear to come from localhost.
+    headers defaults to the Flask request's; asgi.py passes the Quart request's.
+    """
+    token = os.environ.get('SEPSIS_ADMIN_TOKEN')
+    if not token:
+        return False
+    headers = request.headers if headers is None else headers
+    return hmac.compare_digest(headers.get('X-Admin-Token', '').encode(), token.encode())
+
+
+@app.route('/predict', methods=['POST'])
+def predict():
+    '''
+    Predict CURRENT sepsis risk - optimized for clarity and clinical sense.
+    '''
+    try:
+        bundle = registry.current()
+        if bundle.model is None:
+            return render_index(**MODEL_NOT_LOADED_CONTEXT)
         
-        # Make prediction
-        predictions = phase3_lstm_model.predict(X_sequence_scaled, verbose=0)
-        
-        # Get 6-step ahead average prediction (next 6 hours)
-        sepsis_risk_6h = float(np.mean(predictions[0, :6, 0]))  # Average of first 6 timesteps
-        sepsis_risk_6h = max(0.0, min(1.0, sepsis_risk_6h))  # Clip to [0, 1]
+        form_data = request.form.to_dict()
+        return render_index(**phase1_context(form_data, bundle))
+    
+    except Exception as e:
+        error_message = str(e)
+        print(f"[ERROR] {error_message}")
+        serving_metrics.record_error(e)
         
-        # Determine risk level
-        if sepsis_risk_6h >= 0.5:
-            risk_level = "HIGH RISK (6-hour)"
-            prediction_text = f"⚠️ 6-Hour Advance Warning: {sepsis_risk_6h*100:.1f}% Sepsis Risk"
-            confidence = sepsis_risk_6h * 100
-        else:
-            risk_level = "LOW RISK (6-hour)"
-            prediction_text = f"✓ 6-Hour Outlook: {(1-sepsis_risk_6h)*100:.1f}% Probability of Remaining Stable"
-            confidence = (1 - sepsis_risk_6h) * 100
+        return render_index(**error_context(error_message))
+
+
+@app.route('/predict_phase3', methods=['POST'])
+def predict_phase3():
+    """
+    Phase 3: LSTM-based 6-hour advance prediction
+    Requires 12-hour historical patient data (sequence of measurements)
+    """
+    try:
+        bundle = registry.current()
+        if not bundle.phase3_available:
+            return render_index(
+                error="Phase 3 LSTM model not available. Using Phase 1/2 prediction instead.")
         
-        # Generate Phase 3 specific explanation
-        explanation = f"""
-        <div class="phase3-explanation">
-            <h4><i class="fas fa-clock"></i> 6-Hour Advance Prediction (Phase 3 LSTM)</h4>
-            <p>This prediction analyzes the temporal patterns from the past 12 hours of patient data
-            to forecast sepsis risk for the next 6 hours.</p>
-            <div class="risk-details">
-                <p><strong>Predicted Risk (6h ahead):</strong> {sepsis_risk_6h*100:.1f}%</p>
-                <p><strong>Clinical Action:</strong> 
-                {'Start prophylactic monitoring and prepare early interventions' if sepsis_risk_6h >= 0.5 else 'Continue standard monitoring'}
-                </p>
-            </div>
-        </div>
-        """
+        form_data = request.form.to_dict()
+        return render_index(**phase3_context(form_data, bundle))
+    
+    except Exception as e:
+        serving_metrics.record_error(e)
+        error_msg = f"Phase 3 Error: {str(e)}"
+        return render_index(prediction_text=error_msg, error=error_msg)
+
+
+@app.route('/predict_combined', methods=['POST'])
+def predict_combined():
+    """
+    Current sepsis risk (Phase 1) and 6-hour forecast (Phase 3) from a single
+    patient history, parsed and preprocessed once. Returns JSON.
+    """
+    try:
+        bundle = registry.current()
+        if bundle.model is None:
+            return jsonify({'error': "ML model unavailable. Check server."}), 503
         
-        return render_template(
-            'index.html',
-            prediction_text=prediction_text,
-            confidence=f"{confidence:.2f}%",
-            explanation=explanation,
-            risk_level=risk_level,
-            model_version="LSTM Time-Series (6-hour forecast)",
-            is_phase3=True
+        with stage('parse'):
+            history, static, latest = parse_patient_history(request_payload())
+        current_risks, forecast_curves = score_combined(
+            phase1_features_from_history(history, static),
+            phase3_sequence_from_history(history),
+            bundle
         )
+        
+        forecast_curve = forecast_curves[0] if forecast_curves is not None else None
+        return jsonify(build_combined_result(latest, float(current_risks[0]), forecast_curve, len(history),
+                                             bundle.optimal_threshold))
     
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        error_msg = f"Phase 3 Error: {str(e)}"
-        return render_template('index.html', prediction_text=error_msg, error=error_msg)
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/predict_ensemble', methods=['POST'])
+def predict_ensemble():
+    """
+    Ensemble risk (MLP + rules + LSTM) with the per-component breakdown for
+    one patient history or a batch of them. Returns JSON.
+    """
+    try:
+        bundle = registry.current()
+        if bundle.model is None:
+            return jsonify({'error': "ML model unavailable. Check server."}), 503
+        
+        with stage('parse'):
+            X_current, X_sequence, X_rules, hours_received = parse_patient_batch(request_payload())
+        risks, components, used_weights = score_ensemble(X_current, X_sequence, X_rules, bundle)
+        return jsonify(build_ensemble_result(risks, components, used_weights, hours_received, bundle.version))
+    
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/predict_trend', methods=['POST'])
+def predict_trend():
+    """
+    Phase 2 risk for one new hour of a patient's measurements (JSON or form
+    fields with patient_id). Trend features come from the per-patient store,
+    so each hour costs the same however long the patient has been monitored.
+    """
+    try:
+        bundle = registry.current()
+        if not bundle.phase2_available:
+            return jsonify({'error': "Phase 2 trend model unavailable."}), 503
+        form_data = request.get_json() if request.is_json else request.form.to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError("payload must be a JSON object")
+        return jsonify(dict(observe_phase2(form_data, bundle), model_version=bundle.version))
+    
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/predict_phase3_stream', methods=['POST'])
+def predict_phase3_stream():
+    """
+    6-hour forecast updated with one new hour of a patient's measurements
+    (JSON or form fields with patient_id). The stateful LSTM keeps each
+    patient's state, so an update costs one LSTM step, not a 12-hour window.
+    """
+    try:
+        bundle = registry.current()
+        if not bundle.stateful_available:
+            return jsonify({'error': "Stateful Phase 3 model unavailable."}), 503
+        form_data = request.get_json() if request.is_json else request.form.to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError("payload must be a JSON object")
+        return jsonify(dict(observe_phase3(form_data, bundle), model_version=bundle.version))
+    
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Hit/miss counters of the Phase 1 prediction cache for this worker."""
+    return jsonify(dict(prediction_cache.stats(), trend_store=trend_store.stats(),
+                        lstm_state_store=lstm_state_store.stats(),
+                        model_version=registry.current().version, pid=os.getpid()))
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker: latency histograms, errors, cache and model version."""
+    body = serving_metrics.render_metrics(prediction_cache.stats(), registry.status())
+    return Response(body, content_type=serving_metrics.CONTENT_TYPE)
+
+
+@app.route('/admin/models')
+def admin_models():
+    """Live model version and reload status for this worker."""
+    if not admin_authorized():
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(registry.status())
+
+
+@app.route('/admin/resources')
+def admin_resources():
+    """Thread pools and CPU affinity of this worker (resource_config)."""
+    if not admin_authorized():
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(dict(resource_config.report(), pid=os.getpid()))
+
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    """Recent request profiles in this worker, newest first."""
+    if not admin_authorized():
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify({'profiles': profile_store.summaries(), 'pid': os.getpid()})
+
+
+@app.route('/admin/profiles/<int:profile_id>')
+def admin_profile(profile_id):
+    """One profile as folded stacks (flamegraph.pl / speedscope input)."""
+    if not admin_authorized():
+        return jsonify({'error': 'forbidden'}), 403
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({'error': f"profile {profile_id} not found"}), 404
+    return Response(request_profiler.folded(profile), content_type='text/plain; charset=utf-8')
+
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    """Reload changed artifacts in the background; the swap happens after the canary passes."""
+    if not admin_authorized():
+        return jsonify({'error': 'forbidden'}), 403
+    registry.reload_async()
+    return jsonify(dict(registry.status(), reload='started')), 202
+
+
+# Development server (python app.py) is one process; gunicorn.conf.py, asgi.py
+# and batch_score.py configure the others
+if __name__ == '__main__':
+    resource_config.configure(workers=1)
+
+if not SKIP_MODEL_LOADING:
+    if DEFER_PHASE3_LOADING:
+        load_models()
+    else:
+        init_worker()
+else:
+    print("[INFO] SKIP_MODEL_LOADING=True - Running without ML models for testing")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Async (ASGI) serving path for the sepsis prediction app.
+
+    WEB_CONCURRENCY=4 uvicorn asgi:asgi_app     # uvicorn's --workers default; sizes the thread pools
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:asgi_app
+
+Same routes and templates as app.py, served by a Quart app on one event loop:
+- Phase 1 MLP scoring is cheap and runs inline on the loop
+- Phase 3 LSTM inference runs on a dedicated executor
+- Rule-based explanation HTML runs on its own executor
+so a slow TensorFlow call never holds up /predict requests queued behind it.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, request, render_template, jsonify, Response, g
+
+import resource_config
+
+# Thread pools are sized before app.py loads numpy and the models. uvicorn takes
+# its worker count from WEB_CONCURRENCY (the --workers default); under gunicorn,
+# gunicorn.conf.py has configured them already.
+if not resource_config.configured():
+    resource_config.configure(int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+import app as sepsis_app
+import ensemble
+import request_profiler
+import serving_metrics
+from prediction_cache import quantize_form
+from serving_metrics import stage
+
+asgi_app = Quart(__name__, template_folder='templates', static_folder='static', static_url_path='/static')
+
+# TensorFlow parallelises inside a single call, so one LSTM thread per worker is
+# usually enough; the explanation pool only runs short pure-Python work.
+PHASE3_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SEPSIS_LSTM_THREADS', 1)),
+    thread_name_prefix='phase3-lstm'
+)
+EXPLAIN_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('SEPSIS_EXPLAIN_THREADS', 2)),
+    thread_name_prefix='explain'
+)
+
+
+async def run_in_executor(executor, func, *args):
+    """
+    Run a blocking function on one of the dedicated executors, in a copy of
+    the current context so its stage timings count towards the request.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, func, *args)
+    return await loop.run_in_executor(executor, call)
+
+
+def explain(form_data):
+    """generate_explanation() timed as the 'rules' stage."""
+    with stage('rules'):
+        return sepsis_app.generate_explanation(form_data, 0, 0)
+
+
+async def render_index(**context):
+    """Render index.html, timed as the 'render' stage."""
+    with stage('render'):
+        return await render_template('index.html', **context)
+
+
+async def phase1_context_async(form_data, bundle):
+    """
+    Phase 1 pipeline with the explanation built concurrently.
+    generate_explanation() only depends on the raw vitals, so it can start
+    before the MLP has produced a score. Shares app.prediction_cache.
+    """
+    cache = sepsis_app.prediction_cache
+    key = None
+    if cache.enabled:
+        with stage('parse'):
+            key, form_data = quantize_form(form_data, sepsis_app.FEATURE_NAMES, bundle.version)
+        context = cache.get(key) if key is not None else None
+        if context is not None:
+            return context
+
+    details_task = asyncio.ensure_future(
+        run_in_executor(EXPLAIN_EXECUTOR, explain, form_data)
+    )
+    try:
+        current_risk = float(sepsis_app.score_phase1(sepsis_app.parse_phase1_features(form_data), bundle)[0])
+    except Exception:
+        details_task.cancel()
+        raise
+    details_html = await details_task
+    context = sepsis_app.build_phase1_context(form_data, current_risk, details_html, bundle.optimal_threshold)
+    if key is not None:
+        cache.put(key, context)
+    return context
+
+
+async def forecast_phase3_async(X_sequence, bundle):
+    """Run the LSTM forecast on the Phase 3 executor; returns forecast_phase3_curve() output."""
+    return await run_in_executor(PHASE3_EXECUTOR, sepsis_app.forecast_phase3_curve, X_sequence, bundle)
+
+
+async def score_now_and_forecast(X_current, X_sequence, bundle):
+    """
+    Score the current risk and the 6-hour forecast concurrently.
+    The LSTM is dispatched first; the MLP runs inline while it is in flight.
+    Returns (current_risks, forecast_curves); forecast_curves is None when
+    the Phase 3 model is not loaded.
+    """
+    forecast_task = None
+    if bundle.phase3_available:
+        forecast_task = asyncio.ensure_future(forecast_phase3_async(X_sequence, bundle))
+
+    try:
+        current_risks = sepsis_app.score_phase1(X_current, bundle)
+    except Exception:
+        if forecast_task is not None:
+            forecast_task.cancel()
+        raise
+
+    forecast_curves = await forecast_task if forecast_task is not None else None
+    return current_risks, forecast_curves
+
+
+@asgi_app.route('/')
+async def home():
+    return await render_template('index.html')
+
+
+@asgi_app.route('/predict', methods=['POST'])
+async def predict():
+    """Async version of app.predict()."""
+    try:
+        bundle = sepsis_app.registry.current()
+        if bundle.model is None:
+            return await render_index(**sepsis_app.MODEL_NOT_LOADED_CONTEXT)
+
+        form_data = (await request.form).to_dict()
+        context = await phase1_context_async(form_data, bundle)
+        return await render_index(**context)
+
+    except Exception as e:
+        error_message = str(e)
+        print(f"[ERROR] {error_message}")
+        serving_metrics.record_error(e)
+
+        return await render_index(**sepsis_app.error_context(error_message))
+
+
+@asgi_app.route('/predict_phase3', methods=['POST'])
+async def predict_phase3():
+    """Async version of app.predict_phase3(); the LSTM runs off the event loop."""
+    try:
+        bundle = sepsis_app.registry.current()
+        if not bundle.phase3_available:
+            return await render_index(
+                error="Phase 3 LSTM model not available. Using Phase 1/2 prediction instead.")
+
+        form_data = (await request.form).to_dict()
+        X_sequence = sepsis_app.parse_phase3_sequence(form_data)
+        curves = await forecast_phase3_async(X_sequence, bundle)
+        sepsis_risk_6h = float(sepsis_app.phase3_risk(curves)[0])
+        return await render_index(**sepsis_app.build_phase3_context(sepsis_risk_6h, curves[0]))
+
+    except Exception as e:
+        serving_metrics.record_error(e)
+        error_msg = f"Phase 3 Error: {str(e)}"
+        return await render_index(prediction_text=error_msg, error=error_msg)
+
+
+@asgi_app.route('/predict_combined', methods=['POST'])
+async def predict_combined():
+    """Async version of app.predict_combined(); MLP inline, LSTM on its executor."""
+    try:
+        bundle = sepsis_app.registry.current()
+        if bundle.model is None:
+            return jsonify({'error': "ML model unavailable. Check server."}), 503
+
+        if request.is_json:
+            payload = await request.get_json()
+        else:
+            payload = sepsis_app.history_from_form((await request.form).to_dict())
+
+        with stage('parse'):
+            history, static, latest = sepsis_app.parse_patient_history(payload)
+        current_risks, forecast_curves = await score_now_and_forecast(
+            sepsis_app.phase1_features_from_history(history, static),
+            sepsis_app.phase3_sequence_from_history(history),
+            bundle
+        )
+
+        forecast_curve = forecast_curves[0] if forecast_curves is not None else None
+        return jsonify(sepsis_app.build_combined_result(latest, float(current_risks[0]), forecast_curve, len(history),
+                                                        bundle.optimal_threshold))
+
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@asgi_app.route('/predict_ensemble', methods=['POST'])
+async def predict_ensemble():
+    """Async version of app.predict_ensemble(); MLP and rules inline, LSTM on its executor."""
+    try:
+        bundle = sepsis_app.registry.current()
+        if bundle.model is None:
+            return jsonify({'error': "ML model unavailable. Check server."}), 503
+
+        if request.is_json:
+            payload = await request.get_json()
+        else:
+            payload = sepsis_app.history_from_form((await request.form).to_dict())
+
+        with stage('parse'):
+            X_current, X_sequence, X_rules, hours_received = sepsis_app.parse_patient_batch(payload)
+        current_risks, forecast_curves = await score_now_and_forecast(X_current, X_sequence, bundle)
+        forecast_risks = sepsis_app.phase3_risk(forecast_curves) if forecast_curves is not None else None
+        with stage('rules'):
+            rules_risks = ensemble.rule_risk_scores(X_rules)
+        components = {'mlp': current_risks, 'rules': rules_risks, 'lstm': forecast_risks}
+        risks, used_weights = ensemble.combine(components)
+        return jsonify(sepsis_app.build_ensemble_result(risks, components, used_weights, hours_received,
+                                                        bundle.version))
+
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@asgi_app.route('/predict_trend', methods=['POST'])
+async def predict_trend():
+    """Async version of app.predict_trend(); the O(1) store update and the model run inline."""
+    try:
+        bundle = sepsis_app.registry.current()
+        if not bundle.phase2_available:
+            return jsonify({'error': "Phase 2 trend model unavailable."}), 503
+        if request.is_json:
+            form_data = await request.get_json()
+        else:
+            form_data = (await request.form).to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError("payload must be a JSON object")
+        return jsonify(dict(sepsis_app.observe_phase2(form_data, bundle), model_version=bundle.version))
+
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@asgi_app.route('/predict_phase3_stream', methods=['POST'])
+async def predict_phase3_stream():
+    """Async version of app.predict_phase3_stream(); one LSTM step per update, run inline."""
+    try:
+        bundle = sepsis_app.registry.current()
+        if not bundle.stateful_available:
+            return jsonify({'error': "Stateful Phase 3 model unavailable."}), 503
+        if request.is_json:
+            form_data = await request.get_json()
+        else:
+            form_data = (await request.form).to_dict()
+        if not isinstance(form_data, dict):
+            raise ValueError("payload must be a JSON object")
+        return jsonify(dict(sepsis_app.observe_phase3(form_data, bundle), model_version=bundle.version))
+
+    except ValueError as e:
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        serving_metrics.record_error(e)
+        return jsonify({'error': str(e)}), 500
+
+
+@asgi_app.route('/cache_stats')
+async def cache_stats():
+    """Hit/miss counters of the Phase 1 prediction cache for this worker."""
+    stats = sepsis_app.prediction_cache.stats()
+    return jsonify(dict(stats, trend_store=sepsis_app.trend_store.stats(),
+                        lstm_state_store=sepsis_app.lstm_state_store.stats(),
+                        model_version=sepsis_app.registry.current().version, pid=os.getpid()))
+
+
+@asgi_app.route('/metrics')
+async def metrics():
+    body = serving_metrics.render_metrics(sepsis_app.prediction_cache.stats(), sepsis_app.registry.status())
+    return Response(body, content_type=serving_metrics.CONTENT_TYPE)
+
+
+@asgi_app.route('/admin/models')
+async def admin_models():
+    if not sepsis_app.admin_authorized(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify(sepsis_app.registry.status())
+
+
+@asgi_app.route('/admin/resources')
+async def admin_resources():
+    """Thread pools and CPU affinity of this worker, with the executor sizes."""
+    if not sepsis_app.admin_authorized(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    executors = {'phase3': PHASE3_EXECUTOR._max_workers, 'explain': EXPLAIN_EXECUTOR._max_workers}
+    return jsonify(dict(resource_config.report(), executors=executors, pid=os.getpid()))
+
+
+@asgi_app.route('/admin/profiles')
+async def admin_profiles():
+    """Recent request profiles in this worker, newest first."""
+    if not sepsis_app.admin_authorized(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    return jsonify({'profiles': sepsis_app.profile_store.summaries(), 'pid': os.getpid()})
+
+
+@asgi_app.route('/admin/profiles/<int:profile_id>')
+async def admin_profile(profile_id):
+    """One profile as folded stacks (flamegraph.pl / speedscope input)."""
+    if not sepsis_app.admin_authorized(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    profile = sepsis_app.profile_store.get(profile_id)
+    if profile is None:
+        return jsonify({'error': f"profile {profile_id} not found"}), 404
+    return Response(request_profiler.folded(profile), content_type='text/plain; charset=utf-8')
+
+
+@asgi_app.route('/admin/reload', methods=['POST'])
+async def admin_reload():
+    """Reload changed artifacts in the background; the swap happens after the canary passes."""
+    if not sepsis_app.admin_authorized(request.headers):
+        return jsonify({'error': 'forbidden'}), 403
+    sepsis_app.registry.reload_async()
+    return jsonify(dict(sepsis_app.registry.status(), reload='started')), 202
+
+
+# Hooks are coroutines so the timer is set in the request's own context
+# (Quart runs sync hooks on a thread with a copied context). The profiler
+# samples the event loop thread, see request_profiler.
+@asgi_app.before_request
+async def start_request_timer():
+    serving_metrics.start_request(request.endpoint, sepsis_app.registry.current().version)
+    if request.endpoint in sepsis_app.PROFILED_ENDPOINTS and request_profiler.should_profile(
+            request_profiler.PROFILE_HEADER in request.headers
+            and sepsis_app.admin_authorized(request.headers)):
+        g.profiler = request_profiler.SamplingProfiler().start()
+        g.profile_started = time.perf_counter()
+
+
+def stop_request_profile(status):
+    """app.stop_request_profile() against the Quart request."""
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return None
+    profiler.stop()
+    return sepsis_app.profile_store.add(request.endpoint, status, time.perf_counter() - g.profile_started,
+                                        profiler)
+
+
+@asgi_app.after_request
+async def record_request_metrics(response):
+    serving_metrics.finish_request(response.status_code)
+    profile = stop_request_profile(response.status_code)
+    if profile is not None:
+        response.headers['X-Sepsis-Profile-Id'] = str(profile['id'])
+    return response
+
+
+@asgi_app.teardown_request
+async def finish_failed_request(error):
+    # As app.finish_failed_request(): no-op when after_request has run
+    stop_request_profile(500)
+    serving_metrics.finish_request(500)
+
+
+@asgi_app.after_serving
+async def shutdown_executors():
+    PHASE3_EXECUTOR.shutdown(wait=False)
+    EXPLAIN_EXECUTOR.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    asgi_app.run(debug=True)
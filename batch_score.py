@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Offline bulk scoring of patient-hour files.
+
+    python batch_score.py cohort.csv scores.csv
+    python batch_score.py cohort.parquet scores.parquet --lstm --workers 8
+
+The input has one row per patient-hour in the PhysioNet layout (FEATURE_NAMES
+columns, optionally a patient id column), grouped by patient and in time
+order within each patient. It is read in chunks and every chunk is split into
+batches that a process pool scores with the same functions as the server:
+
+- Phase 1 MLP current risk (missing values imputed as in score_phase1)
+- Rule checks (assess_phase1: status, abnormal count, instability score) and
+  the SIRS/organ dysfunction rule score (ensemble.rule_risk_scores)
+- Phase 3 6-hour forecast with --lstm, from the window of the patient's last
+  12 hours ending at each row (padded with the oldest hour, carried-forward
+  values for gaps, imputed as in forecast_phase3 where nothing was measured yet);
+  multi-horizon models add forecast_h1 ... forecast_h6, the risk at each hour ahead
+- Ensemble risk of the available components (ensemble.combine)
+
+Results are written as each batch finishes, in input order. Memory is bounded
+by --chunk-size plus the batches in flight, whatever the size of the input.
+Parquet input/output needs pyarrow.
+"""
+
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Workers fork from this process, so keep TensorFlow out of it; the sklearn
+# model loaded by the app import is shared with the workers copy-on-write
+os.environ['SEPSIS_DEFER_PHASE3'] = '1'
+import app as sepsis_app
+import ensemble
+import resource_config
+
+LSTM_CONTEXT = sepsis_app.PHASE3_SEQUENCE_LENGTH - 1
+RULE_INDEX = [sepsis_app.FEATURE_NAMES.index(f) for f in ensemble.RULE_FEATURES]
+
+
+# ============================================================================
+# Input / output
+# ============================================================================
+
+def read_chunks(path, chunk_size):
+    """Yield DataFrames of at most chunk_size rows from a CSV or Parquet file."""
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+class ResultWriter:
+    """Appends result DataFrames to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = 0
+        self._parquet_writer = None
+
+    def write(self, df):
+        if self.path.endswith('.parquet'):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self.rows == 0 else 'a', header=self.rows == 0, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+def feature_matrix(df, columns):
+    """df[columns] as a float32 array, NaN for absent columns or unparseable values."""
+    return df.reindex(columns=columns).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=sepsis_app.SERVING_DTYPE)
+
+
+# ============================================================================
+# Scoring (runs in the worker processes)
+# ============================================================================
+
+def init_worker(include_lstm):
+    if include_lstm:
+        sepsis_app.load_phase3_model()
+
+
+def lstm_windows(X, patient_ids):
+    """
+    (n, 12, n_features) windows ending at every row of X.
+    X and patient_ids cover the batch preceded by its carried-over context rows.
+    """
+    n = len(X)
+    new_patient = np.ones(n, dtype=bool)
+    new_patient[1:] = patient_ids[1:] != patient_ids[:-1]
+    segment_start = np.maximum.accumulate(np.where(new_patient, np.arange(n), 0))
+
+    steps = np.arange(-LSTM_CONTEXT, 1)
+    index = np.maximum(np.arange(n)[:, None] + steps[None, :], segment_start[:, None])
+    return X[index]
+
+
+def score_batch(task):
+    """
+    Score one batch.
+
+    Args:
+        task: dict with 'phase1' (n, 27) raw features, 'ids' (n,) patient ids,
+              and with --lstm 'phase3' (context + n, n_features) forward-filled
+              features, 'phase3_ids' and 'context' (number of context rows)
+
+    Returns:
+        DataFrame: one result row per input row
+    """
+    bundle = sepsis_app.registry.current()
+    X1 = task['phase1']
+    current_risks = sepsis_app.score_phase1(X1, bundle)
+
+    statuses, abnormal_counts, instability_scores = [], [], []
+    for row, risk in zip(X1, current_risks):
+        rules_input = {name: value for name, value in zip(sepsis_app.FEATURE_NAMES, row) if not np.isnan(value)}
+        assessment = sepsis_app.assess_phase1(rules_input, float(risk), bundle.optimal_threshold)
+        statuses.append(assessment['prediction_status'])
+        abnormal_counts.append(len(assessment['abnormal_features']))
+        instability_scores.append(assessment['vital_instability']['severity_score'])
+
+    result = pd.DataFrame({
+        'current_risk': current_risks,
+        'prediction_status': statuses,
+        'abnormal_count': abnormal_counts,
+        'instability_score': instability_scores,
+        'rules_risk': ensemble.rule_risk_scores(X1[:, RULE_INDEX]),
+    })
+
+    if 'phase3' in task:
+        forecast = np.full(len(X1), np.nan)
+        if bundle.phase3_available:
+            X3 = task['phase3']
+            if getattr(bundle.phase3_scaler, 'imputation_', None) is None:
+                # Older scaler artifacts have no imputation values; use the training mean
+                X3 = np.where(np.isnan(X3), bundle.phase3_scaler.mean_.astype(X3.dtype), X3)
+            windows = lstm_windows(X3, task['phase3_ids'])[task['context']:]
+            curves = sepsis_app.forecast_phase3_curve(windows, bundle)
+            forecast = sepsis_app.phase3_risk(curves)
+        result['forecast_6h'] = forecast
+        if bundle.phase3_available and curves.shape[1] > 1:
+            for hour in range(curves.shape[1]):
+                result[f'forecast_h{hour + 1}'] = curves[:, hour]
+
+    components = {'mlp': result['current_risk'].to_numpy(), 'rules': result['rules_risk'].to_numpy(),
+                  'lstm': result['forecast_6h'].to_numpy() if 'phase3' in task and bundle.phase3_available else None}
+    result['ensemble_risk'], _ = ensemble.combine(components)
+    return result
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def make_tasks(chunks, args):
+    """
+    Split input chunks into scoring tasks, carrying the last hours of the
+    patient at the end of each chunk into the next one for the LSTM windows.
+    Yields (passthrough columns DataFrame, task dict).
+    """
+    carry_X = np.empty((0, len(sepsis_app.PHASE3_FEATURES)), dtype=sepsis_app.SERVING_DTYPE)
+    carry_ids = np.empty(0, dtype=object)
+
+    for chunk in chunks:
+        ids = chunk[args.patient_col].to_numpy() if args.patient_col in chunk else np.zeros(len(chunk))
+        ids = ids.astype(object)
+        passthrough = chunk[[c for c in args.keep if c in chunk]].reset_index(drop=True)
+        X1 = feature_matrix(chunk, sepsis_app.FEATURE_NAMES)
+
+        if args.lstm:
+            X3 = feature_matrix(chunk, sepsis_app.PHASE3_FEATURES)
+            X3 = np.concatenate([carry_X, X3])
+            ids3 = np.concatenate([carry_ids, ids])
+            # Carry the last measurement forward within each patient
+            X3 = pd.DataFrame(X3).groupby(pd.Series(ids3).to_numpy(), sort=False).ffill().to_numpy()
+            context = len(carry_X)
+            last = ids3[-1]
+            tail = np.flatnonzero(ids3 == last)[-LSTM_CONTEXT:]
+            carry_X, carry_ids = X3[tail], ids3[tail]
+
+        for start in range(0, len(chunk), args.batch_size):
+            stop = min(start + args.batch_size, len(chunk))
+            task = {'phase1': X1[start:stop], 'ids': ids[start:stop]}
+            if args.lstm:
+                # Each batch brings its own context rows so workers stay independent
+                begin = max(context + start - LSTM_CONTEXT, 0)
+                task.update(phase3=X3[begin:context + stop], phase3_ids=ids3[begin:context + stop],
+                            context=context + start - begin)
+            yield passthrough.iloc[start:stop].reset_index(drop=True), task
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='Patient-hour CSV or Parquet file')
+    parser.add_argument('output', help='Result CSV or Parquet file')
+    parser.add_argument('--lstm', action='store_true', help='Also compute the Phase 3 6-hour forecast')
+    parser.add_argument('--patient-col', default='Patient_ID')
+    parser.add_argument('--keep', default='Patient_ID,ICULOS,SepsisLabel',
+                        help='Comma-separated input columns copied to the output')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows read per chunk')
+    parser.add_argument('--batch-size', type=int, default=8192, help='Rows per scoring task')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Scoring processes (0 = score in this process)')
+    args = parser.parse_args()
+    args.keep = [c for c in args.keep.split(',') if c]
+    # The workers inherit these; TensorFlow reads them when --lstm loads it after fork
+    resource_config.configure(max(args.workers, 1))
+
+    if sepsis_app.registry.current().model is None:
+        raise SystemExit("[ERROR] No ML model could be loaded")
+
+    print("=" * 70)
+    print("BATCH SCORING")
+    print("=" * 70)
+    print(f"  Input: {args.input}")
+    print(f"  Output: {args.output}")
+    print(f"  Model version: {sepsis_app.registry.current().version}")
+    print(f"  LSTM forecast: {'yes' if args.lstm else 'no'}")
+    print(f"  Workers: {args.workers}")
+    print(f"  Thread pools: {resource_config.summary()}")
+
+    writer = ResultWriter(args.output)
+    start_time = time.perf_counter()
+    tasks = make_tasks(read_chunks(args.input, args.chunk_size), args)
+
+    def write(passthrough, result):
+        writer.write(pd.concat([passthrough, result], axis=1))
+        print(f"\r  Scored {writer.rows:,} rows ({writer.rows / (time.perf_counter() - start_time):,.0f} rows/s)",
+              end='', flush=True)
+
+    try:
+        if args.workers == 0:
+            init_worker(args.lstm)
+            for passthrough, task in tasks:
+                write(passthrough, score_batch(task))
+        else:
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                     initargs=(args.lstm,)) as pool:
+                # Bounded number of batches in flight; results are written in input order
+                pending = deque()
+                for passthrough, task in tasks:
+                    pending.append((passthrough, pool.submit(score_batch, task)))
+                    if len(pending) >= 2 * args.workers:
+                        passthrough, future = pending.popleft()
+                        write(passthrough, future.result())
+                while pending:
+                    passthrough, future = pending.popleft()
+                    write(passthrough, future.result())
+    finally:
+        writer.close()
+
+    print(f"\n✓ {writer.rows:,} rows scored in {time.perf_counter() - start_time:.1f}s -> {args.output}")
+
+
+if __name__ == '__main__':
+    main()
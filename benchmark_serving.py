@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Load and latency benchmark for the serving endpoints.
+
+Sends synthetic patients to /predict, /predict_phase3 (app.py) and the rule
+engine's /predict (app_simple.py) at several concurrency levels and records
+throughput and p50/p95/p99 latency. Results are written as JSON so runs from
+different commits can be compared with --compare.
+
+    python benchmark_serving.py                                  # in-process Flask test clients
+    python benchmark_serving.py --url http://127.0.0.1:8000      # against a running server
+    python benchmark_serving.py --compare benchmark_results.json # diff with an earlier run
+
+The prediction cache is disabled unless --cache is given, so every request
+exercises the full pipeline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Approximate per-feature distributions of the PhysioNet 2019 training data:
+# (mean, std, min, max, fraction missing, mean shift for septic patients in std units)
+FEATURE_DISTRIBUTIONS = {
+    'HR': (84.6, 17.3, 30, 200, 0.10, 1.2),
+    'O2Sat': (97.2, 2.9, 60, 100, 0.13, -1.0),
+    'Temp': (37.0, 0.7, 34, 42, 0.66, 1.2),
+    'SBP': (123.8, 23.2, 50, 250, 0.15, -1.0),
+    'MAP': (82.4, 16.3, 30, 180, 0.12, -1.0),
+    'DBP': (63.8, 13.9, 20, 150, 0.31, -0.8),
+    'Resp': (18.7, 5.1, 5, 60, 0.15, 1.2),
+    'EtCO2': (33.0, 7.9, 10, 100, 0.96, -0.3),
+    'BaseExcess': (-0.7, 4.3, -30, 30, 0.95, -1.0),
+    'HCO3': (24.1, 4.4, 5, 50, 0.96, -0.8),
+    'FiO2': (0.55, 11.1, 0.21, 1.0, 0.92, 0.5),
+    'pH': (7.38, 0.07, 6.8, 7.8, 0.93, -0.8),
+    'PaCO2': (41.0, 9.3, 10, 100, 0.94, -0.3),
+    'SaO2': (92.7, 10.9, 30, 100, 0.97, -0.8),
+    'AST': (260.3, 855.7, 5, 5000, 0.98, 0.5),
+    'BUN': (23.9, 19.99, 2, 200, 0.93, 0.8),
+    'Alkalinephos': (102.5, 120.1, 10, 1500, 0.98, 0.3),
+    'Calcium': (7.6, 2.4, 4, 15, 0.94, -0.3),
+    'Chloride': (105.8, 5.9, 70, 140, 0.95, 0.2),
+    'Creatinine': (1.51, 1.81, 0.2, 15, 0.94, 1.0),
+    'Bilirubin_direct': (1.84, 3.69, 0.1, 30, 0.998, 0.8),
+    'Glucose': (136.9, 51.3, 30, 600, 0.83, 0.6),
+    'Lactate': (2.65, 2.53, 0.3, 20, 0.97, 1.5),
+    'Magnesium': (2.05, 0.40, 0.8, 5, 0.94, 0.0),
+    'Phosphate': (3.54, 1.42, 0.5, 12, 0.96, 0.3),
+    'Potassium': (4.14, 0.64, 2, 8, 0.91, 0.2),
+    'Bilirubin_total': (2.11, 4.31, 0.1, 40, 0.99, 0.8),
+    'Hgb': (10.43, 1.97, 4, 20, 0.93, -0.5),
+    'WBC': (11.45, 7.73, 0.5, 80, 0.94, 1.2),
+    'Fibrinogen': (287.4, 153.0, 50, 1000, 0.99, 0.5),
+    'Platelets': (196.0, 103.4, 10, 1000, 0.94, -0.8),
+    'Age': (62.0, 16.4, 18, 100, 0.0, 0.3),
+    'Gender': (0.56, 0.50, 0, 1, 0.0, 0.0),
+    'HospAdmTime': (-56.1, 162.3, -5000, 0, 0.0, -0.2),
+    'ICULOS': (26.99, 29.0, 1, 336, 0.0, 0.8),
+}
+
+CONCURRENCY_LEVELS = [1, 4, 16]
+SEPTIC_FRACTION = 0.3
+
+
+def synthetic_patient(rng, features, septic=None):
+    """
+    One synthetic form submission: str values for the non-missing features.
+
+    Args:
+        rng: numpy Generator
+        features: Feature names to draw (e.g. app.FEATURE_NAMES)
+        septic: Force a septic/non-septic draw (random with SEPTIC_FRACTION if None)
+    """
+    if septic is None:
+        septic = rng.random() < SEPTIC_FRACTION
+    patient = {}
+    for name in features:
+        mean, std, low, high, missing, shift = FEATURE_DISTRIBUTIONS[name]
+        if rng.random() < missing:
+            continue
+        value = rng.normal(mean + (shift * std if septic else 0.0), std)
+        if name == 'Gender':
+            value = round(min(max(value, 0), 1))
+        patient[name] = f"{min(max(value, low), high):.2f}"
+    return patient
+
+
+def synthetic_sequence(rng, features, n_steps):
+    """
+    One synthetic `<feature>_t<step>` history (t0 = oldest): a patient baseline
+    followed by a random walk, drifting towards sepsis for septic patients.
+    """
+    septic = rng.random() < SEPTIC_FRACTION
+    baseline = synthetic_patient(rng, features, septic=False)
+    form = {}
+    for name, raw in baseline.items():
+        mean, std, low, high, _, shift = FEATURE_DISTRIBUTIONS[name]
+        drift = shift * std / n_steps if septic else 0.0
+        steps = np.cumsum(rng.normal(drift, std * 0.05, n_steps))
+        for t in range(n_steps):
+            form[f"{name}_t{t}"] = f"{min(max(float(raw) + steps[t], low), high):.2f}"
+    return form
+
+
+def synthetic_payloads(kind, n, seed=0):
+    """Deterministic list of n form payloads for an endpoint kind."""
+    import app as sepsis_app
+    rng = np.random.default_rng(seed)
+    if kind == 'phase3':
+        return [synthetic_sequence(rng, sepsis_app.PHASE3_FEATURES, sepsis_app.PHASE3_SEQUENCE_LENGTH)
+                for _ in range(n)]
+    return [synthetic_patient(rng, sepsis_app.FEATURE_NAMES) for _ in range(n)]
+
+
+# ============================================================================
+# Request senders
+# ============================================================================
+
+class TestClientSender:
+    """Posts to an in-process Flask app; one test client per thread."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self._local = threading.local()
+
+    def __call__(self, path, form):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.flask_app.test_client()
+        response = client.post(path, data=form)
+        return response.status_code
+
+
+class HTTPSender:
+    """Posts to a running server."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def __call__(self, path, form):
+        data = urllib.parse.urlencode(form).encode()
+        try:
+            with urllib.request.urlopen(self.base_url + path, data=data, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+
+def run_level(sender, path, payloads, concurrency):
+    """
+    Send every payload once with `concurrency` parallel clients.
+
+    Returns:
+        dict: request count, error count, throughput and latency percentiles (ms)
+    """
+    latencies = np.zeros(len(payloads))
+    statuses = np.zeros(len(payloads), dtype=int)
+
+    def send(i):
+        start = time.perf_counter()
+        try:
+            statuses[i] = sender(path, payloads[i])
+        except Exception:
+            statuses[i] = -1
+        latencies[i] = time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(len(payloads))))
+    wall = time.perf_counter() - wall_start
+
+    latencies_ms = latencies * 1000
+    return {
+        'requests': len(payloads),
+        'errors': int(np.sum(statuses != 200)),
+        'throughput_rps': len(payloads) / wall,
+        'mean_ms': float(np.mean(latencies_ms)),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'max_ms': float(np.max(latencies_ms)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Print the latency/throughput change of every endpoint and level vs a previous run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nComparison with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'endpoint':<16}{'conc':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'rps':>10}")
+    for endpoint, levels in results['endpoints'].items():
+        for level, stats in levels.items():
+            old = baseline.get('endpoints', {}).get(endpoint, {}).get(level)
+            if old is None:
+                continue
+            changes = [
+                f"{(stats[key] / old[key] - 1) * 100:+.1f}%" if old[key] else 'n/a'
+                for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+            ]
+            print(f"{endpoint:<16}{level:>6}" + ''.join(f"{c:>10}" for c in changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running app.py server (default: in-process test client)')
+    parser.add_argument('--simple-url', help='Base URL of a running app_simple.py server')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint and concurrency level')
+    parser.add_argument('--concurrency', default=','.join(map(str, CONCURRENCY_LEVELS)),
+                        help='Comma-separated concurrency levels')
+    parser.add_argument('--endpoints', default='predict,predict_phase3,rules')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', action='store_true', help='Keep the Phase 1 prediction cache enabled')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    args = parser.parse_args()
+
+    if not args.cache:
+        os.environ['SEPSIS_CACHE_SIZE'] = '0'
+    import app as sepsis_app
+    import app_simple
+
+    app_sender = HTTPSender(args.url) if args.url else TestClientSender(sepsis_app.app)
+    simple_sender = HTTPSender(args.simple_url) if args.simple_url else TestClientSender(app_simple.app)
+    targets = {
+        'predict': (app_sender, '/predict', 'phase1'),
+        'predict_phase3': (app_sender, '/predict_phase3', 'phase3'),
+        'rules': (simple_sender, '/predict', 'phase1'),
+    }
+
+    bundle = sepsis_app.registry.current()
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'target': args.url or 'test_client',
+        'model_version': None if args.url else bundle.version,
+        'phase3_available': None if args.url else bundle.phase3_available,
+        'cache': args.cache,
+        'requests_per_level': args.requests,
+        'endpoints': {},
+    }
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    for endpoint in args.endpoints.split(','):
+        sender, path, kind = targets[endpoint]
+        payloads = synthetic_payloads(kind, args.requests, args.seed)
+        run_level(sender, path, payloads[:args.warmup], 1)
+
+        results['endpoints'][endpoint] = {}
+        for concurrency in levels:
+            stats = run_level(sender, path, payloads, concurrency)
+            results['endpoints'][endpoint][str(concurrency)] = stats
+            print(f"{endpoint:<16} c={concurrency:<3} {stats['throughput_rps']:8.1f} req/s  "
+                  f"p50 {stats['p50_ms']:7.2f} ms  p95 {stats['p95_ms']:7.2f} ms  "
+                  f"p99 {stats['p99_ms']:7.2f} ms  errors {stats['errors']}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results saved to: {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
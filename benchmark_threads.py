@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Workers x threads benchmark: which split of the host's cores serves fastest.
+
+For every worker count W (1, 2, 4, ..., cores) and threads per worker T
+(1, cores // W, and cores, i.e. every worker sizing its pools for the whole
+host as it does without resource_config), W scoring processes are started
+with resource_config.configure(W, T) applied before numpy / TensorFlow load.
+All of them score batches of synthetic patients for --duration seconds at
+the same time, and the combined throughput and per-batch p50/p99 latency are
+reported. The best setting is printed as the environment to serve with.
+
+    python benchmark_threads.py                     # Phase 1 MLP, batches of 64
+    python benchmark_threads.py --lstm --batch 16   # Phase 3 LSTM forecast
+    python benchmark_threads.py --cores 4 --affinity
+
+Results are written as JSON (--output) like benchmark_serving.py.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import resource_config
+
+
+def candidate_settings(cores):
+    """(workers, threads_per_worker) pairs to measure for `cores` cores."""
+    worker_counts = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    return [(workers, threads) for workers in worker_counts
+            for threads in sorted({1, max(cores // workers, 1), cores})]
+
+
+# ============================================================================
+# Scoring process
+# ============================================================================
+
+def run_child(args):
+    """Score batches until the deadline and print the batch count and latencies as JSON."""
+    resource_config.configure(args.workers, threads_per_worker=args.threads, cores=args.cores)
+    resource_config.pin_worker(args.slot)
+    if not args.lstm:
+        os.environ['SEPSIS_DEFER_PHASE3'] = '1'
+    import numpy as np
+    import app as sepsis_app
+    from benchmark_serving import FEATURE_DISTRIBUTIONS
+
+    rng = np.random.default_rng(args.slot)
+    if args.lstm:
+        features = sepsis_app.PHASE3_FEATURES
+        shape = (args.batch, sepsis_app.PHASE3_SEQUENCE_LENGTH, len(features))
+        score = sepsis_app.forecast_phase3
+    else:
+        features = sepsis_app.FEATURE_NAMES
+        shape = (args.batch, len(features))
+        score = sepsis_app.score_phase1
+    mean = np.array([FEATURE_DISTRIBUTIONS[f][0] for f in features])
+    std = np.array([FEATURE_DISTRIBUTIONS[f][1] for f in features])
+    X = (mean + std * rng.standard_normal(shape)).astype(sepsis_app.SERVING_DTYPE)
+
+    for _ in range(3):
+        score(X)
+    time.sleep(max(args.start_at - time.time(), 0))
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        score(X)
+        latencies.append(time.perf_counter() - start)
+    print(json.dumps({'batches': len(latencies), 'latencies': latencies}))
+
+
+# ============================================================================
+# Benchmark driver
+# ============================================================================
+
+def measure(workers, threads, args):
+    """
+    Run `workers` scoring processes with `threads` threads each, concurrently.
+
+    Returns:
+        dict: throughput (rows/s) and per-batch latency percentiles (ms)
+    """
+    import numpy as np
+
+    # Children load the models before the common start time
+    start_at = time.time() + args.startup
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--workers', str(workers),
+               '--threads', str(threads), '--cores', str(args.cores), '--batch', str(args.batch),
+               '--duration', str(args.duration), '--start-at', str(start_at)] + (['--lstm'] if args.lstm else [])
+    env = dict(os.environ, SEPSIS_CPU_AFFINITY='1' if args.affinity else '0')
+    for var in resource_config.BLAS_ENV_VARS + resource_config.TF_ENV_VARS + ('SEPSIS_THREADS_PER_WORKER',):
+        env.pop(var, None)
+    children = [subprocess.Popen(command + ['--slot', str(slot)], env=env, stdout=subprocess.PIPE, text=True)
+                for slot in range(workers)]
+    results = []
+    for child in children:
+        out, _ = child.communicate()
+        if child.returncode != 0:
+            raise SystemExit(f"[ERROR] Scoring process failed ({workers} workers x {threads} threads)")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    latencies_ms = np.concatenate([r['latencies'] for r in results]) * 1000
+    return {
+        'workers': workers,
+        'threads_per_worker': threads,
+        'oversubscribed': workers * threads > args.cores,
+        'rows_per_second': sum(r['batches'] for r in results) * args.batch / args.duration,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', type=int, default=resource_config.available_cores(),
+                        help='Cores to share between the workers (default: all available)')
+    parser.add_argument('--lstm', action='store_true', help='Benchmark the Phase 3 LSTM forecast instead of the MLP')
+    parser.add_argument('--batch', type=int, default=64, help='Patients per scoring call')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of scoring per setting')
+    parser.add_argument('--startup', type=float, default=10.0, help='Seconds allowed for loading the models')
+    parser.add_argument('--affinity', action='store_true', help='Pin each worker to its own cores')
+    parser.add_argument('--output', default='benchmark_threads.json')
+    # Internal: one scoring process
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workers', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--threads', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--slot', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, default=0.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    from benchmark_serving import git_commit
+
+    print(f"{'workers':>8}{'threads':>9}{'rows/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    settings = []
+    for workers, threads in candidate_settings(args.cores):
+        result = measure(workers, threads, args)
+        settings.append(result)
+        print(f"{workers:>8}{threads:>9}{result['rows_per_second']:>12,.0f}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{'  (oversubscribed)' if result['oversubscribed'] else ''}")
+
+    best = max(settings, key=lambda r: r['rows_per_second'])
+    print(f"\nBest on {args.cores} cores: {best['workers']} workers x {best['threads_per_worker']} threads "
+          f"({best['rows_per_second']:,.0f} rows/s, p99 {best['p99_ms']:.2f} ms)")
+    print(f"  WEB_CONCURRENCY={best['workers']} SEPSIS_THREADS_PER_WORKER={best['threads_per_worker']}")
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'cores': args.cores,
+        'model': 'phase3_lstm' if args.lstm else 'phase1_mlp',
+        'batch': args.batch,
+        'duration': args.duration,
+        'affinity': args.affinity,
+        'settings': settings,
+        'best': best,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✓ Results saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Resumable training state for train_model_27features.py and
+train_model_phase3_lstm.py.
+
+    checkpoint = TrainingCheckpoint('checkpoints/phase1', config, resume=args.resume)
+    scaler = checkpoint.load('scaler')      # None unless resuming a run that saved one
+    ...
+    checkpoint.save('scaler', scaler)
+    checkpoint.remove()                     # once the final artifacts are written
+
+Every entry is a pickle written atomically (temporary file + os.replace), so
+a run killed while saving keeps the previous checkpoint. Entries are stored
+with the run's config (data fingerprint and hyperparameters); resuming with a
+different config raises ValueError instead of mixing two runs. Without
+resume, load() returns None and entries are overwritten.
+
+fit_mlp() trains an MLPClassifier one epoch at a time, saving the model
+(weights, Adam moments, random state), the early-stopping state and the
+numpy/Python RNG state every few epochs. The Keras models are checkpointed
+by sequence_training.EpochCheckpoint.
+"""
+
+import os
+import pickle
+import random
+import shutil
+import time
+
+import numpy as np
+
+CHECKPOINT_EVERY = 10  # Epochs between two checkpoints of the Phase 1 MLP
+
+
+def rng_state():
+    """State of Python's and numpy's global random generators."""
+    return {'python': random.getstate(), 'numpy': np.random.get_state()}
+
+
+def restore_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+
+
+class TrainingCheckpoint:
+    """Named, atomically written pickles in one directory, tied to a training config"""
+
+    def __init__(self, directory, config, resume=False):
+        """
+        Args:
+            directory: Checkpoint directory (created if missing)
+            config: Picklable description of the run (data hash, hyperparameters);
+                    resuming requires an equal config
+            resume: Load existing entries; otherwise start fresh and overwrite them
+        """
+        self.directory = directory
+        self.config = config
+        self.resume = resume
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name, suffix='.pkl'):
+        return os.path.join(self.directory, name + suffix)
+
+    def save(self, name, state):
+        path = self.path(name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'config': self.config, 'saved_at': time.time(), 'state': state}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, name):
+        """
+        State saved under `name` by an earlier run, or None (not resuming, or nothing saved).
+
+        Raises:
+            ValueError: The checkpoint belongs to a run with a different config
+        """
+        path = self.path(name)
+        if not self.resume or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+        if entry['config'] != self.config:
+            raise ValueError(f"{path} was saved by a run with different data or settings; "
+                             f"remove {self.directory} or run without --resume")
+        return entry['state']
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def fit_mlp(model, X, y, checkpoint=None, every=CHECKPOINT_EVERY, name='mlp'):
+    """
+    MLPClassifier.fit, one partial_fit() epoch at a time so training can be
+    checkpointed and resumed. Stopping follows sklearn's: training ends once
+    the score has not improved by tol for n_iter_no_change epochs, or after
+    model.max_iter epochs. With model.early_stopping the score is the accuracy
+    on validation_fraction of the rows (stratified, split with
+    model.random_state) and the best weights are kept; otherwise it is the
+    negated training loss.
+
+    Args:
+        model: Unfitted MLPClassifier with solver 'adam' or 'sgd'
+        X, y: Training rows and labels
+        checkpoint: TrainingCheckpoint (None = no checkpoints)
+        every: Epochs between two checkpoints
+        name: Checkpoint entry name
+
+    Returns:
+        MLPClassifier: the fitted model (the checkpointed object when resuming)
+
+    Raises:
+        ValueError: The checkpoint was saved for different hyperparameters
+    """
+    from sklearn.model_selection import train_test_split
+
+    early_stopping = model.early_stopping
+    if early_stopping:
+        X, X_val, y, y_val = train_test_split(X, y, random_state=model.random_state,
+                                              test_size=model.validation_fraction, stratify=y)
+    classes = np.unique(y)
+    params = model.get_params()
+
+    state = checkpoint.load(name) if checkpoint is not None else None
+    if state is None:
+        # partial_fit refuses early_stopping; it is done here instead
+        state = {'params': params, 'model': model.set_params(early_stopping=False), 'epoch': 0,
+                 'best_score': -np.inf, 'best_params': None, 'no_improvement': 0, 'validation_scores': [],
+                 'completed': False}
+    elif state['params'] != params:
+        raise ValueError(f"{checkpoint.path(name)} was saved for different MLP settings; "
+                         f"remove {checkpoint.directory} or run without --resume")
+    else:
+        restore_rng_state(state['rng'])
+        print(f"[INFO] Resuming MLP training after epoch {state['epoch']}"
+              f"{' (already completed)' if state['completed'] else ''}")
+    model = state['model']
+    # Progress is printed here; partial_fit would number every epoch as iteration 1
+    verbose = params['verbose']
+    model.verbose = False
+
+    while not state['completed']:
+        model.partial_fit(X, y, classes=classes)
+        state['epoch'] += 1
+        score = model.score(X_val, y_val) if early_stopping else -model.loss_
+        state['no_improvement'] = state['no_improvement'] + 1 if score < state['best_score'] + model.tol else 0
+        if score > state['best_score']:
+            state['best_score'] = score
+            if early_stopping:
+                state['best_params'] = ([W.copy() for W in model.coefs_], [b.copy() for b in model.intercepts_])
+        if early_stopping:
+            state['validation_scores'].append(score)
+        if verbose:
+            print(f"Iteration {state['epoch']}, loss = {model.loss_:.8f}"
+                  f"{f', validation score = {score:.6f}' if early_stopping else ''}")
+
+        if state['no_improvement'] > model.n_iter_no_change:
+            print(f"{'Validation score' if early_stopping else 'Training loss'} did not improve more than "
+                  f"tol={model.tol:f} for {model.n_iter_no_change} consecutive epochs. Stopping.")
+            state['completed'] = True
+        elif state['epoch'] >= model.max_iter:
+            state['completed'] = True
+        if checkpoint is not None and (state['completed'] or state['epoch'] % every == 0):
+            state['rng'] = rng_state()
+            checkpoint.save(name, state)
+
+    model.verbose = verbose
+    model.n_iter_ = state['epoch']
+    if early_stopping:
+        model.set_params(early_stopping=True)
+        model.validation_scores_ = state['validation_scores']
+        model.best_validation_score_ = state['best_score']
+        model.coefs_, model.intercepts_ = state['best_params']
+    return model
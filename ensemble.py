@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Ensemble of the three sepsis scorers.
+
+- mlp:   Phase 1 MLP current risk (app.score_phase1)
+- rules: SIRS + organ dysfunction rule score (app_simple.calculate_sepsis_risk),
+         vectorised here over a whole batch
+- lstm:  Phase 3 6-hour forecast (app.forecast_phase3)
+
+Every component is scored once per batch; the ensemble risk is their weighted
+average. Components that are unavailable (no LSTM loaded) are left out and the
+remaining weights renormalised. Weights come from, in order:
+
+    SEPSIS_ENSEMBLE_WEIGHTS="mlp=0.5,rules=0.2,lstm=0.3"
+    ensemble_weights.json (written by `python ensemble.py fit`)
+    DEFAULT_WEIGHTS
+
+Learning the weights from batch_score.py output (run with --lstm and the
+SepsisLabel column kept):
+
+    python batch_score.py cohort.csv scores.csv --lstm
+    python ensemble.py fit scores.csv
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+COMPONENTS = ('mlp', 'rules', 'lstm')
+DEFAULT_WEIGHTS = {'mlp': 0.5, 'rules': 0.2, 'lstm': 0.3}
+WEIGHTS_PATH = os.environ.get(
+    'SEPSIS_ENSEMBLE_WEIGHTS_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ensemble_weights.json')
+)
+
+# batch_score.py output column holding each component's score
+SCORE_COLUMNS = {'mlp': 'current_risk', 'rules': 'rules_risk', 'lstm': 'forecast_6h'}
+
+# Vitals and labs read by the rule scorer, in the column order of rule_risk_scores()
+RULE_FEATURES = ['Temp', 'HR', 'Resp', 'WBC', 'O2Sat', 'SBP', 'Lactate', 'Creatinine']
+
+
+# ============================================================================
+# Rule component
+# ============================================================================
+
+def rule_features(form_dicts):
+    """
+    (n, len(RULE_FEATURES)) array from form-style dicts; missing or
+    unparseable values are NaN, which no rule fires on.
+    """
+    X = np.full((len(form_dicts), len(RULE_FEATURES)), np.nan)
+    for i, form_data in enumerate(form_dicts):
+        for j, feature in enumerate(RULE_FEATURES):
+            try:
+                X[i, j] = float(form_data.get(feature, ''))
+            except (ValueError, TypeError):
+                pass
+    return X
+
+
+def rule_risk_scores(X):
+    """
+    Vectorised app_simple.calculate_sepsis_risk() risk score.
+
+    Args:
+        X: (n, len(RULE_FEATURES)) array, NaN where a value is missing
+
+    Returns:
+        np.ndarray: (n,) rule-based sepsis risks
+    """
+    temp, hr, resp, wbc, o2, sbp, lactate, creatinine = X.T
+
+    sirs = ((temp > 38.0) | (temp < 36.0)).astype(int) \
+        + ((hr > 90) | (hr < 60)) \
+        + (resp > 20) \
+        + ((wbc > 12) | (wbc < 4))
+
+    organ = ((temp > 40) | (temp < 34)).astype(int) \
+        + ((hr > 130) | (hr < 40)) \
+        + (resp > 30) \
+        + (o2 < 93) \
+        + (sbp < 90) \
+        + (lactate > 2.0) \
+        + (creatinine > 1.5)
+
+    abnormal = ((temp > 38.0) | (temp < 36.0)).astype(int) \
+        + ((hr > 100) | (hr < 50)) \
+        + (resp > 22) \
+        + ((wbc > 15) | (wbc < 3)) \
+        + (o2 < 93) \
+        + (sbp < 90) \
+        + (lactate > 2.0) \
+        + (creatinine > 1.5)
+
+    return np.select(
+        [organ >= 3, organ >= 2, (organ >= 1) & (sirs >= 2), organ >= 1,
+         (sirs >= 3) & (abnormal >= 4), sirs >= 3, (sirs == 2) & (abnormal >= 3), sirs >= 2],
+        [0.95, 0.85, 0.75, 0.65, 0.60, 0.50, 0.40, 0.25],
+        default=0.05
+    )
+
+
+# ============================================================================
+# Weights
+# ============================================================================
+
+def parse_weights(spec):
+    """'mlp=0.5,rules=0.2,lstm=0.3' -> dict; unknown components raise ValueError."""
+    weights = {}
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        name = name.strip()
+        if name not in COMPONENTS:
+            raise ValueError(f"Unknown ensemble component: {name!r}")
+        weights[name] = float(value)
+    return weights
+
+
+def load_weights():
+    """Configured weights (see module docstring), with missing components at 0."""
+    spec = os.environ.get('SEPSIS_ENSEMBLE_WEIGHTS')
+    if spec:
+        weights = parse_weights(spec)
+    elif os.path.exists(WEIGHTS_PATH):
+        with open(WEIGHTS_PATH) as f:
+            weights = json.load(f)['weights']
+    else:
+        weights = DEFAULT_WEIGHTS
+    return {name: float(weights.get(name, 0.0)) for name in COMPONENTS}
+
+
+def fit_weights(scores, labels):
+    """
+    Learn component weights by logistic regression on the component scores.
+    Negative coefficients are clipped to 0 and the rest normalised to sum to 1,
+    so the ensemble stays a weighted average of probabilities.
+
+    Args:
+        scores: dict of component name -> (n,) scores
+        labels: (n,) 0/1 outcomes
+
+    Returns:
+        dict: component name -> weight
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    names = [name for name in COMPONENTS if name in scores]
+    X = np.column_stack([scores[name] for name in names])
+    coef = LogisticRegression(class_weight='balanced', max_iter=1000).fit(X, labels).coef_[0]
+    coef = np.clip(coef, 0.0, None)
+    if coef.sum() == 0:
+        coef = np.ones(len(names))
+    weights = {name: 0.0 for name in COMPONENTS}
+    weights.update(zip(names, (coef / coef.sum()).tolist()))
+    return weights
+
+
+ENSEMBLE_WEIGHTS = load_weights()
+
+
+# ============================================================================
+# Combination
+# ============================================================================
+
+def combine(components, weights=None):
+    """
+    Weighted average of the available component scores.
+
+    Args:
+        components: dict of component name -> (n,) scores, or None when
+                    that component is unavailable
+        weights: component name -> weight (default ENSEMBLE_WEIGHTS)
+
+    Returns:
+        tuple: ((n,) ensemble risks, weights actually used, normalised over
+                the available components)
+    """
+    weights = weights or ENSEMBLE_WEIGHTS
+    available = [name for name in COMPONENTS if components.get(name) is not None and weights.get(name, 0) > 0]
+    if not available:
+        raise ValueError("No ensemble component with a positive weight is available")
+    total = sum(weights[name] for name in available)
+    used = {name: (weights[name] / total if name in available else 0.0) for name in COMPONENTS}
+    risk = sum(used[name] * np.asarray(components[name], dtype=np.float32) for name in available)
+    return np.clip(risk, 0.0, 1.0), used
+
+
+def breakdown(components, risks, used_weights):
+    """Per-patient JSON-serialisable results: ensemble risk, component scores and contributions."""
+    results = []
+    for i, risk in enumerate(risks):
+        scores = {name: (float(components[name][i]) if components.get(name) is not None else None)
+                  for name in COMPONENTS}
+        results.append({
+            'risk': float(risk),
+            'components': scores,
+            'contributions': {name: used_weights[name] * score for name, score in scores.items()
+                              if score is not None},
+        })
+    return results
+
+
+# ============================================================================
+# Weight fitting CLI
+# ============================================================================
+
+def main():
+    import pandas as pd
+    from sklearn.metrics import roc_auc_score
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    fit = subparsers.add_parser('fit', help='Learn weights from batch_score.py output')
+    fit.add_argument('scores', help='batch_score.py result file with SepsisLabel')
+    fit.add_argument('--label-col', default='SepsisLabel')
+    fit.add_argument('--output', default=WEIGHTS_PATH)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(args.scores) if args.scores.endswith('.parquet') else pd.read_csv(args.scores)
+    columns = {name: col for name, col in SCORE_COLUMNS.items() if col in df}
+    df = df.dropna(subset=list(columns.values()) + [args.label_col])
+    labels = df[args.label_col].to_numpy(dtype=int)
+    scores = {name: df[col].to_numpy(dtype=float) for name, col in columns.items()}
+
+    weights = fit_weights(scores, labels)
+    ensemble_risk, _ = combine(scores, weights)
+
+    print("=" * 70)
+    print("ENSEMBLE WEIGHTS")
+    print("=" * 70)
+    print(f"  Rows: {len(df):,} ({labels.mean():.2%} positive)")
+    for name in COMPONENTS:
+        auc = f"{roc_auc_score(labels, scores[name]):.4f}" if name in scores else "n/a"
+        print(f"  {name:<8} weight {weights[name]:.3f}   ROC-AUC {auc}")
+    print(f"  ensemble              ROC-AUC {roc_auc_score(labels, ensemble_risk):.4f}")
+
+    with open(args.output, 'w') as f:
+        json.dump({'weights': weights, 'rows': len(df), 'source': os.path.basename(args.scores)}, f, indent=2)
+    print(f"✓ Saved to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
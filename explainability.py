@@ -1,23 +1,26 @@
 """
 Model Explainability Module using SHAP and LIME
 Provides interpretability for sepsis prediction model
+
+shap, lime and matplotlib are imported when an explainer is created or a plot
+is drawn, not when this module is imported.
 """
 
 import numpy as np
 import pandas as pd
-import pickle
 import json
 import base64
 import io
 from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sns
-import shap
-import lime
-import lime.lime_tabular
-from sklearn.neural_network import MLPClassifier
+from model_artifact import load_model_file
+
+
+def pyplot():
+    """matplotlib.pyplot on the non-interactive Agg backend, imported on first use."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
 
 
 class ModelExplainer:
@@ -28,10 +31,10 @@ class ModelExplainer:
         Initialize the explainer with model and training data
         
         Args:
-            model_path: Path to the trained model pickle file
+            model_path: Path to the trained model (.safetensors artifact or pickle)
             data_path: Path to the training data CSV file
         """
-        self.model = pickle.load(open(model_path, 'rb'))
+        self.model = load_model_file(model_path)
         self.data = pd.read_csv(data_path)
         
         # Feature names - exactly 27 features
@@ -46,6 +49,9 @@ class ModelExplainer:
         # Prepare training data for explainers
         self.X_train = self.data[self.feature_names].values
         
+        import shap
+        import lime.lime_tabular
+
         # Initialize LIME explainer
         self.lime_explainer = lime.lime_tabular.LimeTabularExplainer(
             self.X_train,
@@ -162,6 +168,7 @@ class ModelExplainer:
             str: Base64 encoded image
         """
         try:
+            plt = pyplot()
             fig, ax = plt.subplots(figsize=(10, 6))
             fig.patch.set_facecolor('#0a0e27')
             ax.set_facecolor('#1a1f3a')
@@ -210,6 +217,7 @@ class ModelExplainer:
             str: Base64 encoded image
         """
         try:
+            plt = pyplot()
             fig, ax = plt.subplots(figsize=(10, 6))
             fig.patch.set_facecolor('#0a0e27')
             ax.set_facecolor('#1a1f3a')
@@ -0,0 +1,81 @@
+# coding: utf-8
+"""
+Gunicorn configuration for the sepsis prediction server.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+- The app is preloaded in the master so the sklearn model/scaler are loaded
+  once and shared copy-on-write across workers.
+- gc.freeze() moves everything allocated during preload into a permanent
+  generation, so the cyclic GC in workers does not touch (and copy) those pages.
+- The master never imports TensorFlow (SEPSIS_DEFER_PHASE3=1): the LSTM and
+  TensorFlow are loaded in each worker after fork, because TF's intra/inter-op
+  thread pools are not fork-safe and would deadlock in the children. With
+  SEPSIS_MODEL_PRECISION=int8 the LSTM runs in numpy and TensorFlow is never loaded.
+- One worker per available core; inference is CPU bound so more workers than
+  cores only adds contention.
+
+app_simple.py can be served with the same settings:
+
+    gunicorn -c gunicorn.conf.py app_simple:app
+
+Each worker also starts the artifact watcher (SEPSIS_RELOAD_INTERVAL) after
+fork, so a retrained model.pkl is picked up by every worker without a restart.
+
+Thread pools are sized for the number of workers before the app is imported
+(resource_config.configure): each worker gets cores // workers threads for
+BLAS and TensorFlow instead of one per core. With SEPSIS_CPU_AFFINITY=1 each
+worker is pinned to its own cores after fork.
+
+Environment overrides: SEPSIS_BIND, WEB_CONCURRENCY, SEPSIS_TIMEOUT,
+SEPSIS_THREADS_PER_WORKER, SEPSIS_TF_INTEROP_THREADS, SEPSIS_CPU_AFFINITY.
+"""
+
+import gc
+import os
+import sys
+
+import resource_config
+
+# Must be set before the app module is imported by preload
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+
+bind = os.environ.get('SEPSIS_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', resource_config.available_cores()))
+# Before preload imports numpy, and before the workers load TensorFlow; they inherit the settings
+resource_config.configure(workers)
+worker_class = 'sync'
+threads = 1
+preload_app = True
+timeout = int(os.environ.get('SEPSIS_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers occasionally to bound memory growth from COW page drift
+max_requests = 5000
+max_requests_jitter = 500
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """Runs in the master after the app has been preloaded, before any fork."""
+    gc.freeze()
+    server.log.info(f"Preloaded models frozen for copy-on-write sharing; starting {workers} workers")
+    server.log.info(f"Thread pools: {resource_config.summary()}")
+
+
+def pre_fork(server, worker):
+    """Runs in the master before each fork: give the new worker the lowest free CPU slot."""
+    taken = {getattr(w, 'cpu_slot', None) for w in server.WORKERS.values()}
+    worker.cpu_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after fork."""
+    cpus = resource_config.pin_worker(worker.cpu_slot)
+    if cpus is not None:
+        server.log.info(f"Worker {worker.pid} pinned to CPUs {cpus}")
+    # Only when serving app.py (app_simple.py has no models to load)
+    sepsis_app = sys.modules.get('app')
+    if sepsis_app is not None and hasattr(sepsis_app, 'init_worker'):
+        sepsis_app.init_worker()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per-patient recurrent state for the stateful Phase 3 LSTM.
+
+The stateful variant trained by train_model_phase3_lstm.py is causal: a
+stack of unidirectional LSTMs with a dense head applied at every step, so
+its forecast after an hour depends only on the hours up to it. It is
+exported as a sequence-model artifact (PHASE3_STATEFUL_ARTIFACT) and
+ArtifactSequenceModel.step() advances it by one hour from the previous
+(h, c) of each LSTM layer. A new observation therefore costs one cell step
+per layer, instead of re-running the bidirectional model and its attention
+over the whole 12-hour window.
+
+LSTMStateStore keeps that state per patient, along with the last measured
+values (gaps are carried forward, as in training). Like
+trend_features.TrendFeatureStore it evicts the least recently updated
+patients beyond maxsize and drops patients idle for longer than ttl. States
+belong to one model version; after a reload a patient starts again from
+the zero state.
+
+The model is trained on windows of max_hours (SEQUENCE_LENGTH) steps from the
+zero state, so a state is never advanced further than that. Each patient
+keeps two states started max_hours // 2 hours apart; every hour advances
+both, a state that has taken max_hours steps restarts from zero first, and
+the forecast comes from the one that has seen more hours. After the first
+max_hours hours every forecast therefore rests on between max_hours // 2 + 1
+and max_hours hours of context, as in training, for two cell steps per hour.
+
+The store-wide lock only covers finding, creating and evicting patients;
+the LSTM steps run under the patient's own lock, so updates for different
+patients run concurrently.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class PatientLSTMState:
+    """LSTM states of one patient for one model version"""
+
+    __slots__ = ('version', 'lanes', 'last', 'hours', 'updated_at', 'lock')
+
+    def __init__(self, version, state, n_features):
+        self.version = version
+        # [state, steps taken from the zero state]
+        self.lanes = [[state, 0]]
+        self.last = np.full(n_features, np.nan, dtype=np.float32)
+        self.hours = 0
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+
+    def advance(self, x, initial_state, advance, max_hours=None):
+        """Carry x's gaps forward and advance every lane by it. Returns the outputs of the longest lane."""
+        # Carry the last measurement forward; the scaler imputes never-measured values
+        self.last = np.where(np.isnan(x), self.last, x).astype(self.last.dtype, copy=False)
+        if max_hours is not None and self.hours == max_hours // 2 and len(self.lanes) == 1:
+            self.lanes.append([initial_state(), 0])
+        best_steps, best_outputs = 0, None
+        for lane in self.lanes:
+            if max_hours is not None and lane[1] >= max_hours:
+                lane[0], lane[1] = initial_state(), 0
+            outputs, lane[0] = advance(self.last, lane[0])
+            lane[1] += 1
+            if lane[1] > best_steps:
+                best_steps, best_outputs = lane[1], outputs
+        self.hours += 1
+        return best_outputs
+
+
+class LSTMStateStore:
+    """Thread-safe per-patient PatientLSTMState map with LRU eviction and a time-to-live"""
+
+    def __init__(self, maxsize=10000, ttl=86400.0, max_hours=None):
+        """
+        Args:
+            maxsize: Maximum number of patients kept
+            ttl: Seconds without an update after which a patient's state is dropped
+            max_hours: Most steps a state takes from the zero state (the training
+                       sequence length); None advances one state without limit
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_hours = max_hours
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.resets = 0
+
+    def update(self, patient_id, x, version, initial_state, advance):
+        """
+        Advance a patient's state by one hour of measurements.
+
+        Args:
+            patient_id: Any hashable patient identifier
+            x: (n_features,) raw measurements, NaN where not measured
+            version: Model version the state belongs to
+            initial_state: Callable() -> zero state, for new patients
+            advance: Callable((n_features,) carried-forward measurements, state)
+                     -> (outputs, new state)
+
+        Returns:
+            tuple: (outputs of advance(), hours observed with this model version)
+        """
+        now = time.monotonic()
+        with self._lock:
+            patient = self._states.get(patient_id)
+            if patient is not None and patient.updated_at + self.ttl < now:
+                patient = None
+                self.expirations += 1
+            elif patient is not None and patient.version != version:
+                patient = None
+                self.resets += 1
+            if patient is None:
+                patient = self._states[patient_id] = PatientLSTMState(version, initial_state(), len(x))
+            self._states.move_to_end(patient_id)
+            patient.updated_at = now
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+                self.evictions += 1
+
+        with patient.lock:
+            outputs = patient.advance(x, initial_state, advance, self.max_hours)
+            hours = patient.hours
+        return outputs, hours
+
+    def discard(self, patient_id):
+        """Forget a patient (e.g. on discharge). Returns whether it was known."""
+        with self._lock:
+            return self._states.pop(patient_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'patients': len(self._states),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'max_hours': self.max_hours,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'version_resets': self.resets,
+            }
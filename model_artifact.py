@@ -0,0 +1,712 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Safe, memory-mapped model artifact format.
+
+Replaces pickle for the Phase 1 MLP, its scaler and calibration metadata, and
+for the Phase 3 scaler. The layout follows safetensors:
+
+    [8 bytes: little-endian header length N]
+    [N bytes: JSON header {name: {dtype, shape, data_offsets}, "__metadata__": {...}}]
+    [raw tensor bytes]
+
+Loading parses the JSON header and memory-maps the tensor bytes read-only, so
+it takes milliseconds, never executes code from the file, does not import
+sklearn, and the pages are shared by every worker process on the host.
+The metadata carries a schema version and a SHA-256 of the tensor bytes.
+
+Weights and scaler parameters are stored and served as float32
+(SERVING_DTYPE), the precision Keras already runs the LSTM in; older float64
+files are converted on load.
+
+Kernels can also be stored as int8 with one float32 scale per output unit
+(quantize_int8; calibrated by quantization.py). They stay int8 in memory and
+are expanded per matmul, so int8 artifacts take a quarter of the pages.
+The Phase 3 Keras model is exported as a layer graph (save_sequence_artifact)
+and run by ArtifactSequenceModel without TensorFlow. Causal graphs (the
+stateful variant: unidirectional LSTMs and dense layers) can also be
+advanced one timestep at a time from the previous LSTM states (step()).
+
+Export the current pickles with:
+
+    python model_artifact.py
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import struct
+import time
+import warnings
+
+import numpy as np
+
+ARTIFACT_SCHEMA_VERSION = 1
+PHASE1_ARTIFACT = 'model_artifact.safetensors'
+PHASE3_SCALER_ARTIFACT = 'scaler_phase3.safetensors'
+# int8-weight artifacts written by training_pipeline.py / train_model_phase3_lstm.py
+PHASE1_INT8_ARTIFACT = 'model_artifact_int8.safetensors'
+PHASE3_INT8_ARTIFACT = 'model_phase3_lstm_int8.safetensors'
+# Causal unidirectional LSTM served one hour at a time (train_model_phase3_lstm.py)
+PHASE3_STATEFUL_ARTIFACT = 'model_phase3_stateful.safetensors'
+
+# Precision of stored weights/scaler parameters and of the serving computation
+SERVING_DTYPE = np.float32
+
+_DTYPE_NAMES = {
+    np.dtype(np.float64): 'F64', np.dtype(np.float32): 'F32',
+    np.dtype(np.int64): 'I64', np.dtype(np.int32): 'I32', np.dtype(np.int8): 'I8',
+}
+_DTYPES = {name: dtype for dtype, name in _DTYPE_NAMES.items()}
+
+
+# ============================================================================
+# File format
+# ============================================================================
+
+def save_artifact(path, tensors, kind, config):
+    """
+    Write tensors and metadata to a single artifact file.
+
+    Args:
+        path: Output file path
+        tensors: dict of name -> numpy array
+        kind: Artifact type, e.g. 'mlp-classifier' or 'standard-scaler'
+        config: JSON-serialisable dict stored alongside the tensors
+    """
+    # Widest dtypes first keeps every tensor naturally aligned in the buffer
+    names = sorted(tensors, key=lambda n: (-np.asarray(tensors[n]).dtype.itemsize, n))
+    header = {}
+    chunks = []
+    offset = 0
+    for name in names:
+        array = np.ascontiguousarray(tensors[name])
+        if array.dtype not in _DTYPE_NAMES:
+            raise ValueError(f"Unsupported dtype {array.dtype} for tensor '{name}'")
+        raw = array.astype(array.dtype.newbyteorder('<'), copy=False).tobytes()
+        header[name] = {
+            'dtype': _DTYPE_NAMES[array.dtype],
+            'shape': list(array.shape),
+            'data_offsets': [offset, offset + len(raw)],
+        }
+        chunks.append(raw)
+        offset += len(raw)
+
+    data = b''.join(chunks)
+    header['__metadata__'] = {
+        'schema_version': str(ARTIFACT_SCHEMA_VERSION),
+        'kind': kind,
+        'sha256': hashlib.sha256(data).hexdigest(),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'config': json.dumps(config, default=_json_default),
+    }
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # Pad so the tensor buffer starts on an 8-byte boundary
+    header_bytes += b' ' * (-(8 + len(header_bytes)) % 8)
+
+    # Write-then-rename so a watching server never sees a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_artifact(path, verify=True):
+    """
+    Memory-map an artifact file.
+
+    Args:
+        path: Artifact file path
+        verify: Check the SHA-256 of the tensor bytes
+
+    Returns:
+        tuple: (dict of name -> read-only numpy array, metadata dict with 'config' decoded)
+    """
+    with open(path, 'rb') as f:
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len))
+
+    metadata = header.pop('__metadata__', {})
+    schema_version = int(metadata.get('schema_version', -1))
+    if schema_version != ARTIFACT_SCHEMA_VERSION:
+        raise ValueError(f"{path}: schema version {schema_version}, expected {ARTIFACT_SCHEMA_VERSION}")
+
+    data_start = 8 + header_len
+    if os.path.getsize(path) == data_start:
+        data = np.zeros(0, dtype=np.uint8)
+    else:
+        data = np.memmap(path, dtype=np.uint8, mode='r', offset=data_start)
+
+    if verify and hashlib.sha256(data).hexdigest() != metadata.get('sha256'):
+        raise ValueError(f"{path}: checksum mismatch, file is corrupt or was modified")
+
+    tensors = {}
+    for name, info in header.items():
+        begin, end = info['data_offsets']
+        dtype = np.dtype(_DTYPES[info['dtype']]).newbyteorder('<')
+        tensors[name] = data[begin:end].view(dtype).reshape(info['shape'])
+
+    metadata = dict(metadata, config=json.loads(metadata.get('config', '{}')))
+    return tensors, metadata
+
+
+def _serving(array):
+    """A float tensor in SERVING_DTYPE; a no-copy view when it is stored that way."""
+    return array.astype(SERVING_DTYPE, copy=False)
+
+
+def quantize_int8(W, clip=None):
+    """
+    Symmetric int8 quantization of a 2-D kernel, one scale per output unit (column).
+
+    Args:
+        W: (n_in, n_out) float kernel
+        clip: (n_out,) magnitudes mapped to +-127; larger weights saturate
+              (default: each column's max |W|)
+
+    Returns:
+        tuple: ((n_in, n_out) int8 weights, (n_out,) float32 scales), W ~ q * scales
+    """
+    W = np.asarray(W, dtype=np.float64)
+    if clip is None:
+        clip = np.abs(W).max(axis=0)
+    scale = np.where(clip > 0, clip / 127.0, 1.0)
+    q = np.clip(np.rint(W / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(SERVING_DTYPE)
+
+
+def _scaled_matmul(x, W, scale=None):
+    """x @ W for float or int8 kernels; int8 results are rescaled per output unit."""
+    y = x @ W
+    if scale is not None:
+        y *= scale
+    return y
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialise {type(value).__name__} to artifact metadata")
+
+
+# ============================================================================
+# Serving-side model objects (sklearn-compatible subset)
+# ============================================================================
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+def _logistic(x):
+    # exp overflow for large negative inputs correctly saturates to 0
+    with np.errstate(over='ignore'):
+        return 1.0 / (1.0 + np.exp(-x))
+
+
+_ACTIVATIONS = {
+    'relu': _relu,
+    'tanh': np.tanh,
+    'logistic': _logistic,
+    'identity': lambda x: x,
+}
+# Keras names of the same functions
+_ACTIVATIONS.update(sigmoid=_logistic, linear=_ACTIVATIONS['identity'])
+
+
+class ArtifactScaler:
+    """StandardScaler.transform() from stored mean/scale arrays"""
+
+    def __init__(self, mean, scale, imputation=None):
+        self.mean_ = mean
+        self.scale_ = scale
+        # Per-feature values for missing inputs, in scaled space (see imputation_values)
+        self.imputation_ = imputation
+        self.n_features_in_ = len(mean)
+
+    def transform(self, X):
+        return (np.asarray(X) - self.mean_) / self.scale_
+
+
+def imputation_values(X_train, scaler):
+    """
+    Training medians of each feature (NaN = missing), in the scaler's output
+    space. Features never observed get the training mean, i.e. 0.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        medians = np.nanmedian(np.asarray(X_train, dtype=float), axis=0)
+    return np.nan_to_num((medians - scaler.mean_) / scaler.scale_, nan=0.0)
+
+
+def scale_with_imputation(scaler, X):
+    """
+    scaler.transform(X) with missing (NaN) entries replaced by the scaler's
+    imputation values in one pass. Scalers without them (older artifacts,
+    pickles) keep the old behaviour of missing values being 0 before scaling.
+    """
+    mask = np.isnan(X)
+    imputation = getattr(scaler, 'imputation_', None)
+    if imputation is None:
+        return scaler.transform(np.where(mask, 0.0, X))
+    return np.where(mask, imputation, scaler.transform(X))
+
+
+class ArtifactMLP:
+    """MLPClassifier.predict_proba() as a plain numpy forward pass"""
+
+    def __init__(self, coefs, intercepts, activation, out_activation, classes, coef_scales=None):
+        self.coefs_ = coefs
+        self.intercepts_ = intercepts
+        # Per-layer output-unit scales of int8 coefs (None for float layers)
+        self.coef_scales_ = coef_scales or [None] * len(coefs)
+        self.activation = activation
+        self.out_activation_ = out_activation
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = coefs[0].shape[0]
+
+    def predict_proba(self, X):
+        hidden = _ACTIVATIONS[self.activation]
+        a = np.asarray(X)
+        last = len(self.coefs_) - 1
+        for i, (W, b, scale) in enumerate(zip(self.coefs_, self.intercepts_, self.coef_scales_)):
+            a = a @ W + b if scale is None else _scaled_matmul(a, W, scale) + b
+            if i < last:
+                a = hidden(a)
+
+        if self.out_activation_ == 'softmax':
+            a = np.exp(a - a.max(axis=1, keepdims=True))
+            return a / a.sum(axis=1, keepdims=True)
+        p = _logistic(a).ravel()
+        return np.column_stack([1 - p, p])
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+# ============================================================================
+# Phase 1 / Phase 3 artifacts
+# ============================================================================
+
+def save_phase1_artifact(path, model, scaler=None, scaling_params=None, threshold_info=None, feature_names=None,
+                         calibration=None, imputation=None, dtype=SERVING_DTYPE, int8_clips=None):
+    """
+    Export a fitted MLPClassifier (+ StandardScaler and calibration metadata).
+    Other estimator types (e.g. CalibratedClassifierCV) cannot be exported and raise ValueError.
+    calibration is an optional (raw, calibrated) lookup table applied with np.interp.
+    imputation (scaled-space values for missing features) defaults to the scaler's imputation_.
+    Weights and scaler parameters are stored as dtype; with int8_clips (one
+    clip array or None per layer, see quantize_int8) the coefs are stored as int8.
+    Coefs of an int8 ArtifactMLP are stored as they are.
+    """
+    if not hasattr(model, 'coefs_'):
+        raise ValueError(f"Only MLPClassifier models can be exported, got {type(model).__name__}")
+
+    coef_scales = getattr(model, 'coef_scales_', None) or [None] * len(model.coefs_)
+    tensors = {}
+    for i, (W, b) in enumerate(zip(model.coefs_, model.intercepts_)):
+        if coef_scales[i] is not None:
+            tensors[f'coef_{i}'], tensors[f'coef_{i}_scale'] = np.asarray(W), np.asarray(coef_scales[i])
+        elif int8_clips is not None:
+            tensors[f'coef_{i}'], tensors[f'coef_{i}_scale'] = quantize_int8(W, int8_clips[i])
+        else:
+            tensors[f'coef_{i}'] = np.asarray(W, dtype=dtype)
+        tensors[f'intercept_{i}'] = np.asarray(b, dtype=dtype)
+    if scaler is not None:
+        tensors['scaler_mean'] = np.asarray(scaler.mean_ if scaler.mean_ is not None else np.zeros(model.n_features_in_),
+                                            dtype=dtype)
+        tensors['scaler_scale'] = np.asarray(scaler.scale_ if scaler.scale_ is not None else np.ones(model.n_features_in_),
+                                             dtype=dtype)
+    if imputation is None:
+        imputation = getattr(scaler, 'imputation_', None)
+    if scaler is not None and imputation is not None:
+        tensors['imputation'] = np.asarray(imputation, dtype=dtype)
+    if calibration is not None:
+        tensors['calibration_x'] = np.asarray(calibration[0], dtype=np.float64)
+        tensors['calibration_y'] = np.asarray(calibration[1], dtype=np.float64)
+
+    config = {
+        'n_layers': len(model.coefs_),
+        'activation': model.activation,
+        'out_activation': model.out_activation_,
+        'classes': model.classes_,
+        'feature_names': feature_names,
+        'scaling_params': scaling_params,
+        'threshold_info': threshold_info,
+    }
+    save_artifact(path, tensors, 'mlp-classifier', config)
+
+
+def load_phase1_artifact(path, verify=True):
+    """
+    Returns:
+        dict: model, scaler, scaling_params, threshold_info, feature_names,
+              calibration ((x, y) table or None)
+    """
+    tensors, metadata = load_artifact(path, verify)
+    if metadata.get('kind') != 'mlp-classifier':
+        raise ValueError(f"{path}: expected an mlp-classifier artifact, got {metadata.get('kind')}")
+    config = metadata['config']
+
+    n_layers = config['n_layers']
+    if 'coef_0_scale' in tensors:
+        # int8 kernels stay int8 (and memory-mapped); ArtifactMLP rescales per matmul
+        coefs = [tensors[f'coef_{i}'] for i in range(n_layers)]
+        coef_scales = [_serving(tensors[f'coef_{i}_scale']) for i in range(n_layers)]
+    else:
+        coefs = [_serving(tensors[f'coef_{i}']) for i in range(n_layers)]
+        coef_scales = None
+    model = ArtifactMLP(
+        coefs, [_serving(tensors[f'intercept_{i}']) for i in range(n_layers)],
+        config['activation'], config['out_activation'], config['classes'], coef_scales
+    )
+    scaler = None
+    if 'scaler_mean' in tensors:
+        imputation = tensors.get('imputation')
+        scaler = ArtifactScaler(_serving(tensors['scaler_mean']), _serving(tensors['scaler_scale']),
+                                _serving(imputation) if imputation is not None else None)
+
+    return {
+        'model': model,
+        'scaler': scaler,
+        'scaling_params': config.get('scaling_params'),
+        'threshold_info': config.get('threshold_info'),
+        'feature_names': config.get('feature_names'),
+        'calibration': (tensors['calibration_x'], tensors['calibration_y']) if 'calibration_x' in tensors else None,
+    }
+
+
+def save_scaler_artifact(path, scaler, feature_names=None, imputation=None, dtype=SERVING_DTYPE):
+    """Export a fitted StandardScaler, with optional imputation values (see imputation_values)."""
+    tensors = {'mean': np.asarray(scaler.mean_, dtype=dtype), 'scale': np.asarray(scaler.scale_, dtype=dtype)}
+    if imputation is not None:
+        tensors['imputation'] = np.asarray(imputation, dtype=dtype)
+    save_artifact(path, tensors, 'standard-scaler', {'feature_names': feature_names})
+
+
+def load_scaler(path, verify=True):
+    """Load a scaler from an artifact file, or from a pickle for older .pkl files."""
+    if path.endswith('.safetensors'):
+        tensors, metadata = load_artifact(path, verify)
+        if metadata.get('kind') != 'standard-scaler':
+            raise ValueError(f"{path}: expected a standard-scaler artifact, got {metadata.get('kind')}")
+        imputation = tensors.get('imputation')
+        return ArtifactScaler(_serving(tensors['mean']), _serving(tensors['scale']),
+                              _serving(imputation) if imputation is not None else None)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_model_file(path, verify=True):
+    """Load a Phase 1 model from an artifact file, or from a pickle for older .pkl files."""
+    if path.endswith('.safetensors'):
+        return load_phase1_artifact(path, verify)['model']
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# ============================================================================
+# Phase 3 sequence model (Keras layer graph)
+# ============================================================================
+
+# Keras layer class -> op run by ArtifactSequenceModel
+_SEQUENCE_OPS = {
+    'InputLayer': 'input', 'LSTM': 'lstm', 'Bidirectional': 'bidirectional',
+    'MultiHeadAttention': 'attention', 'Add': 'add', 'LayerNormalization': 'layer_norm',
+    'Dense': 'dense', 'Dropout': 'identity',
+}
+
+
+def _lstm_node(layer):
+    config = layer.get_config()
+    return {key: config[key] for key in ('units', 'activation', 'recurrent_activation',
+                                         'return_sequences', 'go_backwards')}
+
+
+def _lstm_tensors(layer, prefix):
+    kernel, recurrent_kernel, bias = layer.get_weights()
+    return {f'{prefix}/kernel': kernel, f'{prefix}/recurrent_kernel': recurrent_kernel, f'{prefix}/bias': bias}
+
+
+def keras_sequence_graph(model):
+    """
+    Inference graph and weights of a Keras model made of _SEQUENCE_OPS layers
+    (train_model_phase3_lstm.build_lstm_model, or a Sequential stack).
+    Dropout is left out; attention kernels are flattened to 2-D.
+
+    Returns:
+        tuple: (node dicts in execution order, the model output last;
+                dict of tensor name -> float32 array)
+    """
+    if hasattr(model, 'operations'):
+        layers = model.operations
+        inputs = [[t._keras_history.operation.name for t in layer._inbound_nodes[0].input_tensors]
+                  for layer in layers]
+    else:
+        # Sequential: a chain from an implicit input
+        layers = [None] + list(model.layers)
+        inputs = [[]] + [[layers[i].name if i else 'input'] for i in range(len(layers) - 1)]
+
+    nodes, tensors = [], {}
+    for layer, layer_inputs in zip(layers, inputs):
+        if layer is None:
+            nodes.append({'name': 'input', 'op': 'input', 'inputs': []})
+            continue
+        kind = type(layer).__name__
+        if kind not in _SEQUENCE_OPS:
+            raise ValueError(f"Layer {layer.name} ({kind}) cannot be exported")
+        name = layer.name
+        node = {'name': name, 'op': _SEQUENCE_OPS[kind], 'inputs': layer_inputs}
+
+        if kind == 'LSTM':
+            node.update(_lstm_node(layer))
+            tensors.update(_lstm_tensors(layer, name))
+        elif kind == 'Bidirectional':
+            if layer.get_config()['merge_mode'] != 'concat':
+                raise ValueError(f"Layer {name}: only merge_mode='concat' can be exported")
+            node['forward'] = _lstm_node(layer.forward_layer)
+            node['backward'] = _lstm_node(layer.backward_layer)
+            tensors.update(_lstm_tensors(layer.forward_layer, f'{name}/forward'))
+            tensors.update(_lstm_tensors(layer.backward_layer, f'{name}/backward'))
+        elif kind == 'MultiHeadAttention':
+            config = layer.get_config()
+            node.update(heads=config['num_heads'], key_dim=config['key_dim'])
+            weights = layer.get_weights()
+            for i, part in enumerate(('query', 'key', 'value')):
+                kernel, bias = weights[2 * i], weights[2 * i + 1]
+                tensors[f'{name}/{part}/kernel'] = kernel.reshape(kernel.shape[0], -1)
+                tensors[f'{name}/{part}/bias'] = bias.reshape(-1)
+            tensors[f'{name}/output/kernel'] = weights[6].reshape(-1, weights[6].shape[-1])
+            tensors[f'{name}/output/bias'] = weights[7]
+        elif kind == 'LayerNormalization':
+            node['epsilon'] = layer.get_config()['epsilon']
+            tensors[f'{name}/gamma'], tensors[f'{name}/beta'] = layer.get_weights()
+        elif kind == 'Dense':
+            node['activation'] = layer.get_config()['activation']
+            tensors[f'{name}/kernel'], tensors[f'{name}/bias'] = layer.get_weights()
+        nodes.append(node)
+
+    return nodes, {name: np.asarray(value, dtype=SERVING_DTYPE) for name, value in tensors.items()}
+
+
+def sequence_kernels(tensors):
+    """Names of the 2-D kernels of a keras_sequence_graph() export (the int8-quantizable tensors)."""
+    return [name for name in tensors if name.endswith('kernel')]
+
+
+class ArtifactSequenceModel:
+    """Keras model.predict() for a keras_sequence_graph() export, as a numpy forward pass"""
+
+    def __init__(self, nodes, tensors, batch_size=1024, version=None):
+        """
+        Args:
+            nodes: Graph nodes in execution order, the output last
+            tensors: dict of tensor name -> array; int8 kernels come with a
+                     '<name>_scale' tensor of output-unit scales
+            batch_size: Sequences per forward pass in predict()
+            version: Identifies the weights (the artifact checksum when loaded from a file)
+        """
+        self.nodes = nodes
+        self.tensors = tensors
+        self.batch_size = batch_size
+        self.version = version
+        # Every output step depends only on the inputs up to it, so step() applies
+        self.causal = all(node['op'] in ('input', 'lstm', 'dense', 'identity') and not node.get('go_backwards')
+                          for node in nodes)
+
+    def _matmul(self, x, name):
+        return _scaled_matmul(x, self.tensors[name], self.tensors.get(f'{name}_scale'))
+
+    def _dense(self, x, name, node):
+        return _ACTIVATIONS[node['activation']](self._matmul(x, f'{name}/kernel') + self.tensors[f'{name}/bias'])
+
+    def _lstm_cell(self, x_gates, h, c, prefix, node):
+        """One Keras LSTM step (gates i, f, c, o) from x_t @ kernel + bias; returns the new (h, c)."""
+        units = node['units']
+        activation = _ACTIVATIONS[node['activation']]
+        recurrent_activation = _ACTIVATIONS[node['recurrent_activation']]
+        z = x_gates + self._matmul(h, f'{prefix}/recurrent_kernel')
+        i = recurrent_activation(z[:, :units])
+        f = recurrent_activation(z[:, units:2 * units])
+        o = recurrent_activation(z[:, 3 * units:])
+        c = f * c + i * activation(z[:, 2 * units:3 * units])
+        # Copy: _relu works in place and c is carried to the next step
+        return o * activation(c.copy()), c
+
+    def _lstm(self, x, prefix, node):
+        """Keras LSTM over a whole sequence; outputs are in processing order."""
+        if node['go_backwards']:
+            x = x[:, ::-1]
+        x_gates = self._matmul(x, f'{prefix}/kernel') + self.tensors[f'{prefix}/bias']
+
+        h = np.zeros((len(x), node['units']), dtype=x_gates.dtype)
+        c = np.zeros_like(h)
+        outputs = []
+        for t in range(x.shape[1]):
+            h, c = self._lstm_cell(x_gates[:, t], h, c, prefix, node)
+            outputs.append(h)
+        return np.stack(outputs, axis=1) if node['return_sequences'] else h
+
+    def _attention(self, query, value, name, node):
+        """Keras MultiHeadAttention self/cross attention with key = value and no mask."""
+        n, t_q, _ = query.shape
+        heads, key_dim = node['heads'], node['key_dim']
+
+        def project(x, part):
+            projected = self._matmul(x, f'{name}/{part}/kernel') + self.tensors[f'{name}/{part}/bias']
+            return projected.reshape(n, x.shape[1], heads, -1)
+
+        q = project(query, 'query') / np.sqrt(key_dim).astype(query.dtype)
+        k, v = project(value, 'key'), project(value, 'value')
+        scores = np.einsum('nthk,nshk->nhts', q, k)
+        scores = np.exp(scores - scores.max(axis=-1, keepdims=True))
+        scores /= scores.sum(axis=-1, keepdims=True)
+        attended = np.einsum('nhts,nshv->nthv', scores, v).reshape(n, t_q, -1)
+        return self._matmul(attended, f'{name}/output/kernel') + self.tensors[f'{name}/output/bias']
+
+    def _forward(self, X):
+        values = {}
+        for node in self.nodes:
+            name, op = node['name'], node['op']
+            args = [values[i] for i in node['inputs']]
+            if op == 'input':
+                out = X
+            elif op == 'lstm':
+                out = self._lstm(args[0], name, node)
+            elif op == 'bidirectional':
+                forward = self._lstm(args[0], f'{name}/forward', node['forward'])
+                backward = self._lstm(args[0], f'{name}/backward', node['backward'])
+                if node['backward']['return_sequences']:
+                    backward = backward[:, ::-1]
+                out = np.concatenate([forward, backward], axis=-1)
+            elif op == 'attention':
+                out = self._attention(args[0], args[-1], name, node)
+            elif op == 'add':
+                out = sum(args[1:], args[0])
+            elif op == 'layer_norm':
+                x = args[0]
+                mean = x.mean(axis=-1, keepdims=True)
+                var = x.var(axis=-1, keepdims=True)
+                out = (x - mean) / np.sqrt(var + node['epsilon']) * self.tensors[f'{name}/gamma'] \
+                    + self.tensors[f'{name}/beta']
+            elif op == 'dense':
+                out = self._dense(args[0], name, node)
+            else:
+                out = args[0]
+            values[name] = out
+        return out
+
+    def initial_state(self, n=1):
+        """Zero (h, c) of every LSTM layer for n sequences: the state before their first step()."""
+        return {node['name']: (np.zeros((n, node['units']), dtype=SERVING_DTYPE),) * 2
+                for node in self.nodes if node['op'] == 'lstm'}
+
+    def step(self, x, state):
+        """
+        Advance a causal graph by one timestep. Feeding a sequence step by step
+        from initial_state() gives the outputs predict() returns at each step.
+
+        Args:
+            x: (n, n_features) inputs of the new timestep
+            state: initial_state() or the state returned by the previous step()
+
+        Returns:
+            tuple: ((n, n_outputs) outputs at this timestep, new state)
+        """
+        if not self.causal:
+            raise ValueError("step() needs a causal graph (unidirectional LSTM and dense layers only)")
+        values, new_state = {}, {}
+        for node in self.nodes:
+            name, op = node['name'], node['op']
+            args = [values[i] for i in node['inputs']]
+            if op == 'input':
+                out = np.asarray(x)
+            elif op == 'lstm':
+                h, c = state[name]
+                x_gates = self._matmul(args[0], f'{name}/kernel') + self.tensors[f'{name}/bias']
+                out, c = self._lstm_cell(x_gates, h, c, name, node)
+                new_state[name] = (out, c)
+            elif op == 'dense':
+                out = self._dense(args[0], name, node)
+            else:
+                out = args[0]
+            values[name] = out
+        return out, new_state
+
+    def predict(self, X, verbose=0, batch_size=None):
+        """(n, timesteps, n_features) sequences -> (n, n_outputs) model outputs."""
+        X = np.asarray(X)
+        batch_size = batch_size or self.batch_size
+        return np.concatenate([self._forward(X[start:start + batch_size])
+                               for start in range(0, max(len(X), 1), batch_size)])
+
+
+def save_sequence_artifact(path, model, feature_names=None, int8_clips=None):
+    """
+    Export a Keras sequence model (see keras_sequence_graph).
+
+    Args:
+        path: Output file path
+        model: Keras model
+        feature_names: Input feature order, stored in the metadata
+        int8_clips: dict of kernel name -> clip (see quantize_int8) for the
+                    kernels to store as int8; the rest stay float32
+    """
+    nodes, tensors = keras_sequence_graph(model)
+    for name, clip in (int8_clips or {}).items():
+        tensors[name], tensors[f'{name}_scale'] = quantize_int8(tensors[name], clip)
+    save_artifact(path, tensors, 'sequence-model', {'nodes': nodes, 'feature_names': feature_names})
+
+
+def load_sequence_artifact(path, verify=True):
+    """Load an exported sequence model as an ArtifactSequenceModel."""
+    tensors, metadata = load_artifact(path, verify)
+    if metadata.get('kind') != 'sequence-model':
+        raise ValueError(f"{path}: expected a sequence-model artifact, got {metadata.get('kind')}")
+    tensors = {name: (value if value.dtype == np.int8 else _serving(value)) for name, value in tensors.items()}
+    return ArtifactSequenceModel(metadata['config']['nodes'], tensors, version=metadata.get('sha256', '')[:12])
+
+
+def _load_pickle_if_exists(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+if __name__ == '__main__':
+    # Only the sklearn files are needed here; skip loading TensorFlow
+    os.environ['SEPSIS_DEFER_PHASE3'] = '1'
+    from app import FEATURE_NAMES, PHASE3_FEATURES
+
+    print("=" * 60)
+    print("EXPORTING MODEL ARTIFACTS")
+    print("=" * 60)
+
+    if os.path.exists('model_calibrated.pkl') and os.path.exists('scaler_calibrated.pkl'):
+        model_path, scaler_path = 'model_calibrated.pkl', 'scaler_calibrated.pkl'
+    else:
+        model_path, scaler_path = 'model.pkl', 'scaler.pkl'
+
+    model = _load_pickle_if_exists(model_path)
+    if model is None:
+        print(f"[ERROR] {model_path} not found")
+    else:
+        save_phase1_artifact(
+            PHASE1_ARTIFACT, model,
+            scaler=_load_pickle_if_exists(scaler_path),
+            scaling_params=_load_pickle_if_exists('scaling_params.pkl'),
+            threshold_info=_load_pickle_if_exists('threshold_info.pkl'),
+            feature_names=FEATURE_NAMES
+        )
+        print(f"✓ {model_path} + {scaler_path} -> {PHASE1_ARTIFACT} ({os.path.getsize(PHASE1_ARTIFACT):,} bytes)")
+
+    phase3_scaler = _load_pickle_if_exists('scaler_phase3.pkl')
+    if phase3_scaler is not None:
+        save_scaler_artifact(PHASE3_SCALER_ARTIFACT, phase3_scaler, PHASE3_FEATURES)
+        print(f"✓ scaler_phase3.pkl -> {PHASE3_SCALER_ARTIFACT}")
@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Versioned model registry with hot reload.
+
+Every request takes one ModelBundle reference from the registry and uses it
+to the end, so a reload never mixes e.g. a new model with an old scaler, and
+in-flight requests finish on the version they started with.
+
+Models are read from the memory-mapped artifact format in model_artifact.py
+when present; the legacy pickles are only used as a fallback and can be
+refused entirely with SEPSIS_ALLOW_PICKLE=0.
+
+A reload loads the new artifacts in the background, runs a canary check on
+them, and only then swaps the bundle reference (a single atomic assignment).
+Parts whose files did not change (sklearn model vs Phase 3 LSTM) are reused,
+which keeps the preloaded sklearn objects shared across forked workers.
+
+SEPSIS_MODEL_PRECISION=int8 serves the int8-weight artifacts written after
+training (see quantization.py) instead of the float ones when they exist;
+the int8 LSTM runs in numpy, so workers never import TensorFlow.
+
+The stateful Phase 3 LSTM (PHASE3_STATEFUL_ARTIFACT, see lstm_state.py)
+also runs in numpy, so it is loaded with the Phase 1/2 models and shared
+by the workers like them.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from model_artifact import (PHASE1_ARTIFACT, PHASE1_INT8_ARTIFACT, PHASE3_INT8_ARTIFACT, PHASE3_SCALER_ARTIFACT,
+                            PHASE3_STATEFUL_ARTIFACT, load_phase1_artifact, load_scaler, load_sequence_artifact)
+
+# Unpickling runs arbitrary code from the file; allow turning the fallback off
+ALLOW_PICKLE = os.environ.get('SEPSIS_ALLOW_PICKLE', '1') == '1'
+
+# 'float32' or 'int8' (use the int8-weight artifacts where present)
+MODEL_PRECISION = os.environ.get('SEPSIS_MODEL_PRECISION', 'float32')
+
+# Phase 1/2 artifacts, in the order they are tried by load_sklearn_artifacts(),
+# and the stateful LSTM loaded with them
+SKLEARN_ARTIFACTS = [
+    PHASE1_INT8_ARTIFACT, PHASE1_ARTIFACT, 'model_calibrated.pkl', 'scaler_calibrated.pkl', 'scaling_params.pkl',
+    'model_phase2.pkl', 'scaler_phase2.pkl', 'model.pkl', 'scaler.pkl', 'threshold_info.pkl',
+    PHASE3_STATEFUL_ARTIFACT
+]
+PHASE3_ARTIFACTS = ['model_phase3_lstm.h5', PHASE3_INT8_ARTIFACT, PHASE3_SCALER_ARTIFACT, 'scaler_phase3.pkl']
+
+# Phase 1 features + trend_features.TREND_FEATURES; such a Phase 2 model is
+# served next to the Phase 1 model (/predict_trend) rather than replacing it
+PHASE2_TREND_N_FEATURES = 43
+
+
+def artifact_version(paths):
+    """Short version id derived from the name, size and mtime of artifact files."""
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:12]
+
+
+def _load_pickle(path):
+    if not ALLOW_PICKLE:
+        raise ValueError(f"refusing to unpickle {path} (SEPSIS_ALLOW_PICKLE=0)")
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class ModelBundle:
+    """Everything one request needs to score a patient, for one model version"""
+
+    def __init__(self, sklearn_version='none', phase3_version='none', model=None, scaler=None,
+                 scaling_params=None, threshold_info=None, calibration=None, phase2_model=None,
+                 phase2_scaler=None, phase3_model=None, phase3_scaler=None, stateful_model=None,
+                 stateful_scaler=None, source='No Model'):
+        self.sklearn_version = sklearn_version
+        self.phase3_version = phase3_version
+        self.model = model
+        self.scaler = scaler
+        self.scaling_params = scaling_params
+        self.threshold_info = threshold_info
+        self.optimal_threshold = (threshold_info or {}).get('optimal_threshold', 0.5)
+        # (raw, calibrated) probability lookup table, applied with np.interp
+        self.calibration = calibration
+        # 43-feature Phase 2 model, scored with the online trend features
+        self.phase2_model = phase2_model
+        self.phase2_scaler = phase2_scaler
+        self.phase3_model = phase3_model
+        self.phase3_scaler = phase3_scaler
+        # Causal LSTM advanced one hour at a time (ArtifactSequenceModel.step)
+        self.stateful_model = stateful_model
+        self.stateful_scaler = stateful_scaler
+        self.source = source
+        self.loaded_at = time.time()
+
+    @property
+    def version(self):
+        if self.phase3_model is None:
+            return self.sklearn_version
+        return f"{self.sklearn_version}+{self.phase3_version}"
+
+    @property
+    def phase2_available(self):
+        return self.phase2_model is not None
+
+    @property
+    def phase3_available(self):
+        return self.phase3_model is not None and self.phase3_scaler is not None
+
+    @property
+    def stateful_available(self):
+        return self.stateful_model is not None and self.stateful_scaler is not None
+
+    def describe(self):
+        return {
+            'version': self.version,
+            'source': self.source,
+            'phase2_available': self.phase2_available,
+            'phase3_available': self.phase3_available,
+            'stateful_available': self.stateful_available,
+            'optimal_threshold': self.optimal_threshold,
+            'calibrated': self.calibration is not None,
+            'loaded_at': self.loaded_at,
+        }
+
+
+def load_sklearn_artifacts():
+    """
+    Load the Phase 1/2 model, scaler and calibration files.
+    Tries the artifact file, then the calibrated model, Phase 2 and Phase 1 pickles.
+
+    Returns:
+        dict: model, scaler, scaling_params, threshold_info, calibration,
+              phase2_model, phase2_scaler, stateful_model, stateful_scaler, source
+    """
+    parts = {'model': None, 'scaler': None, 'scaling_params': None,
+             'threshold_info': None, 'calibration': None,
+             'phase2_model': None, 'phase2_scaler': None,
+             'stateful_model': None, 'stateful_scaler': None, 'source': 'No Model'}
+
+    # List available model files
+    print("[INFO] Checking available model files...")
+    for f in SKLEARN_ARTIFACTS + PHASE3_ARTIFACTS:
+        print(f"  - {f}: {'✓ Found' if os.path.exists(f) else '✗ Missing'}")
+
+    # Phase 2 model: with trend features it is served alongside whichever
+    # Phase 1 model is chosen below, otherwise it is a Phase 1 candidate (Option 2)
+    phase2_candidate = None
+    if ALLOW_PICKLE and os.path.exists('model_phase2.pkl'):
+        try:
+            phase2_candidate = _load_pickle('model_phase2.pkl')
+        except Exception as e:
+            print(f"[WARNING] Failed to load Phase 2 model: {e}")
+    if getattr(phase2_candidate, 'n_features_in_', None) == PHASE2_TREND_N_FEATURES:
+        try:
+            if os.path.exists('scaler_phase2.pkl'):
+                parts['phase2_scaler'] = _load_pickle('scaler_phase2.pkl')
+            parts['phase2_model'] = phase2_candidate
+            print("[INFO] Phase 2 trend model loaded - served with online trend features")
+        except Exception as e:
+            print(f"[WARNING] Failed to load Phase 2 scaler: {e}")
+        phase2_candidate = None
+
+    # Stateful LSTM: served alongside the Phase 1 model, with the Phase 3 scaler
+    if os.path.exists(PHASE3_STATEFUL_ARTIFACT) and os.path.exists(PHASE3_SCALER_ARTIFACT):
+        try:
+            stateful_model = load_sequence_artifact(PHASE3_STATEFUL_ARTIFACT)
+            if not stateful_model.causal:
+                raise ValueError("not a causal model")
+            parts.update(stateful_model=stateful_model, stateful_scaler=load_scaler(PHASE3_SCALER_ARTIFACT))
+            print("[INFO] Stateful LSTM loaded - hourly forecast updates per patient")
+        except Exception as e:
+            print(f"[WARNING] Failed to load stateful LSTM: {e}")
+
+    # Option 0: Memory-mapped artifact (no pickle, no sklearn import), int8 first if requested
+    candidates = [(PHASE1_ARTIFACT, 'Phase 1 artifact')]
+    if MODEL_PRECISION == 'int8':
+        candidates.insert(0, (PHASE1_INT8_ARTIFACT, 'Phase 1 int8 artifact'))
+    for path, source in candidates:
+        if not os.path.exists(path):
+            continue
+        try:
+            artifact = load_phase1_artifact(path)
+            parts.update(model=artifact['model'], scaler=artifact['scaler'],
+                         scaling_params=artifact['scaling_params'],
+                         threshold_info=artifact['threshold_info'],
+                         calibration=artifact['calibration'],
+                         source=source)
+            print(f"[INFO] Using model artifact ({path})")
+            return parts
+        except Exception as e:
+            print(f"[WARNING] Failed to load {path}: {e}")
+
+    # Option 1: Calibrated model
+    if os.path.exists('model_calibrated.pkl') and os.path.exists('scaler_calibrated.pkl'):
+        try:
+            parts['model'] = _load_pickle('model_calibrated.pkl')
+            parts['scaler'] = _load_pickle('scaler_calibrated.pkl')
+            if os.path.exists('scaling_params.pkl'):
+                parts['scaling_params'] = _load_pickle('scaling_params.pkl')
+            parts['source'] = 'Calibrated model'
+            print("[INFO] Using Calibrated model with probability scaling")
+        except Exception as e:
+            parts.update(model=None, scaler=None, scaling_params=None)
+            print(f"[WARNING] Failed to load calibrated model: {e}")
+
+    # Option 2: Phase 2 model without trend features
+    if parts['model'] is None and phase2_candidate is not None:
+        try:
+            parts['model'] = phase2_candidate
+            if os.path.exists('scaler.pkl'):
+                parts['scaler'] = _load_pickle('scaler.pkl')
+            parts['source'] = 'Phase 2 model'
+            print("[INFO] Using Phase 2 model")
+        except Exception as e:
+            parts.update(model=None, scaler=None)
+            print(f"[WARNING] Failed to load Phase 2 model: {e}")
+
+    # Option 3: Phase 1 model (fallback)
+    if parts['model'] is None and os.path.exists('model.pkl'):
+        try:
+            parts['model'] = _load_pickle('model.pkl')
+            if os.path.exists('scaler.pkl'):
+                parts['scaler'] = _load_pickle('scaler.pkl')
+            parts['source'] = 'Phase 1 model'
+            print("[INFO] Using Phase 1 model (model.pkl)")
+        except Exception as e:
+            print(f"[ERROR] Failed to load Phase 1 model: {e}")
+
+    if parts['model'] is None:
+        print("[ERROR] No ML model could be loaded! Server will return test responses.")
+
+    # Load Phase 2 threshold info if available
+    if os.path.exists('threshold_info.pkl'):
+        try:
+            parts['threshold_info'] = _load_pickle('threshold_info.pkl')
+        except Exception:
+            pass
+
+    return parts
+
+
+def phase3_sources():
+    """
+    Files load_phase3_artifacts() reads: (scaler path, whether the model is the
+    int8 numpy artifact rather than the Keras/TensorFlow one), or None if unavailable.
+    """
+    if os.path.exists(PHASE3_SCALER_ARTIFACT):
+        scaler_path = PHASE3_SCALER_ARTIFACT
+    elif ALLOW_PICKLE:
+        scaler_path = 'scaler_phase3.pkl'
+    else:
+        return None
+    int8 = MODEL_PRECISION == 'int8' and os.path.exists(PHASE3_INT8_ARTIFACT)
+    if not ((int8 or os.path.exists('model_phase3_lstm.h5')) and os.path.exists(scaler_path)):
+        return None
+    return scaler_path, int8
+
+
+def load_phase3_artifacts():
+    """
+    Load the Phase 3 LSTM and its scaler.
+    Returns (model, scaler), or (None, None) if unavailable.
+    """
+    sources = phase3_sources()
+    if sources is None:
+        return None, None
+    scaler_path, int8 = sources
+    try:
+        if int8:
+            phase3_model = load_sequence_artifact(PHASE3_INT8_ARTIFACT)
+        else:
+            from tensorflow.keras.models import load_model
+            phase3_model = load_model('model_phase3_lstm.h5')
+        phase3_scaler = load_scaler(scaler_path)
+        print(f"[INFO] Phase 3 LSTM model loaded{' (int8)' if int8 else ''} - 6-hour advance prediction available")
+        return phase3_model, phase3_scaler
+    except Exception as e:
+        print(f"[WARNING] Phase 3 LSTM not available: {e}")
+        return None, None
+
+
+class ModelRegistry:
+    """Holds the current ModelBundle and swaps in validated new versions"""
+
+    def __init__(self, canary=None, on_swap=None):
+        """
+        Args:
+            canary: Callable(bundle) that raises if the bundle is unusable
+            on_swap: Callable(bundle) run after a new bundle goes live
+        """
+        self.canary = canary
+        self.on_swap = on_swap
+        self.phase3_enabled = False
+        self.last_error = None
+        self.reloads = 0
+        self._bundle = ModelBundle()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+
+    def current(self):
+        """The live bundle. Callers should read it once per request."""
+        return self._bundle
+
+    def load(self, include_phase3=None):
+        """
+        Load changed artifacts, validate and swap. Blocks until done.
+
+        Args:
+            include_phase3: Also load the LSTM (defaults to whether it was
+                            loaded before in this process)
+
+        Returns:
+            ModelBundle: The live bundle afterwards (the old one if validation failed)
+        """
+        with self._reload_lock:
+            if include_phase3 is not None:
+                self.phase3_enabled = include_phase3
+            old = self._bundle
+
+            sklearn_version = artifact_version(SKLEARN_ARTIFACTS)
+            if sklearn_version != old.sklearn_version or old.model is None:
+                parts = load_sklearn_artifacts()
+            else:
+                parts = {'model': old.model, 'scaler': old.scaler, 'scaling_params': old.scaling_params,
+                         'threshold_info': old.threshold_info, 'calibration': old.calibration,
+                         'phase2_model': old.phase2_model, 'phase2_scaler': old.phase2_scaler,
+                         'stateful_model': old.stateful_model, 'stateful_scaler': old.stateful_scaler,
+                         'source': old.source}
+
+            phase3_version, phase3_model, phase3_scaler = 'none', None, None
+            if self.phase3_enabled:
+                phase3_version = artifact_version(PHASE3_ARTIFACTS)
+                if phase3_version == old.phase3_version and old.phase3_available:
+                    phase3_model, phase3_scaler = old.phase3_model, old.phase3_scaler
+                else:
+                    phase3_model, phase3_scaler = load_phase3_artifacts()
+
+            bundle = ModelBundle(sklearn_version, phase3_version, phase3_model=phase3_model,
+                                 phase3_scaler=phase3_scaler, **parts)
+            if bundle.version == old.version and bundle.model is old.model \
+                    and bundle.phase3_model is old.phase3_model:
+                return old
+
+            try:
+                if self.canary is not None and bundle.model is not None:
+                    self.canary(bundle)
+            except Exception as e:
+                self.last_error = f"Canary failed for version {bundle.version}: {e}"
+                print(f"[ERROR] {self.last_error} - keeping version {old.version}")
+                return old
+
+            self._bundle = bundle
+            self.reloads += 1
+            self.last_error = None
+            print(f"[INFO] Model version {bundle.version} is live ({bundle.source})")
+            if self.on_swap is not None:
+                self.on_swap(bundle)
+            return bundle
+
+    def reload_async(self):
+        """Start a background reload; returns the thread."""
+        thread = threading.Thread(target=self.load, name='model-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def start_watcher(self, interval):
+        """
+        Poll artifact files every `interval` seconds and reload on change.
+        A change must be seen on two consecutive polls, so files that are
+        still being written are not picked up half-way.
+        """
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def watch():
+            seen = self._watched_version()
+            pending = None
+            while not self._stop_watching.wait(interval):
+                latest = self._watched_version()
+                if latest == seen:
+                    pending = None
+                elif latest == pending:
+                    self.load()
+                    seen, pending = latest, None
+                else:
+                    pending = latest
+
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=watch, name='model-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop_watching.set()
+        self._watcher = None
+
+    def _watched_version(self):
+        paths = SKLEARN_ARTIFACTS + (PHASE3_ARTIFACTS if self.phase3_enabled else [])
+        return artifact_version(paths)
+
+    def status(self):
+        return dict(self._bundle.describe(), reloads=self.reloads, last_error=self.last_error,
+                    watching=self._watcher is not None, pid=os.getpid())
@@ -1,11 +1,12 @@
 """
 Phase 3 Prediction Utility
 Handles LSTM predictions and integrates with Flask
+(TensorFlow is imported when a predictor loads its model)
 """
 
+import os
 import numpy as np
-import pickle
-from tensorflow import keras
+from model_artifact import PHASE3_SCALER_ARTIFACT, SERVING_DTYPE, load_scaler, scale_with_imputation
 
 # Configuration
 SEQUENCE_LENGTH = 12
@@ -19,11 +20,14 @@ FEATURE_COLUMNS = [
 class Phase3LSTMPredictor:
     """LSTM model wrapper for time-series predictions"""
     
-    def __init__(self, model_path='model_phase3_lstm.h5', scaler_path='scaler_phase3.pkl'):
-        """Initialize Phase 3 LSTM model"""
+    def __init__(self, model_path='model_phase3_lstm.h5', scaler_path=None):
+        """Initialize Phase 3 LSTM model (scaler from the artifact file if exported, else the pickle)"""
+        if scaler_path is None:
+            scaler_path = PHASE3_SCALER_ARTIFACT if os.path.exists(PHASE3_SCALER_ARTIFACT) else 'scaler_phase3.pkl'
         try:
-            self.model = keras.models.load_model(model_path)
-            self.scaler = pickle.load(open(scaler_path, 'rb'))
+            from tensorflow.keras.models import load_model
+            self.model = load_model(model_path)
+            self.scaler = load_scaler(scaler_path)
             self.ready = True
             print("[INFO] Phase 3 LSTM model loaded successfully")
         except Exception as e:
@@ -34,6 +38,7 @@ class Phase3LSTMPredictor:
         """
         Create a sequence from a list of feature vectors
         features_list: list of feature vectors [[f1, f2, ...], [f1, f2, ...], ...]
+                       (NaN for missing values, imputed from the scaler artifact)
         """
         if len(features_list) < SEQUENCE_LENGTH:
             # Pad with the first sample if we don't have enough data
@@ -41,14 +46,14 @@ class Phase3LSTMPredictor:
                 features_list = [features_list[0]] + features_list
         
         # Take last SEQUENCE_LENGTH samples
-        sequence = np.array(features_list[-SEQUENCE_LENGTH:])
+        sequence = np.array(features_list[-SEQUENCE_LENGTH:], dtype=SERVING_DTYPE)
         
         # Reshape for scaler
         n_samples, n_features = sequence.shape
         sequence_flat = sequence.reshape(-1, n_features)
         
         # Scale
-        sequence_scaled = self.scaler.transform(sequence_flat)
+        sequence_scaled = scale_with_imputation(self.scaler, sequence_flat)
         sequence_scaled = sequence_scaled.reshape(1, SEQUENCE_LENGTH, n_features)
         
         return sequence_scaled
@@ -67,7 +72,7 @@ class Phase3LSTMPredictor:
             if isinstance(features_history[0], dict):
                 features_array = []
                 for feat_dict in features_history:
-                    feat_array = [feat_dict.get(col, 0) for col in FEATURE_COLUMNS]
+                    feat_array = [feat_dict.get(col, np.nan) for col in FEATURE_COLUMNS]
                     features_array.append(feat_array)
             else:
                 features_array = features_history
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Prediction result cache for the Phase 1 scoring pipeline.
+
+Bedside monitors resubmit identical or near-identical vitals (labs often stay
+unchanged for hours). Inputs are snapped to clinically meaningful precision and
+the snapped values are what get scored, so every input that maps to the same
+key would produce exactly the cached result.
+
+Keys also carry the model version, and the cache is cleared whenever models
+are (re)loaded, so a new model never serves stale results.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Decimal places kept per feature (FEATURE_NAMES order in app.py).
+# Finer differences than these are below measurement/clinical relevance.
+QUANTIZATION_DECIMALS = {
+    'HR': 0, 'O2Sat': 0, 'Temp': 1, 'SBP': 0, 'MAP': 0, 'DBP': 0, 'Resp': 0,
+    'BaseExcess': 1, 'HCO3': 0, 'FiO2': 2, 'PaCO2': 0, 'SaO2': 0, 'Creatinine': 1,
+    'Bilirubin_direct': 1, 'Glucose': 0, 'Lactate': 1, 'Magnesium': 1, 'Phosphate': 1,
+    'Bilirubin_total': 1, 'Hgb': 1, 'WBC': 1, 'Fibrinogen': 0, 'Platelets': 0,
+    'Age': 0, 'Gender': 0, 'HospAdmTime': 0, 'ICULOS': 0,
+}
+
+# Largest |value| that is cached. Far beyond any physiological value, and small
+# enough that value * 10**decimals cannot overflow the int64 key
+MAX_CACHEABLE_VALUE = 1e9
+
+
+class PredictionCache:
+    """Thread-safe LRU cache with a per-entry time-to-live and hit/miss counters"""
+
+    def __init__(self, maxsize=4096, ttl=300.0):
+        """
+        Args:
+            maxsize: Maximum number of entries (0 disables the cache)
+            ttl: Seconds an entry stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss or expired entry."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (called on model reload). Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+def quantize_form(form_data, feature_names, model_version):
+    """
+    Snap a Phase 1 form submission to QUANTIZATION_DECIMALS precision.
+
+    Non-numeric and non-finite fields are treated as absent and left out of
+    the canonical form: the MLP parser reads them as NaN, which
+    score_phase1() replaces with the artifact's imputation values, and the
+    rule checks skip them. Absent fields are part of the key (`present`), so
+    a missing value never shares a cache entry with a submitted 0. A form
+    with a value beyond MAX_CACHEABLE_VALUE is not cached at all: the key is
+    None and the form is returned unchanged, to be scored as submitted.
+
+    Args:
+        form_data: Raw form dict
+        feature_names: Feature order used by the model
+        model_version: Version string of the loaded model
+
+    Returns:
+        tuple: (cache key or None, canonical form dict with the snapped values)
+    """
+    values = np.zeros(len(feature_names))
+    present = np.zeros(len(feature_names), dtype=bool)
+    for i, name in enumerate(feature_names):
+        raw = form_data.get(name, '')
+        if raw == '':
+            continue
+        try:
+            values[i] = float(raw)
+        except (ValueError, TypeError):
+            continue
+        present[i] = np.isfinite(values[i])
+        if not present[i]:
+            values[i] = 0.0
+
+    if np.any(np.abs(values) > MAX_CACHEABLE_VALUE):
+        return None, form_data
+
+    scale = 10.0 ** np.array([QUANTIZATION_DECIMALS.get(name, 2) for name in feature_names])
+    steps = np.round(values * scale).astype(np.int64)
+    snapped = steps / scale
+
+    key = (model_version, present.tobytes(), steps.tobytes())
+    canonical = {
+        name: repr(float(snapped[i]))
+        for i, name in enumerate(feature_names) if present[i]
+    }
+    return key, canonical
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Post-training int8 weight quantization of the Phase 1 MLP and the Phase 3 LSTM.
+
+Every kernel is stored as int8 with one float32 scale per output unit
+(model_artifact.quantize_int8); biases, normalisation parameters and the
+activations stay float32. A scale maps a clip magnitude to 127, and the clip
+is calibrated on a held-out slice: kernel by kernel, each candidate in
+CLIP_PERCENTILES (of the column's |weights|) is tried and the one whose
+outputs deviate least from the float model's is kept. Clipping a few outlier
+weights buys resolution for all the others.
+
+Used after training by training_pipeline.py (quantize stage, calibrated on
+the validation split) and train_model_phase3_lstm.py (calibrated on the
+Keras validation split); both report accuracy/ROC-AUC deltas against the
+float model on the test split with quantization_report().
+"""
+
+import numpy as np
+
+from model_artifact import (ArtifactMLP, ArtifactSequenceModel, keras_sequence_graph, quantize_int8,
+                            sequence_kernels)
+
+# Candidate clips, as percentiles of each output unit's |weights|
+CLIP_PERCENTILES = (100.0, 99.99, 99.9, 99.5, 99.0)
+
+
+def calibrate_clips(kernels, error):
+    """
+    Greedy per-kernel clip search.
+
+    Args:
+        kernels: dict of name -> float 2-D kernel, in forward order
+        error: Callable(dict of name -> clip for the kernels quantized so far)
+               -> deviation from the float model on the calibration slice
+
+    Returns:
+        dict: name -> (n_out,) clip, for every kernel
+    """
+    chosen = {}
+    for name, W in kernels.items():
+        magnitudes = np.abs(np.asarray(W, dtype=np.float64))
+        best_error, best_clip = None, None
+        for percentile in CLIP_PERCENTILES:
+            clip = np.percentile(magnitudes, percentile, axis=0)
+            candidate_error = error({**chosen, name: clip})
+            if best_error is None or candidate_error < best_error:
+                best_error, best_clip = candidate_error, clip
+        chosen[name] = best_clip
+    return chosen
+
+
+# ============================================================================
+# Phase 1 MLP
+# ============================================================================
+
+def quantized_mlp(model, clips):
+    """ArtifactMLP of a fitted MLP with the layers in clips (layer index -> clip) quantized to int8."""
+    coefs, scales = [], []
+    for i, W in enumerate(model.coefs_):
+        if i in clips:
+            q, scale = quantize_int8(W, clips[i])
+            coefs.append(q)
+            scales.append(scale)
+        else:
+            coefs.append(np.asarray(W, dtype=np.float32))
+            scales.append(None)
+    intercepts = [np.asarray(b, dtype=np.float32) for b in model.intercepts_]
+    return ArtifactMLP(coefs, intercepts, model.activation, model.out_activation_, model.classes_, scales)
+
+
+def calibrate_mlp(model, X_calibration):
+    """
+    int8 clips for every layer of a fitted MLPClassifier (or ArtifactMLP).
+
+    Args:
+        model: Model with coefs_/intercepts_
+        X_calibration: Held-out scaled inputs
+
+    Returns:
+        list: one (n_out,) clip per layer, for save_phase1_artifact(int8_clips=...)
+    """
+    X = np.asarray(X_calibration, dtype=np.float32)
+    reference = quantized_mlp(model, {}).predict_proba(X)[:, 1]
+
+    def error(clips):
+        return np.abs(quantized_mlp(model, clips).predict_proba(X)[:, 1] - reference).mean()
+
+    clips = calibrate_clips(dict(enumerate(model.coefs_)), error)
+    return [clips[i] for i in range(len(model.coefs_))]
+
+
+# ============================================================================
+# Phase 3 sequence model
+# ============================================================================
+
+def calibrate_sequence_model(model, X_calibration, max_sequences=2048):
+    """
+    int8 clips for every kernel of a Keras sequence model.
+
+    Args:
+        model: Keras model (see model_artifact.keras_sequence_graph)
+        X_calibration: Held-out scaled (n, timesteps, n_features) sequences
+        max_sequences: Calibration sequences used (evenly spaced over X_calibration)
+
+    Returns:
+        dict: kernel name -> clip, for save_sequence_artifact(int8_clips=...)
+    """
+    nodes, tensors = keras_sequence_graph(model)
+    X = np.asarray(X_calibration, dtype=np.float32)
+    if len(X) > max_sequences:
+        X = X[np.linspace(0, len(X) - 1, max_sequences).astype(int)]
+    reference = ArtifactSequenceModel(nodes, tensors).predict(X)
+
+    def error(clips):
+        quantized = dict(tensors)
+        for name, clip in clips.items():
+            quantized[name], quantized[f'{name}_scale'] = quantize_int8(tensors[name], clip)
+        return np.abs(ArtifactSequenceModel(nodes, quantized).predict(X) - reference).mean()
+
+    return calibrate_clips({name: tensors[name] for name in sequence_kernels(tensors)}, error)
+
+
+# ============================================================================
+# Reporting
+# ============================================================================
+
+def quantization_report(y_true, float_proba, int8_proba, threshold=0.5):
+    """
+    Accuracy and ROC-AUC of the float and int8 models on the same rows.
+
+    Returns:
+        dict: float_/int8_ accuracy and roc_auc, their deltas (int8 - float),
+              max_abs_diff of the probabilities and the share of rows whose
+              decision at `threshold` changed
+    """
+    from sklearn.metrics import accuracy_score, roc_auc_score
+    y_true = np.asarray(y_true).ravel()
+    float_proba = np.asarray(float_proba, dtype=np.float64).ravel()
+    int8_proba = np.asarray(int8_proba, dtype=np.float64).ravel()
+
+    report = {}
+    for prefix, proba in (('float', float_proba), ('int8', int8_proba)):
+        report[f'{prefix}_accuracy'] = accuracy_score(y_true, proba >= threshold)
+        report[f'{prefix}_roc_auc'] = roc_auc_score(y_true, proba) if len(np.unique(y_true)) > 1 else float('nan')
+    report['accuracy_delta'] = report['int8_accuracy'] - report['float_accuracy']
+    report['roc_auc_delta'] = report['int8_roc_auc'] - report['float_roc_auc']
+    report['max_abs_diff'] = float(np.abs(int8_proba - float_proba).max()) if len(float_proba) else 0.0
+    report['decisions_changed'] = float(np.mean((int8_proba >= threshold) != (float_proba >= threshold)))
+    return report
+
+
+def print_quantization_report(report, title):
+    print(f"\n📉 INT8 QUANTIZATION ({title}):")
+    print(f"  {'':<12}{'float':>10}{'int8':>10}{'delta':>10}")
+    for key, label in (('accuracy', 'Accuracy'), ('roc_auc', 'ROC-AUC')):
+        print(f"  {label:<12}{report[f'float_{key}']:>10.4f}{report[f'int8_{key}']:>10.4f}"
+              f"{report[f'{key}_delta']:>+10.4f}")
+    print(f"  • Max |p_int8 - p_float|: {report['max_abs_diff']:.5f}")
+    print(f"  • Decisions changed: {report['decisions_changed']:.3%}")
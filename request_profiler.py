@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Opt-in sampling profiler for individual requests.
+
+A request is profiled when it carries the X-Sepsis-Profile header (admin
+callers only, see app.admin_authorized) or is picked by SEPSIS_PROFILE_SAMPLE_RATE.
+While it runs, a background thread samples the request thread's Python stack
+every SEPSIS_PROFILE_INTERVAL seconds. The result is stored as folded stacks
+("outer;inner;leaf count" lines), which flamegraph.pl, speedscope and
+inferno read directly, in a ring buffer of the last SEPSIS_PROFILE_KEEP profiles.
+
+When no request is profiled, the cost is one header lookup and one float
+comparison per request; the sampler thread only exists during a profile.
+While any profile is running, the interpreter's GIL switch interval is
+lowered to the sampling interval so the sampler actually gets to run.
+
+Only the request thread is sampled, so work handed to executor threads
+(e.g. the /predict_combined LSTM forecast) shows up as the wait for its result.
+Under asgi.py the request thread is the event loop thread, so a profile also
+contains the coroutines of requests running concurrently with it.
+"""
+
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+PROFILE_HEADER = 'X-Sepsis-Profile'
+PROFILE_SAMPLE_RATE = float(os.environ.get('SEPSIS_PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.environ.get('SEPSIS_PROFILE_INTERVAL', 0.002))
+PROFILE_KEEP = int(os.environ.get('SEPSIS_PROFILE_KEEP', 20))
+
+
+_active_lock = threading.Lock()
+_active_profiles = 0
+_saved_switch_interval = None
+
+
+def _frame_label(code, _cache={}):
+    label = _cache.get(code)
+    if label is None:
+        label = _cache[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+class SamplingProfiler:
+    """Samples one thread's stack at a fixed interval into folded-stack counts"""
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        global _active_profiles, _saved_switch_interval
+        with _active_lock:
+            if _active_profiles == 0:
+                _saved_switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(_saved_switch_interval, self.interval / 2))
+            _active_profiles += 1
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return the folded-stack counts."""
+        global _active_profiles
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            with _active_lock:
+                _active_profiles -= 1
+                if _active_profiles == 0:
+                    sys.setswitchinterval(_saved_switch_interval)
+        return self.stacks
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None or self._stop.is_set():
+                return
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+
+class ProfileStore:
+    """Thread-safe ring buffer of the most recent request profiles"""
+
+    def __init__(self, maxlen=PROFILE_KEEP):
+        self._profiles = deque(maxlen=maxlen)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, status, duration, profiler):
+        profile = {
+            'id': next(self._ids),
+            'endpoint': endpoint,
+            'status': status,
+            'started_at': time.time() - duration,
+            'duration_ms': duration * 1000,
+            'interval_ms': profiler.interval * 1000,
+            'samples': profiler.samples,
+            'stacks': profiler.stacks,
+        }
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def summaries(self):
+        """Newest first, without the stack data."""
+        with self._lock:
+            profiles = list(self._profiles)
+        return [{k: v for k, v in p.items() if k != 'stacks'} for p in reversed(profiles)]
+
+    def get(self, profile_id):
+        with self._lock:
+            for profile in self._profiles:
+                if profile['id'] == profile_id:
+                    return profile
+        return None
+
+
+def folded(profile):
+    """Folded-stack text for one stored profile, heaviest stacks first."""
+    return ''.join(f"{stack} {count}\n" for stack, count in profile['stacks'].most_common())
+
+
+def should_profile(requested):
+    """Whether to profile this request: explicitly requested, or sampled."""
+    return requested or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
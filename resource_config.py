@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+CPU thread pools and affinity of the serving and scoring processes.
+
+Left alone, every worker process starts TensorFlow's intra- and inter-op
+pools and an OpenBLAS/MKL (or OpenMP) pool for numpy/sklearn, each with one
+thread per core, plus the asgi.py executors. N workers on N cores then run
+several times N^2 compute threads, and tail latency suffers from the
+contention. configure() gives each worker its share of the host instead:
+
+    import resource_config
+    resource_config.configure(workers=4)   # before numpy / TensorFlow are imported
+
+- BLAS/OpenMP: OMP_NUM_THREADS, OPENBLAS_NUM_THREADS, MKL_NUM_THREADS, ... are
+  read when the libraries load; pools that are already loaded are resized
+  with threadpoolctl. SHAP/LIME explanations run their numerical work here.
+- TensorFlow: TF_NUM_INTRAOP_THREADS / TF_NUM_INTEROP_THREADS, read when the
+  runtime starts (in the worker, after fork); applied with tf.config if
+  TensorFlow is imported but has not started yet.
+- Executors: SEPSIS_EXPLAIN_THREADS and SEPSIS_LSTM_THREADS (asgi.py).
+- CPU affinity (SEPSIS_CPU_AFFINITY=1): pin_worker(slot) restricts a worker
+  to its own block of threads_per_worker cores.
+
+Variables the environment already sets are left as they are. gunicorn.conf.py
+calls configure() in the master before the app is preloaded, and
+pin_worker() after each fork; asgi.py calls it under uvicorn (workers from
+WEB_CONCURRENCY) and app.py for its development server. report() returns
+the settings in effect (/admin/resources). benchmark_threads.py measures which split of a host into
+workers x threads serves fastest.
+
+Environment:
+    SEPSIS_THREADS_PER_WORKER  Compute threads per worker (default: cores // workers, at least 1)
+    SEPSIS_TF_INTEROP_THREADS  TensorFlow inter-op threads (default 1; the served graphs are sequential)
+    SEPSIS_CPU_AFFINITY        1 = pin each worker to its own cores (default 0)
+"""
+
+import os
+import sys
+
+# Thread-count variables of the BLAS/OpenMP runtimes numpy, scipy and sklearn may load
+BLAS_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+                 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+TF_ENV_VARS = ('TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+EXECUTOR_ENV_VARS = ('SEPSIS_EXPLAIN_THREADS', 'SEPSIS_LSTM_THREADS')
+
+_settings = {}
+
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def configure(workers=1, threads_per_worker=None, interop_threads=None, cores=None):
+    """
+    Size the thread pools of this process (and the workers it forks) for
+    `workers` processes sharing the host.
+
+    Args:
+        workers: Worker processes on the host
+        threads_per_worker: Compute threads per worker (default: SEPSIS_THREADS_PER_WORKER,
+                            else cores // workers)
+        interop_threads: TensorFlow inter-op threads (default: SEPSIS_TF_INTEROP_THREADS, else 1)
+        cores: Cores to share (default: available_cores())
+
+    Returns:
+        dict: the settings (see report())
+    """
+    cores = cores or available_cores()
+    threads = int(threads_per_worker or os.environ.get('SEPSIS_THREADS_PER_WORKER') or max(cores // max(workers, 1), 1))
+    interop = int(interop_threads or os.environ.get('SEPSIS_TF_INTEROP_THREADS') or 1)
+
+    for var in BLAS_ENV_VARS:
+        os.environ.setdefault(var, str(threads))
+    os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(threads))
+    os.environ.setdefault('TF_NUM_INTEROP_THREADS', str(interop))
+    # Explanations are short and mostly Python; more threads than cores only queue on the GIL
+    os.environ.setdefault('SEPSIS_EXPLAIN_THREADS', str(min(2, threads)))
+    os.environ.setdefault('SEPSIS_LSTM_THREADS', '1')
+
+    # Libraries imported before configure() already sized their pools
+    if 'numpy' in sys.modules or 'sklearn' in sys.modules:
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=int(os.environ['OMP_NUM_THREADS']))
+        except ImportError:
+            print("[WARNING] threadpoolctl is not installed; BLAS pools loaded before configure() keep their size")
+    if 'tensorflow' in sys.modules:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(int(os.environ['TF_NUM_INTRAOP_THREADS']))
+            tf.config.threading.set_inter_op_parallelism_threads(int(os.environ['TF_NUM_INTEROP_THREADS']))
+        except RuntimeError:
+            # The runtime has started; its pools keep their size
+            pass
+
+    _settings.update(cores=cores, workers=workers, threads_per_worker=threads,
+                     affinity=os.environ.get('SEPSIS_CPU_AFFINITY', '0') == '1')
+    return report()
+
+
+def configured():
+    """Whether configure() has run in this process (or the process it was forked from)."""
+    return bool(_settings)
+
+
+def pin_worker(slot):
+    """
+    With SEPSIS_CPU_AFFINITY=1, restrict this process to the slot-th block of
+    threads_per_worker cores (wrapping around when workers x threads exceeds
+    the cores). Returns the cores it may run on, or None if not pinned.
+    """
+    if not _settings.get('affinity') or not hasattr(os, 'sched_setaffinity'):
+        return None
+    cores = sorted(os.sched_getaffinity(0))
+    threads = min(_settings['threads_per_worker'], len(cores))
+    block = {cores[(slot * threads + i) % len(cores)] for i in range(threads)}
+    os.sched_setaffinity(0, block)
+    _settings['slot'] = slot
+    return sorted(block)
+
+
+def report():
+    """
+    Thread pools of this process.
+
+    Returns:
+        dict: cores, workers, threads_per_worker, the CPUs this process may run
+              on, the thread environment variables, the loaded BLAS/OpenMP
+              libraries with their thread counts (threadpoolctl), TensorFlow's
+              pool sizes if it is imported, and the executor sizes
+    """
+    result = dict(_settings)
+    if hasattr(os, 'sched_getaffinity'):
+        result['cpus'] = sorted(os.sched_getaffinity(0))
+    result['env'] = {var: os.environ.get(var) for var in BLAS_ENV_VARS + TF_ENV_VARS + EXECUTOR_ENV_VARS}
+    try:
+        from threadpoolctl import threadpool_info
+        result['blas'] = [{'library': info['internal_api'], 'user_api': info['user_api'],
+                           'num_threads': info['num_threads']} for info in threadpool_info()]
+    except ImportError:
+        result['blas'] = None
+    if 'tensorflow' in sys.modules:
+        tf = sys.modules['tensorflow']
+        # 0 means TensorFlow's own default (the TF_NUM_* variables, else one per core)
+        result['tensorflow'] = {'intra_op': tf.config.threading.get_intra_op_parallelism_threads(),
+                                'inter_op': tf.config.threading.get_inter_op_parallelism_threads()}
+    return result
+
+
+def summary(settings=None):
+    """One-line description of report() for the logs."""
+    settings = settings or report()
+    env = settings['env']
+    return (f"{settings.get('workers')} workers x {settings.get('threads_per_worker')} threads on "
+            f"{settings.get('cores')} cores (BLAS {env['OMP_NUM_THREADS']}, TensorFlow intra-op "
+            f"{env['TF_NUM_INTRAOP_THREADS']} / inter-op {env['TF_NUM_INTEROP_THREADS']}, explain executor "
+            f"{env['SEPSIS_EXPLAIN_THREADS']}, affinity {'on' if settings.get('affinity') else 'off'})")
@@ -0,0 +1,576 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Input pipeline and multi-process data-parallel training for the Phase 3
+sequence models (train_model_phase3_lstm.py).
+
+Sequences are kept as start rows into the scaled hourly rows.
+sequence_dataset() gathers the windows in a tf.data pipeline and
+training_dataset() batches them with their targets and sample weights.
+
+fit_data_parallel() trains a compiled Keras model on several local worker
+processes by parameter averaging (local SGD). Every worker holds a replica of
+the model and a disjoint, equal-sized shard of the training sequences; it runs
+`sync_steps` batches with its own optimizer, then the replicas' weights are
+averaged and sent back before the next round. At the end of every epoch the
+workers' optimizer variables (Adam moments, iteration) are averaged into the
+calling model's optimizer too, so a checkpoint of it resumes with them. TensorFlow's intra-op pool of
+each worker is limited to its share of the cores, so the LSTM step kernels of
+N replicas run side by side instead of one model.fit leaving most cores idle.
+The calling process only averages weights and drives the Keras callbacks
+(EarlyStopping, ReduceLROnPlateau, History) once per epoch, on validation
+metrics the workers compute on shards of the validation sequences.
+
+tf.distribute.MultiWorkerMirroredStrategy is not used: Keras 3's fit() fails
+to build a model from a distributed dataset under it.
+
+EpochCheckpoint saves a Keras training run (model.fit or fit_data_parallel)
+every few epochs so that it can be resumed.
+
+scaling_report() measures training throughput as the worker count grows:
+
+    report = scaling_report(model, X_scaled, 12, fit_index, targets, weights, [1, 2, 4, 8])
+    print_scaling_report(report)
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from checkpointing import restore_rng_state, rng_state
+
+# Batches each worker trains between two weight averages
+SYNC_STEPS = 50
+
+
+def available_cores():
+    """CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_worker_counts(cores=None):
+    """1, 2, 4, ... up to the number of cores (which is always included)."""
+    cores = cores or available_cores()
+    counts = [1]
+    while counts[-1] * 2 < cores:
+        counts.append(counts[-1] * 2)
+    if cores > 1:
+        counts.append(cores)
+    return counts
+
+
+# ============================================================================
+# Input pipeline
+# ============================================================================
+
+def sequence_dataset(rows, starts, sequence_length, cache_path=None):
+    """
+    Sequences rows[start:start + sequence_length] for each of `starts`, as a
+    tf.data pipeline (windows gathered in parallel).
+
+    Args:
+        rows: (n_rows, n_features) scaled float32 rows
+        starts: Start row of each sequence
+        sequence_length: Timesteps per sequence
+        cache_path: File the windows are cached to during the first epoch (None = no cache)
+    """
+    rows = tf.constant(rows)
+    offsets = tf.range(sequence_length, dtype=tf.int64)
+    sequences = tf.data.Dataset.from_tensor_slices(np.asarray(starts, dtype=np.int64))
+    sequences = sequences.map(lambda start: tf.gather(rows, start + offsets), num_parallel_calls=tf.data.AUTOTUNE)
+    return sequences.cache(cache_path) if cache_path else sequences
+
+
+def training_dataset(sequences, targets, weights, batch_size, shuffle_buffer=0, seed=None, repeat=False):
+    """
+    (sequence, target, sample weight) batches for model.fit, prefetched.
+
+    Args:
+        sequences: Dataset from sequence_dataset()
+        targets: Target of each sequence
+        weights: Sample weight of each sequence
+        batch_size: Sequences per batch
+        shuffle_buffer: Sequences shuffled at a time, reshuffled every epoch (0 = keep the order)
+        seed: Shuffle seed
+        repeat: Repeat indefinitely (for a fixed number of steps instead of epochs)
+    """
+    labels = tf.data.Dataset.from_tensor_slices((targets, np.asarray(weights, dtype=np.float32)))
+    dataset = tf.data.Dataset.zip((sequences, labels)).map(lambda sequence, label: (sequence, *label))
+    if shuffle_buffer:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    if repeat:
+        dataset = dataset.repeat()
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+# ============================================================================
+# Checkpoints
+# ============================================================================
+
+class EpochCheckpoint(keras.callbacks.Callback):
+    """
+    Saves a Keras training run to a checkpointing.TrainingCheckpoint every
+    `every` epochs and when training ends: the weights with the optimizer
+    state (moments, iteration, learning rate; with fit_data_parallel the
+    workers' averaged state), the epoch, the history, the
+    state of the other callbacks (EarlyStopping, ReduceLROnPlateau) and the
+    numpy/Python RNG state. Keras dropout and tf.data shuffle seeds are not
+    restored, so a resumed run does not repeat the interrupted one bit for bit.
+
+    Call restore() before fitting, start from the epoch it returns, and pass
+    this callback after the others (it restores their state once they have
+    reset it in on_train_begin).
+    """
+
+    CALLBACK_STATE = ('wait', 'best', 'best_weights', 'best_epoch', 'stopped_epoch', 'cooldown_counter')
+
+    def __init__(self, checkpoint, name, model, callbacks=(), every=1):
+        super().__init__()
+        self.checkpoint = checkpoint
+        self.name = name
+        self.callbacks = list(callbacks)
+        self.every = every
+        self.history = {}
+        self.completed = False
+        self._callback_state = None
+        self._weights_file = None
+        self._epoch = 0
+        self.set_model(model)
+
+    def restore(self):
+        """Load the last checkpoint, if resuming. Returns the epoch to continue from."""
+        state = self.checkpoint.load(self.name)
+        if state is None:
+            return 0
+        if not self.model.optimizer.built:
+            self.model.optimizer.build(self.model.trainable_variables)
+        self._weights_file = state['weights_file']
+        self.model.load_weights(self.checkpoint.path(self._weights_file, ''))
+        self.history = state['history']
+        self.completed = state['completed']
+        self._callback_state = state['callbacks']
+        self._epoch = state['epoch']
+        restore_rng_state(state['rng'])
+        print(f"[INFO] Resuming {self.name} after epoch {state['epoch']}"
+              f"{' (already completed)' if self.completed else ''}")
+        return state['epoch']
+
+    def on_train_begin(self, logs=None):
+        for callback, state in zip(self.callbacks, self._callback_state or ()):
+            for attr, value in state.items():
+                setattr(callback, attr, value)
+
+    def on_epoch_end(self, epoch, logs=None):
+        for key, value in (logs or {}).items():
+            self.history.setdefault(key, []).append(float(value))
+        self._epoch = epoch + 1
+        if self._epoch % self.every == 0:
+            self._save()
+
+    def on_train_end(self, logs=None):
+        self.completed = True
+        self._save()
+
+    def _save(self):
+        # Weights first, under a new name: the previous checkpoint stays valid until the state points here
+        weights_file = f"{self.name}-{self._epoch}{'-final' if self.completed else ''}.weights.h5"
+        self.model.save_weights(self.checkpoint.path(weights_file, ''), overwrite=True)
+        self.checkpoint.save(self.name, {
+            'epoch': self._epoch,
+            'weights_file': weights_file,
+            'history': self.history,
+            'completed': self.completed,
+            'callbacks': [{attr: getattr(callback, attr) for attr in self.CALLBACK_STATE if hasattr(callback, attr)}
+                          for callback in self.callbacks],
+            'rng': rng_state(),
+        })
+        if self._weights_file not in (None, weights_file):
+            os.remove(self.checkpoint.path(self._weights_file, ''))
+        self._weights_file = weights_file
+
+
+# ============================================================================
+# Worker processes
+# ============================================================================
+
+def optimizer_state(model):
+    """Values of the model's optimizer variables (iteration, learning rate, moments), or None if not built."""
+    if not model.optimizer.built:
+        return None
+    return [keras.ops.convert_to_numpy(variable) for variable in model.optimizer.variables]
+
+
+def set_optimizer_state(model, values):
+    """Load optimizer_state() values into the model's optimizer, building it first if needed."""
+    if not model.optimizer.built:
+        model.optimizer.build(model.trainable_variables)
+    for variable, value in zip(model.optimizer.variables, values):
+        variable.assign(value)
+
+
+def _worker(rank, conn, config):
+    """
+    Replica loop of one worker process. Messages on conn:
+        ('train', weights, learning_rate, steps) -> ('ok', weights, mean logs over the steps)
+        ('evaluate', weights)                    -> ('ok', logs on the validation shard, n sequences)
+        ('optimizer',)                           -> ('ok', optimizer_state())
+        None                                     -> exit
+    Any exception is sent back as ('error', traceback).
+    """
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(config['threads'])
+        tf.config.threading.set_inter_op_parallelism_threads(config['threads'])
+        seed = None if config['seed'] is None else config['seed'] + rank
+        if seed is not None:
+            keras.utils.set_random_seed(seed)
+
+        model = keras.models.model_from_json(config['model_json'])
+        model.compile_from_config(config['compile_config'])
+        if config['optimizer_state'] is not None:
+            set_optimizer_state(model, config['optimizer_state'])
+
+        options = tf.data.Options()
+        options.threading.private_threadpool_size = config['threads']
+        rows = np.load(config['rows_path'], mmap_mode='r')
+        starts, targets, weights = config['shard']
+        batches = iter(training_dataset(
+            sequence_dataset(rows, starts, config['sequence_length']), targets, weights, config['batch_size'],
+            config['shuffle_buffer'], seed=seed, repeat=True).with_options(options))
+        validation = None
+        if config['val_shard'] is not None:
+            starts, targets, weights = config['val_shard']
+            validation = training_dataset(sequence_dataset(rows, starts, config['sequence_length']),
+                                          targets, weights, config['batch_size']).with_options(options)
+            n_validation = len(starts)
+        del rows
+
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            if message[0] == 'train':
+                _, weights, learning_rate, steps = message
+                model.set_weights(weights)
+                model.optimizer.learning_rate.assign(learning_rate)
+                model.reset_metrics()
+                for _ in range(steps):
+                    x, y, w = next(batches)
+                    logs = model.train_on_batch(x, y, sample_weight=w, return_dict=True)
+                conn.send(('ok', model.get_weights(), logs))
+            elif message[0] == 'evaluate':
+                model.set_weights(message[1])
+                conn.send(('ok', model.evaluate(validation, verbose=0, return_dict=True), n_validation))
+            elif message[0] == 'optimizer':
+                conn.send(('ok', optimizer_state(model)))
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def average_weights(replicas):
+    """Element-wise mean of several get_weights() lists."""
+    return [np.mean(layer, axis=0, dtype=np.float64).astype(layer[0].dtype) for layer in zip(*replicas)]
+
+
+class WorkerPool:
+    """
+    Replicas of a compiled Keras model in separate worker processes, each with
+    one shard of the training (and validation) sequences. Use as a context manager.
+
+    Workers are new interpreters running this module (`--worker`) that connect
+    back over an authenticated local socket: TensorFlow is not fork-safe, and
+    multiprocessing's spawn would re-run the calling training script.
+    """
+
+    def __init__(self, model, rows, sequence_length, shards, val_shards=None, batch_size=32,
+                 shuffle_buffer=10000, seed=None, threads=None):
+        """
+        Args:
+            model: Compiled Keras model (architecture, optimizer with its state, loss and metrics are copied)
+            rows: (n_rows, n_features) scaled float32 rows the sequences are windows of
+            sequence_length: Timesteps per sequence
+            shards: One (starts, targets, sample weights) per worker
+            val_shards: One (starts, targets, sample weights) per worker, or None
+            batch_size: Sequences per batch, per worker
+            shuffle_buffer: Training sequences shuffled at a time by each worker
+            seed: Base random seed (worker i uses seed + i)
+            threads: TensorFlow threads per worker (default: the available cores split evenly)
+        """
+        self.workers = len(shards)
+        self.threads = threads or max(available_cores() // self.workers, 1)
+        # Workers memory-map the rows instead of receiving a pickled copy each
+        self._tmpdir = tempfile.mkdtemp(prefix='phase3_workers_')
+        rows_path = os.path.join(self._tmpdir, 'rows.npy')
+        np.save(rows_path, np.asarray(rows, dtype=np.float32))
+
+        authkey = os.urandom(32)
+        previous_timeout = socket.getdefaulttimeout()
+        # accept() below wakes up every second to check that no worker died while starting
+        socket.setdefaulttimeout(1.0)
+        try:
+            self._listener = Listener(('127.0.0.1', 0), authkey=authkey)
+        finally:
+            socket.setdefaulttimeout(previous_timeout)
+        host, port = self._listener.address
+        threads = str(self.threads)
+        env = dict(os.environ, SEPSIS_TRAINING_AUTHKEY=authkey.hex(), OMP_NUM_THREADS=threads,
+                   TF_NUM_INTRAOP_THREADS=threads, TF_NUM_INTEROP_THREADS=threads)
+        self._processes = [
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker', f'{host}:{port}'], env=env)
+            for _ in shards
+        ]
+        self._connections = []
+        try:
+            while len(self._connections) < self.workers:
+                try:
+                    self._connections.append(self._listener.accept())
+                except socket.timeout:
+                    if any(process.poll() is not None for process in self._processes):
+                        raise RuntimeError("A training worker exited while starting")
+        except BaseException:
+            self.close()
+            raise
+
+        for rank, (conn, shard) in enumerate(zip(self._connections, shards)):
+            conn.send((rank, {
+                'model_json': model.to_json(),
+                'compile_config': model.get_compile_config(),
+                'rows_path': rows_path,
+                'sequence_length': sequence_length,
+                'shard': shard,
+                'val_shard': val_shards[rank] if val_shards is not None else None,
+                'batch_size': batch_size,
+                'shuffle_buffer': shuffle_buffer,
+                'seed': seed,
+                'threads': self.threads,
+                'optimizer_state': optimizer_state(model),
+            }))
+
+    def _request(self, message):
+        for conn in self._connections:
+            conn.send(message)
+        replies = []
+        for rank, conn in enumerate(self._connections):
+            try:
+                reply = conn.recv()
+            except EOFError:
+                raise RuntimeError(f"Training worker {rank} exited") from None
+            if reply[0] == 'error':
+                raise RuntimeError(f"Training worker {rank} failed:\n{reply[1]}")
+            replies.append(reply[1:])
+        return replies
+
+    def train(self, weights, learning_rate, steps):
+        """
+        Train every replica for `steps` batches from `weights`.
+
+        Returns:
+            tuple: (averaged weights, logs averaged over the workers)
+        """
+        replies = self._request(('train', weights, float(learning_rate), steps))
+        logs = {key: float(np.mean([reply_logs[key] for _, reply_logs in replies])) for key in replies[0][1]}
+        return average_weights([replica for replica, _ in replies]), logs
+
+    def evaluate(self, weights):
+        """Validation logs of `weights`, averaged over the shards by their size."""
+        replies = self._request(('evaluate', weights))
+        sizes = np.array([n for _, n in replies], dtype=np.float64)
+        return {key: float(np.dot([logs[key] for logs, _ in replies], sizes) / sizes.sum())
+                for key in replies[0][0]}
+
+    def optimizer_state(self):
+        """The replicas' optimizer variables, averaged (None before the first train())."""
+        replicas = [state for state, in self._request(('optimizer',))]
+        return None if replicas[0] is None else average_weights(replicas)
+
+    def close(self):
+        for conn in self._connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            conn.close()
+        for process in self._processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._listener.close()
+        shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def shard(workers, starts, targets, weights):
+    """
+    Split sequences into `workers` interleaved shards of equal size (the last
+    len(starts) % workers sequences are dropped so every replica takes the same
+    number of steps per epoch).
+
+    Returns:
+        list: one (starts, targets, weights) per worker
+
+    Raises:
+        ValueError: fewer sequences than workers (the shards would be empty)
+    """
+    if len(starts) < workers:
+        raise ValueError(f"{len(starts)} sequences cannot be split over {workers} workers; "
+                         f"use at most {len(starts)} workers or more data")
+    size = len(starts) // workers
+    starts, targets, weights = np.asarray(starts), np.asarray(targets), np.asarray(weights, dtype=np.float32)
+    return [(starts[rank::workers][:size], targets[rank::workers][:size], weights[rank::workers][:size])
+            for rank in range(workers)]
+
+
+# ============================================================================
+# Training
+# ============================================================================
+
+def fit_data_parallel(model, rows, sequence_length, fit_starts, fit_targets, fit_weights,
+                      val_starts, val_targets, val_weights, workers, epochs, batch_size=32,
+                      shuffle_buffer=10000, sync_steps=SYNC_STEPS, callbacks=None, seed=None, initial_epoch=0):
+    """
+    Train a compiled Keras model on `workers` local processes by parameter averaging.
+
+    An epoch is one pass of every worker over its shard of the training
+    sequences (so the same number of sequences as one model.fit epoch), with
+    the replicas averaged every `sync_steps` batches. Callbacks see the
+    averaged model once per epoch, with the training metrics averaged over
+    the workers and val_* metrics from the validation sequences. The
+    model's optimizer starts the workers' optimizers and receives their
+    averaged variables after every epoch, so EpochCheckpoint saves them.
+
+    Args:
+        model: Compiled Keras model; holds the averaged weights afterwards
+        rows: (n_rows, n_features) scaled float32 rows
+        sequence_length: Timesteps per sequence
+        fit_starts, fit_targets, fit_weights: Training sequences (start rows), targets, sample weights
+        val_starts, val_targets, val_weights: Validation sequences, targets, sample weights
+        workers: Number of worker processes
+        epochs: Maximum number of epochs
+        batch_size: Sequences per batch, per worker
+        shuffle_buffer: Training sequences shuffled at a time by each worker
+        sync_steps: Batches each worker trains between two weight averages
+        callbacks: Keras callbacks (EarlyStopping, ReduceLROnPlateau, ...)
+        seed: Base random seed
+        initial_epoch: Epoch to start at (when resuming, see EpochCheckpoint)
+
+    Returns:
+        keras.callbacks.History: as from model.fit, plus the seconds of each epoch
+
+    Raises:
+        ValueError: fewer training or validation sequences than workers
+    """
+    shards = shard(workers, fit_starts, fit_targets, fit_weights)
+    val_shards = shard(workers, val_starts, val_targets, val_weights)
+    steps_per_epoch = max(len(shards[0][0]) // batch_size, 1)
+    callback_list = keras.callbacks.CallbackList(callbacks, add_history=True, model=model)
+    print(f"  Data-parallel training: {workers} workers, {len(shards[0][0])} sequences and "
+          f"{steps_per_epoch} steps per worker per epoch, weights averaged every {sync_steps} steps")
+
+    model.stop_training = False
+    weights = model.get_weights()
+    with WorkerPool(model, rows, sequence_length, shards, val_shards, batch_size, shuffle_buffer, seed) as pool:
+        callback_list.on_train_begin()
+        for epoch in range(initial_epoch, epochs):
+            callback_list.on_epoch_begin(epoch)
+            start = time.perf_counter()
+            learning_rate = float(keras.ops.convert_to_numpy(model.optimizer.learning_rate))
+            round_logs = []
+            for first_step in range(0, steps_per_epoch, sync_steps):
+                steps = min(sync_steps, steps_per_epoch - first_step)
+                weights, logs = pool.train(weights, learning_rate, steps)
+                round_logs.append((steps, logs))
+            logs = {key: sum(steps * logs[key] for steps, logs in round_logs) / steps_per_epoch
+                    for key in round_logs[0][1]}
+            logs.update({f'val_{key}': value for key, value in pool.evaluate(weights).items()})
+            logs['seconds'] = time.perf_counter() - start
+            model.set_weights(weights)
+            set_optimizer_state(model, pool.optimizer_state())
+
+            print(f"Epoch {epoch + 1}/{epochs} - {logs['seconds']:.1f}s - " +
+                  " - ".join(f"{key}: {value:.4f}" for key, value in logs.items() if key != 'seconds'))
+            callback_list.on_epoch_end(epoch, logs)
+            # Callbacks may have changed the weights (restore_best_weights) or stopped training
+            weights = model.get_weights()
+            if model.stop_training:
+                break
+        callback_list.on_train_end()
+    return model.history
+
+
+def scaling_report(model, rows, sequence_length, starts, targets, weights, worker_counts=None,
+                   batch_size=32, rounds=3, sync_steps=SYNC_STEPS, shuffle_buffer=10000, seed=None):
+    """
+    Training throughput of fit_data_parallel() for each worker count.
+
+    For every count, a pool is started on shards of the given sequences and,
+    after one warm-up round (graph tracing), `rounds` rounds of `sync_steps`
+    batches per worker are timed, weight averaging included. The model's
+    weights are not changed.
+
+    Returns:
+        list: one dict per worker count with workers, threads_per_worker,
+              seconds_per_round, sequences_per_second, speedup (over the
+              first count) and efficiency (speedup per worker, relative to it)
+    """
+    worker_counts = worker_counts or default_worker_counts()
+    learning_rate = float(keras.ops.convert_to_numpy(model.optimizer.learning_rate))
+    report = []
+    for workers in worker_counts:
+        with WorkerPool(model, rows, sequence_length, shard(workers, starts, targets, weights),
+                        batch_size=batch_size, shuffle_buffer=shuffle_buffer, seed=seed) as pool:
+            averaged, _ = pool.train(model.get_weights(), learning_rate, sync_steps)
+            start = time.perf_counter()
+            for _ in range(rounds):
+                averaged, _ = pool.train(averaged, learning_rate, sync_steps)
+            seconds = (time.perf_counter() - start) / rounds
+            threads = pool.threads
+        report.append({
+            'workers': workers,
+            'threads_per_worker': threads,
+            'seconds_per_round': seconds,
+            'sequences_per_second': workers * sync_steps * batch_size / seconds,
+        })
+    base = report[0]
+    for row in report:
+        row['speedup'] = row['sequences_per_second'] / base['sequences_per_second']
+        row['efficiency'] = row['speedup'] * base['workers'] / row['workers']
+    return report
+
+
+def print_scaling_report(report):
+    print(f"\n⚙️  DATA-PARALLEL SCALING ({available_cores()} cores):")
+    print(f"  {'workers':>8}{'threads':>9}{'seq/s':>10}{'speedup':>9}{'efficiency':>12}")
+    for row in report:
+        print(f"  {row['workers']:>8}{row['threads_per_worker']:>9}{row['sequences_per_second']:>10.0f}"
+              f"{row['speedup']:>8.2f}x{row['efficiency']:>12.0%}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != '--worker':
+        sys.exit("sequence_training.py is imported by train_model_phase3_lstm.py; "
+                 "it only runs as a WorkerPool worker (--worker host:port)")
+    address_host, address_port = sys.argv[2].rsplit(':', 1)
+    connection = Client((address_host, int(address_port)),
+                        authkey=bytes.fromhex(os.environ.pop('SEPSIS_TRAINING_AUTHKEY')))
+    worker_rank, worker_config = connection.recv()
+    _worker(worker_rank, connection, worker_config)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Request latency instrumentation and Prometheus-style metrics.
+
+Each request gets a RequestTimer (held in a context variable, so it follows
+the request across helper functions and into executor threads that run with
+a copied context). Pipeline code wraps its work in `stage(name)`:
+
+    parse      form / JSON parsing into feature arrays
+    scale      StandardScaler transforms
+    inference  MLP predict_proba / LSTM predict
+    rules      rule-based checks and explanation HTML
+    render     Jinja template rendering
+
+Time spent in a stage is summed over the request and observed once per
+request when it finishes, labelled with the model version that was live
+when the request started. Outside a request (canary checks, scripts) stage()
+does nothing but a context variable lookup.
+
+Metrics are kept per process; under gunicorn every worker exposes its own.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond MLP scoring up to slow LSTM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current_timer = contextvars.ContextVar('sepsis_request_timer', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    """Thread-safe labelled histogram with fixed buckets"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), total, sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), count, total)
+                        for labels, (counts, count, total) in sorted(self._series.items())]
+        for labels, counts, count, total in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                label_str = _format_labels(self.labelnames, labels, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class Counter:
+    """Thread-safe labelled counter"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'sepsis_request_duration_seconds', 'End-to-end request latency.',
+    ('endpoint', 'status', 'model_version')
+)
+STAGE_DURATION = Histogram(
+    'sepsis_stage_duration_seconds', 'Time spent per pipeline stage within a request.',
+    ('endpoint', 'stage')
+)
+ERRORS = Counter(
+    'sepsis_errors_total', 'Prediction errors caught by the views, by exception type.',
+    ('endpoint', 'error')
+)
+
+
+class RequestTimer:
+    """Accumulates per-stage durations for one request"""
+
+    def __init__(self, endpoint, model_version='none'):
+        self.endpoint = endpoint or 'unknown'
+        # Version live when the request started; a hot swap during the request
+        # does not move it to the new version's series
+        self.model_version = model_version
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage_name, seconds):
+        # Stages of one request may run on several executor threads
+        with self._lock:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+
+def start_request(endpoint, model_version='none'):
+    """Begin timing a request in the current context, served by model_version."""
+    timer = RequestTimer(endpoint, model_version)
+    _current_timer.set(timer)
+    return timer
+
+
+def finish_request(status):
+    """Observe the current request's total and stage durations, then clear it."""
+    timer = _current_timer.get()
+    if timer is None:
+        return
+    _current_timer.set(None)
+    REQUEST_DURATION.observe(time.perf_counter() - timer.started, timer.endpoint, str(status), timer.model_version)
+    for stage_name, seconds in timer.stages.items():
+        STAGE_DURATION.observe(seconds, timer.endpoint, stage_name)
+
+
+@contextmanager
+def stage(name):
+    """Attribute the enclosed block to a pipeline stage of the current request."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
+
+
+def record_error(error):
+    """Count an exception handled by a view of the current request."""
+    timer = _current_timer.get()
+    ERRORS.inc(timer.endpoint if timer is not None else 'unknown', type(error).__name__)
+
+
+def render_metrics(cache_stats, registry_status):
+    """
+    Prometheus text exposition (format 0.0.4) of all metrics.
+
+    Args:
+        cache_stats: PredictionCache.stats() of this worker
+        registry_status: ModelRegistry.status() of this worker
+    """
+    lines = []
+    for metric in (REQUEST_DURATION, STAGE_DURATION, ERRORS):
+        lines.extend(metric.collect())
+
+    lines += [
+        "# HELP sepsis_model_info Model version currently served.",
+        "# TYPE sepsis_model_info gauge",
+        "sepsis_model_info" + _format_labels(
+            ('version', 'source', 'phase3_available'),
+            (registry_status['version'], registry_status['source'], str(registry_status['phase3_available']).lower())
+        ) + " 1",
+        "# HELP sepsis_model_reloads_total Model bundles swapped in by the registry.",
+        "# TYPE sepsis_model_reloads_total counter",
+        f"sepsis_model_reloads_total {registry_status['reloads']}",
+    ]
+
+    for key in ('hits', 'misses', 'evictions', 'expirations'):
+        name = f"sepsis_prediction_cache_{key}_total"
+        lines += [f"# HELP {name} Phase 1 prediction cache {key}.", f"# TYPE {name} counter",
+                  f"{name} {cache_stats[key]}"]
+    for key, documentation in (('hit_ratio', 'Hits / lookups since start.'), ('size', 'Entries currently cached.')):
+        name = f"sepsis_prediction_cache_{key}"
+        lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge",
+                  f"{name} {_format_value(cache_stats[key])}"]
+
+    return '\n'.join(lines) + '\n'
+
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Microbenchmarks for the per-request hot path, with regression thresholds.
+
+    python -m pytest test_benchmarks.py                           # compare with stored baseline
+    SEPSIS_BENCH_SAVE=1 python -m pytest test_benchmarks.py       # record a new baseline
+    SEPSIS_BENCH_TOLERANCE=0.10 python -m pytest test_benchmarks.py
+
+Each benchmark times a function over a fixed batch of synthetic patients
+(benchmark_serving.synthetic_patient) and keeps the best of several repeats,
+which is the least noisy estimate of its cost. A benchmark fails when it is
+more than SEPSIS_BENCH_TOLERANCE (default 25%) slower than the baseline in
+benchmarks/baseline.json on RETRIES consecutive measurements, so a burst of
+load from elsewhere on the machine does not fail the suite. Baselines are stored per machine fingerprint;
+on a machine without one the comparison is skipped.
+"""
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+import app_simple
+from benchmark_serving import FEATURE_DISTRIBUTIONS, synthetic_patient
+from model_artifact import load_scaler, save_artifact
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+TOLERANCE = float(os.environ.get('SEPSIS_BENCH_TOLERANCE', 0.25))
+SAVE_BASELINE = os.environ.get('SEPSIS_BENCH_SAVE') == '1'
+N_PATIENTS = 50
+REPEAT = 7
+RETRIES = 3
+
+MACHINE = f"{platform.machine()}-{platform.processor() or 'cpu'}-{os.cpu_count()}cores-py{sys.version_info.major}.{sys.version_info.minor}"
+
+_results = {}
+
+
+def _load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {}
+    with open(BASELINE_PATH) as f:
+        return json.load(f)
+
+
+def measure(func, inputs):
+    """Best-of-REPEAT seconds per call of func over a list of argument tuples."""
+    def run():
+        for args in inputs:
+            func(*args)
+
+    number, _ = timeit.Timer(run).autorange()
+    best = min(timeit.repeat(run, number=number, repeat=REPEAT))
+    return best / number / len(inputs)
+
+
+def check(name, func, inputs):
+    """Benchmark func, record the result and fail if it regressed past TOLERANCE."""
+    seconds_per_call = measure(func, inputs)
+    baseline = _load_baseline().get(MACHINE, {}).get(name)
+    if not SAVE_BASELINE and baseline is not None:
+        for _ in range(RETRIES - 1):
+            if seconds_per_call <= baseline * (1 + TOLERANCE):
+                break
+            seconds_per_call = min(seconds_per_call, measure(func, inputs))
+    _results[name] = seconds_per_call
+    if SAVE_BASELINE:
+        return
+    if baseline is None:
+        pytest.skip(f"no baseline for {name} on {MACHINE}; run with SEPSIS_BENCH_SAVE=1")
+    slowdown = seconds_per_call / baseline - 1
+    assert slowdown <= TOLERANCE, (
+        f"{name}: {seconds_per_call * 1e6:.1f} us/call is {slowdown:.0%} slower than "
+        f"baseline {baseline * 1e6:.1f} us/call (tolerance {TOLERANCE:.0%})"
+    )
+
+
+@pytest.fixture(scope='module', autouse=True)
+def save_baseline():
+    yield
+    if SAVE_BASELINE and _results:
+        baselines = _load_baseline()
+        baselines.setdefault(MACHINE, {}).update(_results)
+        os.makedirs(os.path.dirname(BASELINE_PATH), exist_ok=True)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+
+
+@pytest.fixture(scope='module')
+def patients():
+    rng = np.random.default_rng(0)
+    return [synthetic_patient(rng, sepsis_app.FEATURE_NAMES) for _ in range(N_PATIENTS)]
+
+
+@pytest.fixture(scope='module')
+def histories():
+    from phase3_utils import FEATURE_COLUMNS
+    rng = np.random.default_rng(1)
+    # 1 to 24 hours of data per patient, so both the padding and truncation paths run
+    return [
+        [[float(p.get(col, 0)) for col in FEATURE_COLUMNS]
+         for p in (synthetic_patient(rng, FEATURE_COLUMNS) for _ in range(rng.integers(1, 25)))]
+        for _ in range(N_PATIENTS)
+    ]
+
+
+@pytest.fixture(scope='module')
+def phase3_predictor():
+    from phase3_utils import FEATURE_COLUMNS, Phase3LSTMPredictor
+    # Scaler fitted to the synthetic distributions, as an artifact file
+    path = os.path.join(tempfile.mkdtemp(), 'scaler_phase3.safetensors')
+    save_artifact(path, {
+        'mean': np.array([FEATURE_DISTRIBUTIONS[col][0] for col in FEATURE_COLUMNS]),
+        'scale': np.array([FEATURE_DISTRIBUTIONS[col][1] for col in FEATURE_COLUMNS]),
+    }, 'standard-scaler', {'feature_names': FEATURE_COLUMNS})
+    predictor = Phase3LSTMPredictor(scaler_path=path)
+    # create_sequence only needs the scaler, which is set even if the LSTM cannot load here
+    if not hasattr(predictor, 'scaler'):
+        predictor.scaler = load_scaler(path)
+    return predictor
+
+
+def test_get_abnormal_features(patients):
+    check('get_abnormal_features', sepsis_app.get_abnormal_features, [(p,) for p in patients])
+
+
+def test_detect_vital_instability(patients):
+    check('detect_vital_instability', sepsis_app.detect_vital_instability, [(p,) for p in patients])
+
+
+def test_calculate_continuous_risk_trajectory(patients):
+    rng = np.random.default_rng(2)
+    inputs = [(p, float(r)) for p, r in zip(patients, rng.random(len(patients)))]
+    check('calculate_continuous_risk_trajectory', sepsis_app.calculate_continuous_risk_trajectory, inputs)
+
+
+def test_generate_explanation(patients):
+    check('generate_explanation', sepsis_app.generate_explanation, [(p, 0, 0) for p in patients])
+
+
+def test_calculate_sepsis_risk(patients):
+    check('calculate_sepsis_risk', app_simple.calculate_sepsis_risk, [(p,) for p in patients])
+
+
+def test_create_sequence(phase3_predictor, histories):
+    check('Phase3LSTMPredictor.create_sequence', phase3_predictor.create_sequence, [(h,) for h in histories])
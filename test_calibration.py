@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Probability calibration (training_pipeline.py calibrate stage), its lookup
+table at serving time and the decision threshold in app.assess_phase1.
+
+    python -m pytest test_calibration.py
+
+Calibration tables must be monotone and map every score into [0, 1], and the
+stage must use the method it is asked for. The threshold it picks is
+exported in the artifact and must be the one assess_phase1 receives; it may
+fall anywhere in (0, 1), not only between the 20% and 65% band edges. Every
+risk must get exactly one status, high risk exactly from the threshold up,
+and band labels whose ranges are ordered and contain the risk.
+"""
+
+import os
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+import training_pipeline
+from model_registry import ModelBundle, load_sklearn_artifacts
+from prediction_cache import PredictionCache
+from training_pipeline import FEATURE_NAMES, LABEL, PLATT_TABLE_POINTS, calibrate_stage, calibration_table
+
+# No abnormal vitals, and one mildly abnormal vital (not unstable)
+FORMS = [{'HR': '80', 'Temp': '37'}, {'HR': '105', 'Temp': '37'}]
+
+
+def label_range(label):
+    """(low, high) percentages of a risk label such as 'High Risk (65-80%)'; high is None for '>80%'."""
+    match = re.search(r'\((\d+)-(\d+)%\)', label)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    match = re.search(r'\(>(\d+)%\)', label)
+    return (int(match.group(1)), None) if match else None
+
+
+@pytest.mark.parametrize('threshold', [0.05, 0.15, 0.5, 0.7, 0.9])
+@pytest.mark.parametrize('form', FORMS)
+def test_bands_follow_threshold(threshold, form):
+    for risk in np.linspace(0, 1, 101):
+        assessment = sepsis_app.assess_phase1(form, float(risk), threshold)
+        status, label = assessment['prediction_status'], assessment['risk_label']
+        assert (status == 'high_risk') == (risk >= threshold), (risk, label)
+        assert status != 'normal' or risk < threshold
+
+        bounds = label_range(label)
+        if bounds is None:
+            continue
+        low, high = bounds
+        assert high is None or low < high, label
+        if status == 'high_risk':
+            # Labels round to whole percentages
+            assert low - 0.5 <= risk * 100 and (high is None or risk * 100 < high + 0.5), (risk, label)
+        else:
+            assert high is None or high <= round(threshold * 100), label
+
+
+def miscalibrated_scores(rng, n):
+    """Raw scores in [0, 1] whose true event rate is raw ** 2 (overconfident)."""
+    raw = rng.random(n)
+    return raw, (rng.random(n) < raw ** 2).astype(int)
+
+
+def brier(p, y):
+    return float(np.mean((p - y) ** 2))
+
+
+@pytest.mark.parametrize('method', ['isotonic', 'platt'])
+def test_calibration_table_is_monotone_probability_map(method):
+    rng = np.random.default_rng(0)
+    raw, y = miscalibrated_scores(rng, 4000)
+    table_x, table_y = calibration_table(raw, y, method)
+    assert np.all(np.diff(table_x) >= 0) and np.all(np.diff(table_y) >= 0)
+    assert table_y.min() >= 0 and table_y.max() <= 1
+
+    # Any score, inside or outside the validation range, maps into [0, 1]
+    calibrated = np.interp(np.linspace(-0.5, 1.5, 1001), table_x, table_y)
+    assert np.all((calibrated >= 0) & (calibrated <= 1)) and np.all(np.diff(calibrated) >= 0)
+
+    # Held-out scores get closer to their event rate
+    test_raw, test_y = miscalibrated_scores(rng, 4000)
+    assert brier(np.interp(test_raw, table_x, table_y), test_y) < brier(test_raw, test_y)
+
+
+def test_calibration_methods():
+    from sklearn.isotonic import IsotonicRegression
+    raw, y = miscalibrated_scores(np.random.default_rng(1), 4000)
+
+    # Isotonic: the fitted step points themselves
+    table_x, table_y = calibration_table(raw, y, 'isotonic')
+    iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(raw, y)
+    np.testing.assert_allclose(np.interp(raw, table_x, table_y), iso.predict(raw), atol=1e-12)
+
+    # Platt: a strictly increasing sigmoid tabulated over the whole [0, 1] range
+    table_x, table_y = calibration_table(raw, y, 'platt')
+    assert table_x[0] == 0 and table_x[-1] == 1 and len(table_x) >= PLATT_TABLE_POINTS
+    assert np.all(np.diff(table_y) > 0)
+
+
+@pytest.mark.parametrize('metric', ['youden', 'f1'])
+def test_threshold_maximises_metric(metric):
+    from sklearn.metrics import f1_score, roc_curve
+    rng = np.random.default_rng(2)
+    raw, y = miscalibrated_scores(rng, 3000)
+    result = calibrate_stage({'y_val': y}, {'val_proba': raw}, 'isotonic', metric)
+    threshold = float(result['optimal_threshold'])
+    assert 0 <= threshold <= 1
+
+    calibrated = np.interp(raw, result['table_x'], result['table_y'])
+    candidates = np.unique(calibrated)
+    if metric == 'f1':
+        scores = [f1_score(y, calibrated >= t) for t in candidates]
+        assert f1_score(y, calibrated >= threshold) == pytest.approx(max(scores))
+    else:
+        fpr, tpr, _ = roc_curve(y, calibrated)
+        predicted = calibrated >= threshold
+        j = predicted[y == 1].mean() - predicted[y == 0].mean()
+        assert j == pytest.approx(np.max(tpr - fpr))
+
+
+@pytest.fixture(scope='module')
+def data_path(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    X = 10 + 3 * rng.standard_normal((600, len(FEATURE_NAMES)))
+    y = (X[:, 0] + X[:, 1] + 3 * rng.standard_normal(600) > 22).astype(int)
+    df = pd.DataFrame(X, columns=FEATURE_NAMES)
+    df[LABEL] = y
+    path = tmp_path_factory.mktemp('data') / 'sepsis.csv'
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['training_pipeline.py', *args])
+    training_pipeline.main()
+
+
+def test_exported_threshold_reaches_assessment(monkeypatch, tmp_path, data_path):
+    monkeypatch.chdir(tmp_path)
+    common = ['--data', data_path, '--classifier', 'mlp_fast', '--cache-dir', str(tmp_path / 'cache')]
+    run_main(monkeypatch, *common, '--calibration', 'platt', '--threshold-metric', 'f1', '--export')
+    platt = load_sklearn_artifacts()
+    # The stage follows --calibration: the same model gets another table
+    run_main(monkeypatch, *common, '--calibration', 'isotonic', '--export')
+    isotonic = load_sklearn_artifacts()
+    assert len(platt['calibration'][0]) >= PLATT_TABLE_POINTS
+    assert len(isotonic['calibration'][0]) != len(platt['calibration'][0])
+    assert platt['threshold_info']['calibration'] == 'platt'
+    assert isotonic['threshold_info']['metric'] == 'youden'
+
+    bundle = ModelBundle('calibration-test', **isotonic)
+    threshold = isotonic['threshold_info']['optimal_threshold']
+    assert bundle.optimal_threshold == threshold and bundle.calibration is not None
+
+    # Served risks are the raw scores looked up in the exported table
+    form = {'HR': '14', 'O2Sat': '13', 'Temp': '9'}
+    X = sepsis_app.parse_phase1_features(form)
+    raw = bundle.model.predict_proba(sepsis_app.scale_with_imputation(bundle.scaler, X))[:, 1]
+    np.testing.assert_allclose(sepsis_app.score_phase1(X, bundle), np.interp(raw, *bundle.calibration), atol=1e-6)
+
+    received = []
+    assess = sepsis_app.assess_phase1
+
+    def recording_assess(form_data, current_risk, threshold=0.5):
+        received.append(threshold)
+        return assess(form_data, current_risk, threshold)
+
+    monkeypatch.setattr(sepsis_app, 'assess_phase1', recording_assess)
+    monkeypatch.setattr(sepsis_app, 'prediction_cache', PredictionCache(maxsize=0))
+    sepsis_app.phase1_context(form, bundle)
+    assert received == [threshold]
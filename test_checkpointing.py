@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Resumable training (checkpointing.py, sequence_training.EpochCheckpoint).
+
+    python -m pytest test_checkpointing.py
+
+A run interrupted after a checkpoint and resumed with --resume semantics must
+end where an uninterrupted run ends: bit for bit for the Phase 1 MLP, and
+with the weights, optimizer state, history and callback state of the last
+checkpoint for a Keras model (skipped without TensorFlow).
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pytest
+from sklearn.neural_network import MLPClassifier
+
+from checkpointing import TrainingCheckpoint, fit_mlp
+
+INTERRUPT_AT_EPOCH = None
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptibleMLP(MLPClassifier):
+    """MLPClassifier whose partial_fit fails once it reaches INTERRUPT_AT_EPOCH epochs."""
+
+    def partial_fit(self, X, y, classes=None):
+        self.epochs_ = getattr(self, 'epochs_', 0) + 1
+        if self.epochs_ == INTERRUPT_AT_EPOCH:
+            raise Interrupted
+        return super().partial_fit(X, y, classes=classes)
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((600, 27))
+    return X, (X[:, 0] + 0.5 * X[:, 1] > 0).astype(int)
+
+
+def new_mlp():
+    return InterruptibleMLP(hidden_layer_sizes=(16, 8), learning_rate_init=1e-3, max_iter=12, early_stopping=True,
+                            validation_fraction=0.1, n_iter_no_change=50, random_state=1)
+
+
+def test_checkpoint_config_mismatch():
+    directory = tempfile.mkdtemp()
+    TrainingCheckpoint(directory, {'data': 'a'}).save('scaler', 1)
+    assert TrainingCheckpoint(directory, {'data': 'a'}).load('scaler') is None
+    assert TrainingCheckpoint(directory, {'data': 'a'}, resume=True).load('scaler') == 1
+    with pytest.raises(ValueError):
+        TrainingCheckpoint(directory, {'data': 'b'}, resume=True).load('scaler')
+
+
+def test_resumed_mlp_matches_uninterrupted(data):
+    global INTERRUPT_AT_EPOCH
+    X, y = data
+    expected = fit_mlp(new_mlp(), X, y)
+
+    directory = os.path.join(tempfile.mkdtemp(), 'phase1')
+    INTERRUPT_AT_EPOCH = 8
+    try:
+        with pytest.raises(Interrupted):
+            fit_mlp(new_mlp(), X, y, TrainingCheckpoint(directory, {'data': 'test'}), every=5)
+    finally:
+        INTERRUPT_AT_EPOCH = None
+    resumed = fit_mlp(new_mlp(), X, y, TrainingCheckpoint(directory, {'data': 'test'}, resume=True), every=5)
+
+    assert resumed.n_iter_ == expected.n_iter_ == 12
+    assert resumed.early_stopping and resumed.validation_scores_ == expected.validation_scores_
+    for W, W_expected in zip(resumed.coefs_ + resumed.intercepts_, expected.coefs_ + expected.intercepts_):
+        np.testing.assert_array_equal(W, W_expected)
+
+    # A finished run is not trained again
+    again = fit_mlp(new_mlp(), X, y, TrainingCheckpoint(directory, {'data': 'test'}, resume=True))
+    np.testing.assert_array_equal(again.coefs_[0], expected.coefs_[0])
+
+    with pytest.raises(ValueError):
+        fit_mlp(new_mlp().set_params(max_iter=20), X, y, TrainingCheckpoint(directory, {'data': 'test'}, resume=True))
+
+
+def test_keras_epoch_checkpoint():
+    keras = pytest.importorskip('tensorflow').keras
+    from sequence_training import EpochCheckpoint
+
+    def compiled_model():
+        keras.utils.set_random_seed(0)
+        inputs = keras.Input((12, 27))
+        model = keras.Model(inputs, keras.layers.Dense(1, activation='sigmoid')(keras.layers.LSTM(8)(inputs)))
+        model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.01), loss='binary_crossentropy')
+        return model
+
+    class InterruptAfter(keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            if epoch == 1:
+                raise Interrupted
+
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((128, 12, 27)).astype(np.float32)
+    y = (X[:, -1, :1] > 0).astype(np.float32)
+    directory = os.path.join(tempfile.mkdtemp(), 'phase3')
+
+    model = compiled_model()
+    early_stop = keras.callbacks.EarlyStopping(monitor='loss', patience=10)
+    checkpoint = EpochCheckpoint(TrainingCheckpoint(directory, {'data': 'test'}), 'lstm', model, [early_stop])
+    assert checkpoint.restore() == 0
+    with pytest.raises(Interrupted):
+        model.fit(X, y, batch_size=32, epochs=4, callbacks=[early_stop, checkpoint, InterruptAfter()], verbose=0)
+    weights, iterations = model.get_weights(), int(model.optimizer.iterations)
+
+    resumed_model = compiled_model()
+    resumed_stop = keras.callbacks.EarlyStopping(monitor='loss', patience=10)
+    resumed = EpochCheckpoint(TrainingCheckpoint(directory, {'data': 'test'}, resume=True), 'lstm',
+                              resumed_model, [resumed_stop])
+    assert resumed.restore() == 2
+    assert int(resumed_model.optimizer.iterations) == iterations == 8
+    for W, W_saved in zip(resumed_model.get_weights(), weights):
+        np.testing.assert_array_equal(W, W_saved)
+
+    resumed_model.fit(X, y, batch_size=32, epochs=4, initial_epoch=2, callbacks=[resumed_stop, resumed], verbose=0)
+    assert len(resumed.history['loss']) == 4 and resumed.completed
+    assert resumed_stop.best == min(resumed.history['loss'])
+    assert [f for f in os.listdir(directory) if f.endswith('.weights.h5')] == ['lstm-4-final.weights.h5']
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Ensemble scorer (ensemble.py) and the /predict_ensemble endpoint.
+
+    python -m pytest test_ensemble.py
+
+The vectorised rule score must equal app_simple.calculate_sepsis_risk() on
+every row, in particular on values at and just beside each rule's cut-off.
+Fitted weights must survive the `ensemble.py fit` file and load_weights(),
+and the endpoint must combine the components with the weights it reports.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+import ensemble
+from app_simple import calculate_sepsis_risk
+from model_registry import ModelBundle
+
+# Cut-offs used by the rules for each RULE_FEATURES column
+CUTOFFS = {
+    'Temp': [34, 36.0, 38.0, 40],
+    'HR': [40, 50, 60, 90, 100, 130],
+    'Resp': [20, 22, 30],
+    'WBC': [3, 4, 12, 15],
+    'O2Sat': [93],
+    'SBP': [90],
+    'Lactate': [2.0],
+    'Creatinine': [1.5],
+}
+
+
+def edge_forms(rng, n):
+    """Form dicts with every value at, just below or just above a cut-off, or missing."""
+    forms = []
+    for _ in range(n):
+        form = {}
+        for feature, cutoffs in CUTOFFS.items():
+            choice = rng.integers(len(cutoffs) + 1)
+            if choice < len(cutoffs):
+                form[feature] = str(round(cutoffs[choice] + rng.choice([-0.01, 0.0, 0.01]), 2))
+            elif rng.random() < 0.5:
+                form[feature] = ''
+        forms.append(form)
+    return forms
+
+
+def test_rule_scores_match_calculate_sepsis_risk():
+    forms = edge_forms(np.random.default_rng(0), 3000)
+    # Every single abnormal value on its own, and the all-missing row
+    forms += [{feature: str(value)} for feature, cutoffs in CUTOFFS.items() for cutoff in cutoffs
+              for value in (cutoff - 0.01, cutoff, cutoff + 0.01)]
+    forms += [{}, {'HR': 'abc', 'Temp': ' '}]
+
+    scores = ensemble.rule_risk_scores(ensemble.rule_features(forms))
+    expected = [calculate_sepsis_risk(form)[0] for form in forms]
+    np.testing.assert_allclose(scores, expected)
+    # Every rule outcome is exercised
+    assert len(set(expected)) >= 8
+
+
+def test_fit_weights_roundtrip(monkeypatch):
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, 2000)
+    scores = {'mlp': np.clip(0.3 * labels + 0.35 + 0.15 * rng.standard_normal(2000), 0, 1),
+              'rules': np.clip(0.1 * labels + 0.45 + 0.15 * rng.standard_normal(2000), 0, 1),
+              'lstm': rng.random(2000)}
+    weights = ensemble.fit_weights(scores, labels)
+    assert sum(weights.values()) == pytest.approx(1.0)
+    assert weights['mlp'] > weights['rules'] > weights['lstm']
+    # An uninformative component ends up with (close to) no weight
+    assert weights['lstm'] < 0.05
+
+    # `ensemble.py fit` on batch_score.py output, read back by load_weights()
+    directory = tempfile.mkdtemp()
+    scores_path = os.path.join(directory, 'scores.csv')
+    df = pd.DataFrame({column: scores[name] for name, column in ensemble.SCORE_COLUMNS.items()})
+    df['SepsisLabel'] = labels
+    df.to_csv(scores_path, index=False)
+    weights_path = os.path.join(directory, 'ensemble_weights.json')
+    monkeypatch.setattr(sys, 'argv', ['ensemble.py', 'fit', scores_path, '--output', weights_path])
+    ensemble.main()
+
+    monkeypatch.delenv('SEPSIS_ENSEMBLE_WEIGHTS', raising=False)
+    monkeypatch.setattr(ensemble, 'WEIGHTS_PATH', weights_path)
+    loaded = ensemble.load_weights()
+    assert loaded == pytest.approx(weights)
+    with open(weights_path) as f:
+        assert json.load(f)['rows'] == len(df)
+
+    monkeypatch.setenv('SEPSIS_ENSEMBLE_WEIGHTS', 'mlp=1,rules=1')
+    assert ensemble.load_weights() == {'mlp': 1.0, 'rules': 1.0, 'lstm': 0.0}
+
+
+def test_combine_renormalises_available_components():
+    components = {'mlp': np.array([0.2, 0.8]), 'rules': np.array([0.05, 0.95]), 'lstm': None}
+    risks, used = ensemble.combine(components, {'mlp': 0.5, 'rules': 0.2, 'lstm': 0.3})
+    assert used == pytest.approx({'mlp': 5 / 7, 'rules': 2 / 7, 'lstm': 0.0})
+    np.testing.assert_allclose(risks, [(5 * 0.2 + 2 * 0.05) / 7, (5 * 0.8 + 2 * 0.95) / 7], rtol=1e-6)
+    with pytest.raises(ValueError):
+        ensemble.combine({'mlp': None, 'rules': None, 'lstm': None})
+
+
+@pytest.fixture(scope='module')
+def bundle():
+    from sklearn.linear_model import LogisticRegression
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((200, len(sepsis_app.FEATURE_NAMES)))
+    model = LogisticRegression().fit(X, (X[:, 0] > 0).astype(int))
+    return ModelBundle('ensemble-test', model=model)
+
+
+def test_predict_ensemble_endpoint(monkeypatch, bundle):
+    monkeypatch.setattr(sepsis_app.registry, 'current', lambda: bundle)
+    septic = {'HR': 135, 'Temp': 39.1, 'Resp': 31, 'SBP': 85, 'Lactate': 3.2, 'WBC': 16}
+    normal = {'HR': 75, 'Temp': 36.8, 'Resp': 14, 'SBP': 120, 'Lactate': 1.0, 'WBC': 7}
+    payload = {'patients': [{'history': [normal, septic], 'Age': 70},
+                            {'history': [normal] * 3, 'Age': 40}]}
+
+    response = sepsis_app.app.test_client().post('/predict_ensemble', json=payload)
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert result['model_version'] == bundle.version
+    weights = result['weights']
+    assert weights['lstm'] == 0 and sum(weights.values()) == pytest.approx(1.0)
+
+    first, second = result['patients']
+    assert [first['hours_received'], second['hours_received']] == [2, 3]
+    assert first['components']['rules'] == calculate_sepsis_risk({k: str(v) for k, v in septic.items()})[0]
+    assert second['components']['rules'] == calculate_sepsis_risk({k: str(v) for k, v in normal.items()})[0]
+    for patient in result['patients']:
+        assert patient['components']['lstm'] is None
+        assert patient['risk'] == pytest.approx(sum(patient['contributions'].values()), abs=1e-6)
+        assert patient['risk'] == pytest.approx(
+            sum(weights[name] * patient['components'][name] for name in ('mlp', 'rules')), abs=1e-6)
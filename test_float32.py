@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Parity of the float32 serving path with float64 reference computations.
+
+    python -m pytest test_float32.py
+
+The Phase 1 reference is the fitted sklearn MLP + StandardScaler in float64;
+the serving path is the float32 artifact scored by app.score_phase1. The
+LSTM reference feeds float64-scaled sequences to the same Keras model that
+app.forecast_phase3 feeds float32 ones (skipped without TensorFlow).
+Risks must agree within TOLERANCE, which is far below what the UI shows
+(two decimals of a percentage).
+"""
+
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+from benchmark_serving import FEATURE_DISTRIBUTIONS, synthetic_patient
+from model_artifact import (SERVING_DTYPE, imputation_values, load_phase1_artifact, load_scaler,
+                            save_phase1_artifact, save_scaler_artifact)
+from model_registry import ModelBundle
+
+TOLERANCE = 1e-5
+N_PATIENTS = 200
+
+
+@pytest.fixture(scope='module')
+def patients():
+    rng = np.random.default_rng(0)
+    return [synthetic_patient(rng, sepsis_app.FEATURE_NAMES, septic=bool(i % 2)) for i in range(N_PATIENTS)]
+
+
+@pytest.fixture(scope='module')
+def X64(patients):
+    """Raw features in float64, NaN where synthetic_patient left a value out."""
+    X = np.array([[p.get(f, np.nan) for f in sepsis_app.FEATURE_NAMES] for p in patients], dtype=np.float64)
+    # Rarely measured labs may be missing from every patient; the scaler needs one value
+    never_seen = np.isnan(X).all(axis=0)
+    X[0, never_seen] = [FEATURE_DISTRIBUTIONS[f][0] for f in np.array(sepsis_app.FEATURE_NAMES)[never_seen]]
+    return X
+
+
+@pytest.fixture(scope='module')
+def phase1_reference(X64):
+    """A small MLP fitted on the synthetic patients, with its float64 scaler."""
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.preprocessing import StandardScaler
+    y = np.arange(len(X64)) % 2
+    scaler = StandardScaler().fit(X64)
+    imputation = imputation_values(X64, scaler)
+    X_scaled = np.where(np.isnan(X64), imputation, scaler.transform(X64))
+    model = MLPClassifier(hidden_layer_sizes=(32, 16), max_iter=300, random_state=0).fit(X_scaled, y)
+    return model, scaler, imputation
+
+
+@pytest.fixture(scope='module')
+def phase1_bundle(phase1_reference):
+    model, scaler, imputation = phase1_reference
+    path = os.path.join(tempfile.mkdtemp(), 'model_artifact.safetensors')
+    save_phase1_artifact(path, model, scaler, feature_names=sepsis_app.FEATURE_NAMES, imputation=imputation)
+    artifact = load_phase1_artifact(path)
+    return ModelBundle('float32-test', model=artifact['model'], scaler=artifact['scaler'])
+
+
+def test_artifact_is_float32(phase1_bundle):
+    assert all(W.dtype == SERVING_DTYPE for W in phase1_bundle.model.coefs_)
+    assert phase1_bundle.scaler.mean_.dtype == SERVING_DTYPE
+    assert phase1_bundle.scaler.imputation_.dtype == SERVING_DTYPE
+
+
+def test_parse_is_float32(patients):
+    form = {k: str(v) for k, v in patients[0].items()}
+    assert sepsis_app.parse_phase1_features(form).dtype == SERVING_DTYPE
+    history, static, _ = sepsis_app.parse_patient_history({'history': [form, form]})
+    assert history.dtype == SERVING_DTYPE and static.dtype == SERVING_DTYPE
+
+
+def test_phase1_parity(phase1_reference, phase1_bundle, X64):
+    model, scaler, imputation = phase1_reference
+    expected = model.predict_proba(np.where(np.isnan(X64), imputation, scaler.transform(X64)))[:, 1]
+
+    risks = sepsis_app.score_phase1(X64.astype(SERVING_DTYPE), phase1_bundle)
+    assert risks.dtype == SERVING_DTYPE
+    np.testing.assert_allclose(risks, expected, atol=TOLERANCE)
+
+
+def test_phase1_parity_with_shipped_model(X64):
+    """The committed model.pkl/scaler.pkl against their float32 artifact export."""
+    try:
+        with open('model.pkl', 'rb') as f:
+            model = pickle.load(f)
+        with open('scaler.pkl', 'rb') as f:
+            scaler = pickle.load(f)
+    except Exception as e:
+        pytest.skip(f"shipped model unavailable: {e}")
+    X = np.nan_to_num(X64, nan=0.0)
+    expected = model.predict_proba(scaler.transform(X))[:, 1]
+
+    path = os.path.join(tempfile.mkdtemp(), 'model_artifact.safetensors')
+    save_phase1_artifact(path, model, scaler, feature_names=sepsis_app.FEATURE_NAMES)
+    artifact = load_phase1_artifact(path)
+    bundle = ModelBundle('float32-shipped', model=artifact['model'], scaler=artifact['scaler'])
+    np.testing.assert_allclose(sepsis_app.score_phase1(X.astype(SERVING_DTYPE), bundle), expected, atol=TOLERANCE)
+
+
+def test_phase3_parity():
+    keras = pytest.importorskip('tensorflow').keras
+    from sklearn.preprocessing import StandardScaler
+
+    n_features = len(sepsis_app.PHASE3_FEATURES)
+    rng = np.random.default_rng(1)
+    X = np.stack([
+        np.array([[synthetic_patient(rng, sepsis_app.PHASE3_FEATURES).get(f, FEATURE_DISTRIBUTIONS[f][0])
+                   for f in sepsis_app.PHASE3_FEATURES] for _ in range(sepsis_app.PHASE3_SEQUENCE_LENGTH)])
+        for _ in range(32)
+    ])
+    scaler = StandardScaler().fit(X.reshape(-1, n_features))
+    path = os.path.join(tempfile.mkdtemp(), 'scaler_phase3.safetensors')
+    save_scaler_artifact(path, scaler, sepsis_app.PHASE3_FEATURES)
+
+    keras.utils.set_random_seed(0)
+    model = keras.Sequential([
+        keras.Input((sepsis_app.PHASE3_SEQUENCE_LENGTH, n_features)),
+        keras.layers.LSTM(16),
+        keras.layers.Dense(6, activation='sigmoid'),
+    ])
+    expected_curves = model.predict(scaler.transform(X.reshape(-1, n_features)).reshape(X.shape), verbose=0)
+    expected = expected_curves.mean(axis=1)
+
+    bundle = ModelBundle('float32-test', phase3_model=model, phase3_scaler=load_scaler(path))
+    forecast = sepsis_app.forecast_phase3(X.astype(SERVING_DTYPE), bundle)
+    assert forecast.dtype == SERVING_DTYPE
+    np.testing.assert_allclose(forecast, expected, atol=TOLERANCE)
+
+    # The multi-horizon head's hourly risks come from the same forward pass
+    curves = sepsis_app.forecast_phase3_curve(X.astype(SERVING_DTYPE), bundle)
+    assert curves.shape == (len(X), sepsis_app.PHASE3_HORIZONS)
+    np.testing.assert_allclose(curves, expected_curves, atol=TOLERANCE)
+    result = sepsis_app.build_combined_result({}, 0.1, curves[0], sepsis_app.PHASE3_SEQUENCE_LENGTH)
+    assert result['forecast_6h']['risk'] == pytest.approx(expected[0], abs=TOLERANCE)
+    assert len(result['forecast_6h']['hourly']) == sepsis_app.PHASE3_HORIZONS
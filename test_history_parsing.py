@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Patient-history payloads of /predict_combined and /predict_ensemble.
+
+    python -m pytest test_history_parsing.py
+
+Malformed bodies must be rejected by app.parse_patient_history with a
+ValueError, which both endpoints turn into a 400 response, never a 500.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+from model_registry import ModelBundle
+
+MALFORMED = [
+    [1, 2],
+    'abc',
+    None,
+    {'history': [1, 2]},
+    {'history': 'abc'},
+    {'history': {'HR': 90}},
+    {'history': []},
+    {'history': [{'HR': 90}, None]},
+    {'patients': [{'history': [{'HR': 90}]}, 'abc']},
+    {'patients': []},
+]
+
+
+def test_parse_patient_history():
+    payload = {'history': [{'HR': 80}, {'HR': '95', 'Temp': 'n/a'}], 'Age': 60}
+    history, static, latest = sepsis_app.parse_patient_history(payload)
+    hr = sepsis_app.HISTORY_FEATURES.index('HR')
+    np.testing.assert_array_equal(history[:, hr], [80, 95])
+    assert np.isnan(history[1, sepsis_app.HISTORY_FEATURES.index('Temp')])
+    assert static[sepsis_app.STATIC_FEATURES.index('Age')] == 60
+    assert latest == {'HR': '95', 'Temp': 'n/a', 'Age': '60'}
+
+
+@pytest.mark.parametrize('payload', MALFORMED)
+def test_parse_rejects_malformed_payload(payload):
+    with pytest.raises(ValueError):
+        sepsis_app.parse_patient_batch(payload)
+
+
+@pytest.mark.parametrize('endpoint', ['/predict_combined', '/predict_ensemble'])
+@pytest.mark.parametrize('payload', MALFORMED)
+def test_endpoints_return_400(monkeypatch, endpoint, payload):
+    # Parsing fails before the model is used
+    monkeypatch.setattr(sepsis_app.registry, 'current', lambda: ModelBundle(model=object()))
+    response = sepsis_app.app.test_client().post(endpoint, json=payload)
+    assert response.status_code == 400, response.get_json()
+    assert 'error' in response.get_json()
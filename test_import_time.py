@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Import-time budget of the serving modules and command-line tools.
+
+    python -m pytest test_import_time.py
+    SEPSIS_IMPORT_BUDGET=0.5 python -m pytest test_import_time.py
+
+Each module is imported in a fresh interpreter under `python -X importtime`.
+Its cumulative import time must stay within SEPSIS_IMPORT_BUDGET seconds
+(default 1.0), and TensorFlow, shap, lime, matplotlib and seaborn must not be
+loaded: they are imported by the code that first needs them. app.py is
+imported with SEPSIS_DEFER_PHASE3=1 and SEPSIS_ALLOW_PICKLE=0, as a gunicorn
+master with exported artifacts would, so the measurement covers the code and
+not the deserialization of whichever pickles are lying around.
+
+In the default environment (SEPSIS_DEFER_PHASE3 unset), importing app.py also
+loads the Phase 3 LSTM so the first forecast is not slow. TensorFlow is then
+loaded exactly when the registry loads the Keras LSTM (not the int8 numpy
+one); otherwise the budget and the lazy imports still hold.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+IMPORT_BUDGET = float(os.environ.get('SEPSIS_IMPORT_BUDGET', 1.0))
+LAZY_BACKENDS = ('tensorflow', 'keras', 'shap', 'lime', 'matplotlib', 'seaborn')
+SERVING_ENV = {'SEPSIS_DEFER_PHASE3': '1', 'SEPSIS_ALLOW_PICKLE': '0'}
+
+
+def import_times(module, code='', **env):
+    """
+    Import `module` (then run `code`) in a new interpreter with -X importtime.
+
+    Returns:
+        tuple: (cumulative import time in seconds of every module that was imported,
+                last line printed)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}\n{code}'],
+                            env=dict(os.environ, **env), capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.returncode == 0, result.stderr[-2000:]
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1e6
+    return times, (result.stdout.strip().splitlines() or [''])[-1]
+
+
+@pytest.mark.parametrize('module, env', [
+    ('app', SERVING_ENV),
+    ('asgi', SERVING_ENV),
+    ('app_simple', {}),
+    ('batch_score', SERVING_ENV),
+    ('ensemble', {}),
+    ('model_artifact', {}),
+    ('training_pipeline', {}),
+    ('benchmark_threads', {}),
+    ('phase3_utils', {}),
+    ('explainability', {}),
+])
+def test_import_budget(module, env):
+    times, _ = import_times(module, **env)
+    loaded = sorted(name for name in times if name.split('.')[0] in LAZY_BACKENDS)
+    assert not loaded, f"importing {module} loads {loaded}"
+    assert times[module] < IMPORT_BUDGET, f"importing {module} took {times[module]:.2f} s"
+
+
+def test_default_import_loads_lstm_eagerly():
+    # 1 if the registry loads the Keras LSTM (whether or not that succeeds)
+    code = ("from model_registry import phase3_sources\n"
+            "sources = phase3_sources()\n"
+            "print(int(sources is not None and not sources[1]))")
+    times, keras_lstm = import_times('app', code, SEPSIS_DEFER_PHASE3='0', SEPSIS_ALLOW_PICKLE='0')
+    if keras_lstm == '1':
+        # Keras itself probes for matplotlib; the explainers must still wait for a request
+        assert 'tensorflow' in times
+        lazy = LAZY_BACKENDS[2:4]
+    else:
+        lazy = LAZY_BACKENDS
+        assert times['app'] < IMPORT_BUDGET, f"importing app took {times['app']:.2f} s"
+    loaded = sorted(name for name in times if name.split('.')[0] in lazy)
+    assert not loaded, f"importing app loads {loaded}"
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Hot model reload (model_registry.ModelRegistry) and the admin routes.
+
+    python -m pytest test_model_registry.py
+
+Each test writes Phase 1 artifacts into its own working directory and
+reloads the registry with app.validate_bundle as the canary: a bundle that
+fails the canary must leave the live one in place, a passing one must be
+swapped in. The /admin routes need SEPSIS_ADMIN_TOKEN and are refused
+without it, in app.py and asgi.py alike.
+"""
+
+import asyncio
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+from model_artifact import PHASE1_ARTIFACT, save_phase1_artifact
+from model_registry import ModelRegistry
+
+ADMIN_TOKEN = 'test-admin-token'
+
+
+def write_artifact(n_features=len(sepsis_app.FEATURE_NAMES), hidden=8, broken=False):
+    """Fit a small MLP and export it as PHASE1_ARTIFACT in the working directory."""
+    from sklearn.neural_network import MLPClassifier
+    rng = np.random.default_rng(hidden)
+    X = rng.standard_normal((200, n_features))
+    model = MLPClassifier(hidden_layer_sizes=(hidden,), max_iter=50, random_state=0)
+    model.fit(X, (X[:, 0] > 0).astype(int))
+    if broken:
+        model.intercepts_[-1][:] = np.nan
+    save_phase1_artifact(PHASE1_ARTIFACT, model)
+    # Different mtime even on coarse-grained filesystems
+    stat = os.stat(PHASE1_ARTIFACT)
+    os.utime(PHASE1_ARTIFACT, ns=(stat.st_atime_ns, stat.st_mtime_ns + hidden * 10**9))
+    return model
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    swaps = []
+    return ModelRegistry(canary=sepsis_app.validate_bundle, on_swap=swaps.append), swaps
+
+
+def test_passing_canary_swaps(registry):
+    registry, swaps = registry
+    write_artifact(hidden=8)
+    first = registry.load()
+    assert first.model is not None and registry.current() is first
+    assert swaps == [first] and registry.last_error is None
+
+    # Unchanged files keep the live bundle
+    assert registry.load() is first and registry.reloads == 1
+
+    write_artifact(hidden=12)
+    second = registry.reload_async()
+    second.join()
+    live = registry.current()
+    assert live is not first and live.version != first.version
+    assert live.model.coefs_[0].shape[1] == 12
+    assert swaps == [first, live] and registry.reloads == 2
+
+
+@pytest.mark.parametrize('broken', [{'n_features': 10}, {'broken': True}])
+def test_failing_canary_keeps_old_bundle(registry, broken):
+    registry, swaps = registry
+    write_artifact(hidden=8)
+    old = registry.load()
+
+    write_artifact(hidden=12, **broken)
+    assert registry.load() is old
+    assert registry.current() is old and registry.reloads == 1
+    assert 'Canary failed' in registry.last_error and swaps == [old]
+
+    # A fixed artifact goes live again
+    write_artifact(hidden=16)
+    assert registry.load() is not old and registry.last_error is None
+
+
+ADMIN_ROUTES = ['/admin/models', '/admin/resources', '/admin/profiles']
+
+
+@pytest.mark.parametrize('route', ADMIN_ROUTES)
+def test_admin_routes_need_token(monkeypatch, route):
+    client = sepsis_app.app.test_client()
+    monkeypatch.delenv('SEPSIS_ADMIN_TOKEN', raising=False)
+    # The test client comes from 127.0.0.1, as proxied requests do
+    assert client.get(route).status_code == 403
+    assert client.get(route, headers={'X-Admin-Token': ''}).status_code == 403
+
+    monkeypatch.setenv('SEPSIS_ADMIN_TOKEN', ADMIN_TOKEN)
+    assert client.get(route).status_code == 403
+    assert client.get(route, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.get(route, headers={'X-Admin-Token': ADMIN_TOKEN}).status_code == 200
+
+
+def test_asgi_admin_routes_need_token(monkeypatch):
+    pytest.importorskip('quart')
+    import asgi
+
+    async def status(route, **headers):
+        response = await asgi.asgi_app.test_client().get(route, headers=headers)
+        return response.status_code
+
+    monkeypatch.delenv('SEPSIS_ADMIN_TOKEN', raising=False)
+    assert asyncio.run(status('/admin/models')) == 403
+    monkeypatch.setenv('SEPSIS_ADMIN_TOKEN', ADMIN_TOKEN)
+    assert asyncio.run(status('/admin/models', **{'X-Admin-Token': 'wrong'})) == 403
+    assert asyncio.run(status('/admin/models', **{'X-Admin-Token': ADMIN_TOKEN})) == 200
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Phase 1 prediction cache (prediction_cache.py) and its use by app.phase1_context.
+
+    python -m pytest test_prediction_cache.py
+
+PredictionCache is checked for LRU eviction and TTL expiry against a fake
+clock. quantize_form() must give the same key exactly to forms that score
+the same: equal after snapping, same fields present, same model version.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+import prediction_cache
+from model_registry import ModelBundle
+from prediction_cache import MAX_CACHEABLE_VALUE, PredictionCache, quantize_form
+
+FEATURES = sepsis_app.FEATURE_NAMES
+FORM = {'HR': '88', 'Temp': '37.2', 'Lactate': '1.4', 'Age': '60'}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_lru_eviction():
+    cache = PredictionCache(maxsize=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['size'] == 2 and stats['evictions'] == 1
+    assert stats['hits'] == 3 and stats['misses'] == 1
+
+    disabled = PredictionCache(maxsize=0)
+    disabled.put('a', 1)
+    assert not disabled.enabled and disabled.get('a') is None
+
+
+def test_ttl_expiry(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prediction_cache, 'time', clock)
+    cache = PredictionCache(maxsize=10, ttl=5)
+    cache.put('a', 1)
+    clock.now += 5
+    assert cache.get('a') == 1
+    clock.now += 0.1
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1 and cache.stats()['size'] == 0
+
+    # Writing an entry again restarts its lifetime
+    cache.put('a', 2)
+    clock.now += 4
+    cache.put('a', 3)
+    clock.now += 4
+    assert cache.get('a') == 3
+
+
+def test_quantized_keys():
+    key, canonical = quantize_form(FORM, FEATURES, 'v1')
+    assert canonical == {'HR': '88.0', 'Temp': '37.2', 'Lactate': '1.4', 'Age': '60.0'}
+
+    # Differences below the snapping precision share the entry
+    assert quantize_form(dict(FORM, HR='88.3', Temp='37.24'), FEATURES, 'v1')[0] == key
+    # Clinically different values, another model, or a missing vs a zero value do not
+    assert quantize_form(dict(FORM, HR='89'), FEATURES, 'v1')[0] != key
+    assert quantize_form(dict(FORM, Temp='37.3'), FEATURES, 'v1')[0] != key
+    assert quantize_form(FORM, FEATURES, 'v2')[0] != key
+    assert quantize_form(dict(FORM, WBC='0'), FEATURES, 'v1')[0] != key
+
+    # Unparseable and non-finite values count as absent
+    for value in ('', 'n/a', 'nan', 'inf', '-inf', None):
+        absent_key, absent = quantize_form(dict(FORM, WBC=value), FEATURES, 'v1')
+        assert absent_key == key and 'WBC' not in absent
+
+
+def test_out_of_range_values_are_not_cached():
+    # Values that would overflow the int64 key must not wrap around onto other keys
+    keys = {quantize_form(dict(FORM, HR=value), FEATURES, 'v1')[0]
+            for value in ('1e20', '-1e20', '9.3e18', '1e300')}
+    assert keys == {None}
+    form = dict(FORM, Platelets=str(MAX_CACHEABLE_VALUE * 10))
+    assert quantize_form(form, FEATURES, 'v1') == (None, form)
+    assert quantize_form(dict(FORM, Platelets=str(MAX_CACHEABLE_VALUE)), FEATURES, 'v1')[0] is not None
+
+
+def fitted_bundle(version, sign):
+    from sklearn.linear_model import LogisticRegression
+    X = np.random.default_rng(0).standard_normal((200, len(FEATURES)))
+    model = LogisticRegression().fit(X, (sign * X[:, 0] > 0).astype(int))
+    return ModelBundle(version, model=model)
+
+
+def test_phase1_context_cache_and_model_swap(monkeypatch):
+    cache = PredictionCache(maxsize=16, ttl=60)
+    monkeypatch.setattr(sepsis_app, 'prediction_cache', cache)
+    old, new = fitted_bundle('old', 1), fitted_bundle('new', -1)
+
+    context = sepsis_app.phase1_context(FORM, old)
+    assert sepsis_app.phase1_context(dict(FORM, HR='88.2'), old) is context
+    assert cache.stats()['hits'] == 1
+
+    # The new model scores the same vitals afresh, and the swap drops the old entries
+    swapped = sepsis_app.phase1_context(FORM, new)
+    assert swapped is not context and swapped['confidence'] != context['confidence']
+    sepsis_app.registry.on_swap(new)
+    assert cache.stats()['size'] == 0
+
+    # Out-of-range vitals are scored as submitted and never stored
+    sepsis_app.phase1_context(dict(FORM, HR='1e20'), new)
+    assert cache.stats()['size'] == 0
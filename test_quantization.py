@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+int8 weight artifacts against the float models they were quantized from.
+
+    python -m pytest test_quantization.py
+
+The Phase 1 model is a small MLP fitted on synthetic patients and quantized
+with clips calibrated on a held-out half. The sequence model tests export a
+Keras model with the layers of build_lstm_model to the numpy runtime, in
+float32 (which must match Keras) and in int8 (skipped without TensorFlow);
+the stateful variant must give the same outputs one step at a time, also
+for patients followed longer than the training sequence length.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from model_artifact import (ArtifactSequenceModel, keras_sequence_graph, load_phase1_artifact,
+                            load_sequence_artifact, quantize_int8, save_phase1_artifact, save_sequence_artifact,
+                            sequence_kernels)
+from lstm_state import LSTMStateStore
+from quantization import calibrate_mlp, calibrate_sequence_model, quantization_report
+
+# Largest allowed |p_int8 - p_float|; the UI shows risks to two decimals of a percentage
+INT8_TOLERANCE = 0.02
+
+
+def test_quantize_int8_roundtrip():
+    W = np.random.default_rng(0).standard_normal((27, 64))
+    q, scale = quantize_int8(W)
+    assert q.dtype == np.int8 and scale.shape == (64,)
+    assert np.all(np.abs(q.astype(float) * scale - W) <= scale / 2 + 1e-6)
+
+
+@pytest.fixture(scope='module')
+def phase1_model():
+    from sklearn.neural_network import MLPClassifier
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((2000, 27))
+    y = (X[:, 0] + 0.5 * X[:, 1] ** 2 + 0.3 * rng.standard_normal(2000) > 0.8).astype(int)
+    model = MLPClassifier(hidden_layer_sizes=(64, 32, 16), max_iter=300, random_state=0).fit(X[:1000], y[:1000])
+    return model, X[1000:1500], X[1500:], y[1500:]
+
+
+def test_phase1_int8_artifact(phase1_model):
+    model, X_calibration, X_test, y_test = phase1_model
+    path = os.path.join(tempfile.mkdtemp(), 'model_artifact_int8.safetensors')
+    save_phase1_artifact(path, model, int8_clips=calibrate_mlp(model, X_calibration))
+    int8_model = load_phase1_artifact(path)['model']
+    assert all(W.dtype == np.int8 for W in int8_model.coefs_)
+
+    float_proba = model.predict_proba(X_test)[:, 1]
+    int8_proba = int8_model.predict_proba(X_test.astype(np.float32))[:, 1]
+    # Overfitted logits are steep, so single rows may move further than the sequence model's
+    assert np.abs(int8_proba - float_proba).mean() < INT8_TOLERANCE / 10
+    np.testing.assert_allclose(int8_proba, float_proba, atol=5 * INT8_TOLERANCE)
+    report = quantization_report(y_test, float_proba, int8_proba)
+    assert abs(report['roc_auc_delta']) < 0.01
+
+    # Re-exporting an int8 model keeps its weights and scales
+    copy_path = path.replace('.safetensors', '_copy.safetensors')
+    save_phase1_artifact(copy_path, int8_model)
+    copy = load_phase1_artifact(copy_path)['model']
+    np.testing.assert_array_equal(copy.predict_proba(X_test.astype(np.float32))[:, 1], int8_proba)
+
+
+@pytest.fixture(scope='module')
+def sequence_model():
+    keras = pytest.importorskip('tensorflow').keras
+    layers = keras.layers
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input((12, 27))
+    x = layers.Bidirectional(layers.LSTM(16, return_sequences=True, dropout=0.2, recurrent_dropout=0.2))(inputs)
+    x = layers.LayerNormalization()(layers.Add()([x, layers.MultiHeadAttention(num_heads=2, key_dim=8)(x, x)]))
+    x = layers.Bidirectional(layers.LSTM(8))(x)
+    x = layers.Dropout(0.3)(layers.Dense(16, activation='relu')(x))
+    model = keras.Model(inputs, layers.Dense(1, activation='sigmoid')(x))
+    X = np.random.default_rng(1).standard_normal((256, 12, 27)).astype(np.float32)
+    return model, X
+
+
+def test_sequence_graph_matches_keras(sequence_model):
+    model, X = sequence_model
+    nodes, tensors = keras_sequence_graph(model)
+    np.testing.assert_allclose(ArtifactSequenceModel(nodes, tensors).predict(X), model.predict(X, verbose=0),
+                               atol=1e-5)
+
+
+def test_sequence_int8_artifact(sequence_model):
+    model, X = sequence_model
+    path = os.path.join(tempfile.mkdtemp(), 'model_phase3_lstm_int8.safetensors')
+    clips = calibrate_sequence_model(model, X[:128])
+    save_sequence_artifact(path, model, int8_clips=clips)
+    int8_model = load_sequence_artifact(path)
+    assert all(int8_model.tensors[name].dtype == np.int8 for name in sequence_kernels(int8_model.tensors))
+    np.testing.assert_allclose(int8_model.predict(X[128:]), model.predict(X[128:], verbose=0), atol=INT8_TOLERANCE)
+
+
+def test_stateful_step_matches_predict():
+    keras = pytest.importorskip('tensorflow').keras
+    layers = keras.layers
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input((None, 27))
+    x = layers.LSTM(8, return_sequences=True, dropout=0.2)(layers.LSTM(16, return_sequences=True)(inputs))
+    model = keras.Model(inputs, layers.Dense(6, activation='sigmoid')(layers.Dense(8, activation='relu')(x)))
+    X = np.random.default_rng(2).standard_normal((4, 12, 27)).astype(np.float32)
+
+    path = os.path.join(tempfile.mkdtemp(), 'model_phase3_stateful.safetensors')
+    save_sequence_artifact(path, model)
+    stateful = load_sequence_artifact(path)
+    assert stateful.causal
+    expected = model.predict(X, verbose=0)
+
+    # One patient per row, fed to the store an hour at a time
+    store = LSTMStateStore()
+    for t in range(X.shape[1]):
+        for patient in range(len(X)):
+            outputs, hours = store.update(patient, X[patient, t], stateful.version, stateful.initial_state,
+                                          lambda x, state: stateful.step(x[np.newaxis], state))
+            np.testing.assert_allclose(outputs[0], expected[patient, t], atol=1e-5)
+    assert hours == X.shape[1] and store.stats()['patients'] == len(X)
+
+    # A new model version restarts the patient from the zero state
+    _, hours = store.update(0, X[0, 0], 'retrained', stateful.initial_state,
+                            lambda x, state: stateful.step(x[np.newaxis], state))
+    assert hours == 1 and store.stats()['version_resets'] == 1
+
+
+def test_stateful_store_beyond_sequence_length():
+    keras = pytest.importorskip('tensorflow').keras
+    layers = keras.layers
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input((None, 27))
+    model = keras.Model(inputs, layers.Dense(6, activation='sigmoid')(layers.LSTM(8, return_sequences=True)(inputs)))
+    sequence_length, hours = 12, 40
+    X = np.random.default_rng(3).standard_normal((hours, 27)).astype(np.float32)
+
+    path = os.path.join(tempfile.mkdtemp(), 'model_phase3_stateful.safetensors')
+    save_sequence_artifact(path, model)
+    stateful = load_sequence_artifact(path)
+
+    # Every forecast is the model run from the zero state over the last 7 to 12 hours
+    store = LSTMStateStore(max_hours=sequence_length)
+    for t in range(hours):
+        outputs, observed = store.update('patient', X[t], stateful.version, stateful.initial_state,
+                                         lambda x, state: stateful.step(x[np.newaxis], state))
+        lanes = [t % sequence_length + 1]
+        if t >= sequence_length // 2:
+            lanes.append((t - sequence_length // 2) % sequence_length + 1)
+        context = max(lanes)
+        assert context == t + 1 if t < sequence_length else sequence_length // 2 < context <= sequence_length
+        expected = model.predict(X[np.newaxis, t + 1 - context:t + 1], verbose=0)[0, -1]
+        np.testing.assert_allclose(outputs[0], expected, atol=1e-5, err_msg=f"hour {t + 1}")
+    assert observed == hours
+
+
+def test_bidirectional_model_cannot_step(sequence_model):
+    model, X = sequence_model
+    with pytest.raises(ValueError):
+        ArtifactSequenceModel(*keras_sequence_graph(model)).step(X[:, 0], {})
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Per-request sampling profiler (request_profiler.py) in the serving apps.
+
+    python -m pytest test_request_profiler.py
+
+A profiled request lowers the interpreter's switch interval and starts a
+sampler thread. Both must be undone when the request ends, also when its
+view raises and after_request never runs; the request is then still
+counted in the latency metrics, as a 500.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+import request_profiler
+import serving_metrics
+
+ADMIN_TOKEN = 'test-admin-token'
+HEADERS = {request_profiler.PROFILE_HEADER: '1', 'X-Admin-Token': ADMIN_TOKEN}
+
+
+def failing_view():
+    raise RuntimeError("view failed")
+
+
+def request_count(endpoint, status):
+    """Requests observed by sepsis_request_duration_seconds for endpoint and status."""
+    prefix = f'sepsis_request_duration_seconds_count{{endpoint="{endpoint}",status="{status}",'
+    return sum(int(line.rsplit(' ', 1)[1]) for line in serving_metrics.REQUEST_DURATION.collect()
+               if line.startswith(prefix))
+
+
+def profiler_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'request-profiler']
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    monkeypatch.setenv('SEPSIS_ADMIN_TOKEN', ADMIN_TOKEN)
+
+
+def test_profiled_request(admin):
+    interval = sys.getswitchinterval()
+    response = sepsis_app.app.test_client().get('/cache_stats', headers=HEADERS)
+    assert 'X-Sepsis-Profile-Id' not in response.headers  # not a profiled endpoint
+
+    before = len(sepsis_app.profile_store.summaries())
+    response = sepsis_app.app.test_client().post('/predict_trend', json={'patient_id': 'p', 'HR': 90},
+                                                 headers=HEADERS)
+    profile_id = int(response.headers['X-Sepsis-Profile-Id'])
+    assert len(sepsis_app.profile_store.summaries()) == before + 1
+    assert sepsis_app.profile_store.get(profile_id)['status'] == response.status_code
+    assert sys.getswitchinterval() == interval and not profiler_threads()
+
+
+@pytest.mark.parametrize('propagate', [True, False])
+def test_raising_view_stops_profiler(admin, monkeypatch, propagate):
+    monkeypatch.setitem(sepsis_app.app.view_functions, 'predict_trend', failing_view)
+    monkeypatch.setitem(sepsis_app.app.config, 'PROPAGATE_EXCEPTIONS', propagate)
+    interval = sys.getswitchinterval()
+    failed = request_count('predict_trend', 500)
+
+    client = sepsis_app.app.test_client()
+    if propagate:
+        with pytest.raises(RuntimeError):
+            client.post('/predict_trend', json={}, headers=HEADERS)
+    else:
+        assert client.post('/predict_trend', json={}, headers=HEADERS).status_code == 500
+
+    assert sys.getswitchinterval() == interval
+    assert not profiler_threads()
+    assert sepsis_app.profile_store.summaries()[0]['status'] == 500
+    assert request_count('predict_trend', 500) == failed + 1
+
+
+def test_asgi_raising_view_stops_profiler(admin, monkeypatch):
+    pytest.importorskip('quart')
+    import asgi
+
+    monkeypatch.setitem(asgi.asgi_app.view_functions, 'predict_trend', failing_view)
+    interval = sys.getswitchinterval()
+    failed = request_count('predict_trend', 500)
+
+    async def post():
+        response = await asgi.asgi_app.test_client().post('/predict_trend', json={}, headers=HEADERS)
+        return response.status_code
+
+    assert asyncio.run(post()) == 500
+    assert sys.getswitchinterval() == interval
+    assert not profiler_threads()
+    assert request_count('predict_trend', 500) == failed + 1
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Thread-pool sizing per worker (resource_config.py, benchmark_threads.py).
+
+    python -m pytest test_resource_config.py
+
+configure() changes process-wide state (environment, BLAS pools), so it is
+exercised in fresh interpreters.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+from benchmark_threads import candidate_settings
+
+THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS',
+               'TF_NUM_INTEROP_THREADS', 'SEPSIS_EXPLAIN_THREADS', 'SEPSIS_THREADS_PER_WORKER', 'SEPSIS_CPU_AFFINITY')
+
+
+def run(code, **env):
+    """Run `code` in a new interpreter without inherited thread settings; returns its last line as JSON."""
+    clean = {k: v for k, v in os.environ.items() if k not in THREAD_VARS}
+    out = subprocess.check_output([sys.executable, '-c', code], env=dict(clean, **env), text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_configure_before_import_sizes_pools():
+    report = run("import json, resource_config\n"
+                 "resource_config.configure(workers=4, cores=8)\n"
+                 "import numpy\n"
+                 "print(json.dumps(resource_config.report()))")
+    assert report['threads_per_worker'] == 2
+    assert report['env']['OMP_NUM_THREADS'] == report['env']['TF_NUM_INTRAOP_THREADS'] == '2'
+    assert report['env']['TF_NUM_INTEROP_THREADS'] == '1'
+    assert report['env']['SEPSIS_EXPLAIN_THREADS'] == '2'
+    assert all(pool['num_threads'] <= 2 for pool in report['blas'])
+
+
+def test_configure_after_import_and_overrides():
+    # Already-loaded BLAS pools are resized; explicit settings win over the computed ones
+    report = run("import json, numpy, resource_config\n"
+                 "resource_config.configure(workers=1, cores=8)\n"
+                 "print(json.dumps(resource_config.report()))",
+                 SEPSIS_THREADS_PER_WORKER='3', TF_NUM_INTEROP_THREADS='2')
+    assert report['threads_per_worker'] == 3
+    assert report['env']['TF_NUM_INTEROP_THREADS'] == '2'
+    assert all(pool['num_threads'] <= 3 for pool in report['blas'])
+
+
+def test_asgi_configures_uvicorn_workers():
+    report = run("import json, asgi, resource_config\n"
+                 "print(json.dumps(resource_config.report()))",
+                 WEB_CONCURRENCY='2', SEPSIS_DEFER_PHASE3='1', SEPSIS_ALLOW_PICKLE='0')
+    assert report['workers'] == 2
+    assert report['env']['OMP_NUM_THREADS'] == str(report['threads_per_worker'])
+
+
+def test_pin_worker():
+    code = ("import json, os, resource_config\n"
+            "resource_config.configure(workers=2)\n"
+            "print(json.dumps([resource_config.pin_worker(1), sorted(os.sched_getaffinity(0))]))")
+    assert run(code)[0] is None
+    if hasattr(os, 'sched_setaffinity'):
+        pinned, cpus = run(code, SEPSIS_CPU_AFFINITY='1')
+        assert pinned == cpus and 1 <= len(cpus) <= max(len(os.sched_getaffinity(0)) // 2, 1)
+
+
+def test_candidate_settings():
+    assert candidate_settings(1) == [(1, 1)]
+    assert candidate_settings(4) == [(1, 1), (1, 4), (2, 1), (2, 2), (2, 4), (4, 1), (4, 4)]
+    assert (6, 1) in candidate_settings(6) and (4, 1) in candidate_settings(6)
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Data-parallel training of the Phase 3 sequence models (sequence_training.py).
+
+    python -m pytest test_sequence_training.py
+
+Sharding and weight averaging are checked directly; a small LSTM is then
+trained on two worker processes and must come back with averaged weights,
+a Keras History, working callbacks and the workers' averaged optimizer
+state. Skipped without TensorFlow.
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+from tensorflow import keras
+
+from sequence_training import (WorkerPool, average_weights, default_worker_counts, fit_data_parallel,
+                               optimizer_state, scaling_report, set_optimizer_state, shard)
+
+SEQUENCE_LENGTH = 12
+
+
+def test_default_worker_counts():
+    assert default_worker_counts(1) == [1]
+    assert default_worker_counts(6) == [1, 2, 4, 6]
+    assert default_worker_counts(8) == [1, 2, 4, 8]
+
+
+def test_shards_are_disjoint_and_equal():
+    starts = np.arange(103)
+    shards = shard(4, starts, starts % 2, np.ones(103))
+    assert [len(s) for s, _, _ in shards] == [25] * 4
+    assert len(np.unique(np.concatenate([s for s, _, _ in shards]))) == 100
+    assert all(np.array_equal(targets, s % 2) for s, targets, _ in shards)
+
+
+def test_shard_needs_a_sequence_per_worker():
+    with pytest.raises(ValueError, match='4 workers'):
+        shard(4, np.arange(3), np.zeros(3), np.ones(3))
+    assert [len(s) for s, _, _ in shard(3, np.arange(3), np.zeros(3), np.ones(3))] == [1, 1, 1]
+
+
+def test_average_weights():
+    a = [np.zeros((2, 3), np.float32), np.ones(3, np.float32)]
+    b = [np.full((2, 3), 2, np.float32), np.full(3, 3, np.float32)]
+    averaged = average_weights([a, b])
+    np.testing.assert_array_equal(averaged[0], np.ones((2, 3)))
+    np.testing.assert_array_equal(averaged[1], np.full(3, 2))
+    assert averaged[0].dtype == np.float32
+
+
+@pytest.fixture(scope='module')
+def sequences():
+    rng = np.random.default_rng(0)
+    rows = rng.standard_normal((800, 27)).astype(np.float32)
+    starts = np.arange(len(rows) - SEQUENCE_LENGTH)
+    targets = (rows[starts + SEQUENCE_LENGTH - 1, :1] > 0).astype(np.int8)
+    return rows, starts, targets, np.ones(len(starts), np.float32)
+
+
+def small_model():
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input((SEQUENCE_LENGTH, 27))
+    model = keras.Model(inputs, keras.layers.Dense(1, activation='sigmoid')(keras.layers.LSTM(8)(inputs)))
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate=0.01), loss='binary_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def test_fit_data_parallel(sequences):
+    rows, starts, targets, weights = sequences
+    model = small_model()
+    initial = model.get_weights()
+    early_stop = keras.callbacks.EarlyStopping(monitor='val_loss', patience=1, restore_best_weights=True)
+    history = fit_data_parallel(model, rows, SEQUENCE_LENGTH, starts[:600], targets[:600], weights[:600],
+                                starts[600:], targets[600:], weights[600:], workers=2, epochs=3,
+                                batch_size=32, sync_steps=4, callbacks=[early_stop], seed=0)
+
+    assert {'loss', 'accuracy', 'val_loss', 'val_accuracy', 'seconds'} <= set(history.history)
+    assert 1 <= len(history.history['loss']) <= 3
+    assert history.history['val_loss'][-1] < history.history['val_loss'][0] or early_stop.stopped_epoch
+    assert any(not np.allclose(w, w0) for w, w0 in zip(model.get_weights(), initial))
+    # The workers' optimizer state is averaged back: 300 sequences per worker = 9 steps per epoch
+    assert int(model.optimizer.iterations) == 9 * len(history.history['loss'])
+    assert all(np.any(value) for value in optimizer_state(model)[2:])
+
+
+def test_fit_data_parallel_rejects_small_validation_split(sequences):
+    # One validation sequence for two workers: refused before any worker starts
+    rows, starts, targets, weights = sequences
+    with pytest.raises(ValueError, match='1 sequences cannot be split over 2 workers'):
+        fit_data_parallel(small_model(), rows, SEQUENCE_LENGTH, starts[:600], targets[:600], weights[:600],
+                          starts[600:601], targets[600:601], weights[600:601], workers=2, epochs=1)
+
+
+def test_worker_pool_starts_from_model_optimizer_state(sequences):
+    rows, starts, targets, weights = sequences
+    model = small_model()
+    model.optimizer.build(model.trainable_variables)
+    state = [np.full_like(value, 3) for value in optimizer_state(model)]
+    set_optimizer_state(model, state)
+    with WorkerPool(model, rows, SEQUENCE_LENGTH, shard(2, starts, targets, weights)) as pool:
+        for value, expected in zip(pool.optimizer_state(), state):
+            np.testing.assert_array_equal(value, expected)
+
+
+def test_scaling_report(sequences):
+    rows, starts, targets, weights = sequences
+    model = small_model()
+    initial = model.get_weights()
+    report = scaling_report(model, rows, SEQUENCE_LENGTH, starts, targets, weights, [1, 2], rounds=1, sync_steps=2)
+    assert [row['workers'] for row in report] == [1, 2]
+    assert report[0]['speedup'] == 1.0 and report[0]['efficiency'] == 1.0
+    assert all(row['sequences_per_second'] > 0 for row in report)
+    assert all(np.array_equal(w, w0) for w, w0 in zip(model.get_weights(), initial))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Request metrics (serving_metrics.py) and their /metrics exposition.
+
+    python -m pytest test_serving_metrics.py
+
+Histograms must expose cumulative buckets ending in +Inf, with _sum and
+_count, in Prometheus text format 0.0.4. A request is counted under the
+model version that was live when it started, even when a hot swap happens
+while it runs.
+"""
+
+import os
+
+import pytest
+from flask import jsonify
+
+os.environ.setdefault('SEPSIS_DEFER_PHASE3', '1')
+import app as sepsis_app
+import serving_metrics
+from model_registry import ModelBundle
+from serving_metrics import Counter, Histogram
+
+
+def test_histogram_exposition():
+    histogram = Histogram('test_seconds', 'Test latency.', ('endpoint',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value, 'predict')
+    histogram.observe(0.2, 'say "hi"\n')
+    lines = histogram.collect()
+    assert lines[:2] == ['# HELP test_seconds Test latency.', '# TYPE test_seconds histogram']
+    assert lines[2:7] == [
+        'test_seconds_bucket{endpoint="predict",le="0.1"} 2',
+        'test_seconds_bucket{endpoint="predict",le="1.0"} 3',
+        'test_seconds_bucket{endpoint="predict",le="+Inf"} 4',
+        'test_seconds_sum{endpoint="predict"} 5.65',
+        'test_seconds_count{endpoint="predict"} 4',
+    ]
+    assert 'test_seconds_count{endpoint="say \\"hi\\"\\n"} 1' in lines
+
+
+def test_counter_exposition():
+    counter = Counter('test_total', 'Test errors.', ('endpoint', 'error'))
+    counter.inc('predict', 'ValueError')
+    counter.inc('predict', 'ValueError', amount=2)
+    assert counter.collect()[2:] == ['test_total{endpoint="predict",error="ValueError"} 3']
+
+
+def request_count(body, endpoint, status, model_version):
+    line = (f'sepsis_request_duration_seconds_count{{endpoint="{endpoint}",status="{status}",'
+            f'model_version="{model_version}"}} ')
+    return sum(int(row[len(line):]) for row in body.splitlines() if row.startswith(line))
+
+
+def test_metrics_endpoint_counts_version_at_request_start(monkeypatch):
+    bundles = {'live': ModelBundle('metrics-old')}
+    monkeypatch.setattr(sepsis_app.registry, 'current', lambda: bundles['live'])
+
+    def swapping_view():
+        # A hot swap lands while this request is being served
+        bundles['live'] = ModelBundle('metrics-new')
+        with serving_metrics.stage('inference'):
+            pass
+        return jsonify({})
+
+    monkeypatch.setitem(sepsis_app.app.view_functions, 'predict_trend', swapping_view)
+    client = sepsis_app.app.test_client()
+    client.post('/predict_trend', json={})
+
+    response = client.get('/metrics')
+    assert response.content_type == serving_metrics.CONTENT_TYPE
+    body = response.get_data(as_text=True)
+    assert request_count(body, 'predict_trend', 200, 'metrics-old') == 1
+    assert request_count(body, 'predict_trend', 200, 'metrics-new') == 0
+    assert 'sepsis_stage_duration_seconds_count{endpoint="predict_trend",stage="inference"}' in body
+
+    # Requests that start after the swap are counted under the new version
+    body = client.get('/metrics').get_data(as_text=True)
+    assert request_count(body, 'metrics', 200, 'metrics-new') >= 1
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Online trend features (trend_features.py) against their batch definition.
+
+    python -m pytest test_trend_features.py
+
+TrendFeatureStore updates each patient in O(1) with a sliding-window Welford
+update; trend_features_from_history() computes the same features with pandas.
+Over random histories with never-measured leading hours, gaps that carry the
+last value forward, and more hours than TREND_WINDOW (so the removal step
+runs), the two must agree hour by hour.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trend_features import TREND_FEATURES, TREND_VITALS, TREND_WINDOW, TrendFeatureStore, trend_features_from_history
+
+# Typical scale of each vital, so the tolerance is exercised at realistic magnitudes
+VITAL_SCALE = {'HR': 90, 'O2Sat': 97, 'Temp': 37, 'Lactate': 2.5, 'SBP': 120, 'Creatinine': 1.5, 'WBC': 11,
+               'Glucose': 140}
+
+
+def random_history(rng, hours):
+    """(hours, TREND_VITALS) DataFrame with leading unmeasured hours and random gaps."""
+    values = np.array([VITAL_SCALE[v] * (1 + 0.1 * rng.standard_normal(hours)) for v in TREND_VITALS]).T
+    values[rng.random(values.shape) < 0.3] = np.nan
+    for i in range(len(TREND_VITALS)):
+        values[:rng.integers(0, hours // 2 + 1), i] = np.nan
+    values[:, -1] = np.nan  # one vital never measured
+    return pd.DataFrame(values, columns=TREND_VITALS)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_store_matches_batch_definition(seed):
+    rng = np.random.default_rng(seed)
+    store = TrendFeatureStore()
+    hours = 4 * TREND_WINDOW
+    history = random_history(rng, hours)
+    expected = trend_features_from_history(history)[TREND_FEATURES].to_numpy()
+
+    for hour, row in history.iterrows():
+        observation = {vital: value for vital, value in row.items() if not np.isnan(value)}
+        features, observed = store.update('patient', observation)
+        assert observed == hour + 1
+        np.testing.assert_allclose(features, expected[hour], rtol=1e-6, atol=1e-6, err_msg=f"hour {hour}")
+
+
+def test_patients_are_independent():
+    rng = np.random.default_rng(0)
+    store = TrendFeatureStore()
+    a, b = random_history(rng, 10), random_history(rng, 10)
+    for (_, row_a), (_, row_b) in zip(a.iterrows(), b.iterrows()):
+        features_a, _ = store.update('a', row_a.dropna().to_dict())
+        store.update('b', row_b.dropna().to_dict())
+    np.testing.assert_allclose(features_a, trend_features_from_history(a)[TREND_FEATURES].to_numpy()[-1],
+                               rtol=1e-6, atol=1e-6)
@@ -13,6 +13,7 @@ from sklearn.preprocessing import StandardScaler
 from sklearn.neural_network import MLPClassifier
 from sklearn.utils import resample
 from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score, confusion_matrix
+from model_artifact import PHASE1_ARTIFACT, save_phase1_artifact
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -98,8 +99,12 @@ print(f"    FN={fn}, TP={tp}")
 print(f"\nSaving model and scaler...")
 pickle.dump(model, open('model.pkl', 'wb'))
 pickle.dump(scaler, open('scaler.pkl', 'wb'))
+# Training medians (scaled) fill in missing fields at serving time
+save_phase1_artifact(PHASE1_ARTIFACT, model, scaler, feature_names=FEATURE_NAMES,
+                     imputation=np.nanmedian(X_train_scaled, axis=0))
 print(f"  model.pkl - saved")
 print(f"  scaler.pkl - saved")
+print(f"  {PHASE1_ARTIFACT} - saved")
 
 print(f"\n" + "=" * 60)
 print("DONE - Model trained with exact 27 inference features")
@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # Phase 1 OPTIMIZED - Better sepsis prediction with 27 features
 # Improvements: Better architecture, StandardScaler, Class weights, Better metrics
+# Checkpointed every CHECKPOINT_EVERY epochs; `--resume` continues an interrupted run
 
+import argparse
 import pandas as pd
 import pickle
 import numpy as np
@@ -12,9 +14,19 @@ from sklearn.neural_network import MLPClassifier
 from sklearn.utils import resample
 from sklearn.utils.class_weight import compute_class_weight
 from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score, confusion_matrix, classification_report
+from checkpointing import CHECKPOINT_EVERY, TrainingCheckpoint, fit_mlp
+from model_artifact import PHASE1_ARTIFACT, save_phase1_artifact
+from training_pipeline import file_sha256
 import warnings
 warnings.filterwarnings('ignore')
 
+CHECKPOINT_DIR = 'checkpoints/phase1'  # Resumable training state, removed once the model is saved
+
+parser = argparse.ArgumentParser(description='Train the 27-feature Phase 1 MLP')
+parser.add_argument('--resume', action='store_true',
+                    help=f'Continue from the checkpoints in {CHECKPOINT_DIR} instead of starting over')
+args = parser.parse_args()
+
 print("=" * 70)
 print("PHASE 1 OPTIMIZATION - Sepsis Detection Model Training")
 print("=" * 70)
@@ -65,9 +77,16 @@ print(f"✓ Train set: {X_train.shape[0]} samples")
 print(f"✓ Test set: {X_test.shape[0]} samples")
 
 print("\n[5/8] IMPROVEMENT 1.1 - Normalizing features with StandardScaler...")
+# Checkpoints only resume a run on the same data and settings
+checkpoint = TrainingCheckpoint(CHECKPOINT_DIR, {'data': file_sha256('sepsis.csv'), 'features': feature_cols},
+                                resume=args.resume)
+
 # IMPROVEMENT 1.1: Normalize features
-scaler = StandardScaler()
-X_train = scaler.fit_transform(X_train)
+scaler = checkpoint.load('scaler')
+if scaler is None:
+    scaler = StandardScaler().fit(X_train)
+    checkpoint.save('scaler', scaler)
+X_train = scaler.transform(X_train)
 X_test = scaler.transform(X_test)
 print("✓ Features normalized (StandardScaler applied)")
 
@@ -109,8 +128,9 @@ model = MLPClassifier(
     verbose=1
 )
 
-print("\nTraining in progress (this may take a few minutes)...")
-model.fit(X_train, Y_train)
+print(f"\nTraining in progress (this may take a few minutes, checkpoint every {CHECKPOINT_EVERY} epochs "
+      f"in {CHECKPOINT_DIR})...")
+model = fit_mlp(model, X_train, Y_train, checkpoint)
 
 print("\n[8/8] Evaluating and saving model...")
 
@@ -160,8 +180,14 @@ print("\n💾 Saving model and scaler...")
 pickle.dump(model, open('model.pkl', 'wb'))
 # Save scaler for use in app.py
 pickle.dump(scaler, open('scaler.pkl', 'wb'))
+# Save pickle-free, memory-mappable artifact used by the server
+# (training medians, scaled, fill in missing fields at serving time)
+save_phase1_artifact(PHASE1_ARTIFACT, model, scaler, feature_names=feature_cols,
+                     imputation=np.nanmedian(X_train, axis=0))
 print("✓ Model saved to: model.pkl")
 print("✓ Scaler saved to: scaler.pkl")
+print(f"✓ Artifact saved to: {PHASE1_ARTIFACT}")
+checkpoint.remove()
 
 print("\n" + "=" * 70)
 print("✅ PHASE 1 OPTIMIZATION COMPLETE!")
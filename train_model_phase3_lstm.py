@@ -6,13 +6,21 @@ Features:
 - LSTM architecture for sequential data
 - Bidirectional processing
 - Attention mechanism
-- Multi-step ahead forecasting
+- Multi-step ahead forecasting (one sigmoid output per hour, +1h to +6h)
 - Early warning predictions
+- Stateful variant: causal unidirectional LSTM served one hour at a time
+- Optional data-parallel training on several local processes (sequence_training.py)
+- Checkpointed every epoch; `--resume` continues an interrupted run
 """
 
+import argparse
 import numpy as np
 import pandas as pd
+import os
 import pickle
+import shutil
+import tempfile
+import time
 import warnings
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
@@ -25,6 +33,14 @@ from tensorflow.keras import layers, models
 from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
 import matplotlib.pyplot as plt
 import seaborn as sns
+from checkpointing import TrainingCheckpoint
+from model_artifact import (PHASE3_INT8_ARTIFACT, PHASE3_SCALER_ARTIFACT, PHASE3_STATEFUL_ARTIFACT,
+                            ArtifactSequenceModel, keras_sequence_graph, load_sequence_artifact,
+                            save_scaler_artifact, save_sequence_artifact)
+from quantization import calibrate_sequence_model, print_quantization_report, quantization_report
+from sequence_training import (SYNC_STEPS, EpochCheckpoint, default_worker_counts, fit_data_parallel,
+                               print_scaling_report, scaling_report, sequence_dataset, training_dataset)
+from training_pipeline import file_sha256
 
 warnings.filterwarnings('ignore')
 
@@ -34,10 +50,18 @@ warnings.filterwarnings('ignore')
 
 SEQUENCE_LENGTH = 12  # Look back 12 time steps (hours)
 FORECAST_STEPS = 6    # Predict 6 steps ahead (6 hours)
+MULTI_HORIZON = True  # One output per hour ahead; False = a single 6-hour label
+STATEFUL_VARIANT = True  # Also train the causal LSTM served one hour at a time (lstm_state.py)
 BATCH_SIZE = 32
 EPOCHS = 50
 VALIDATION_SPLIT = 0.2
 TEST_SIZE = 0.2
+SHUFFLE_BUFFER = 10000  # Training sequences shuffled at a time by the input pipeline
+DATASET_CACHE_DIR = None  # Local directory for the tf.data sequence cache (None = system temp directory)
+DATA_PARALLEL_WORKERS = 1  # >1: train on this many local processes, averaging weights every SYNC_STEPS batches
+SCALING_REPORT = False  # Before training, measure data-parallel throughput for 1, 2, 4, ... workers
+CHECKPOINT_DIR = 'checkpoints/phase3'  # Resumable training state, removed once the artifacts are saved
+CHECKPOINT_EVERY = 1  # Epochs between two checkpoints
 RANDOM_STATE = 42
 
 FEATURE_COLUMNS = [
@@ -47,6 +71,11 @@ FEATURE_COLUMNS = [
     'Potassium', 'Hgb'
 ]
 
+parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument('--resume', action='store_true',
+                    help=f'Continue from the checkpoints in {CHECKPOINT_DIR} instead of starting over')
+args = parser.parse_args()
+
 # ============================================================================
 # STEP 1: LOAD AND PREPARE DATA
 # ============================================================================
@@ -58,6 +87,23 @@ print("="*70 + "\n")
 print("[1/6] Loading data...")
 df = pd.read_csv('sepsis.csv')
 
+# Checkpoints only resume a run on the same data and settings
+checkpoint = TrainingCheckpoint(CHECKPOINT_DIR, {
+    'data': file_sha256('sepsis.csv'),
+    'features': FEATURE_COLUMNS,
+    'sequence_length': SEQUENCE_LENGTH,
+    'forecast_steps': FORECAST_STEPS,
+    'multi_horizon': MULTI_HORIZON,
+    'batch_size': BATCH_SIZE,
+    'validation_split': VALIDATION_SPLIT,
+    'test_size': TEST_SIZE,
+    'random_state': RANDOM_STATE,
+}, resume=args.resume)
+print(f"  Checkpoints: {CHECKPOINT_DIR}{' (resuming)' if args.resume else ''}")
+
+# Raw medians, stored with the scaler to impute missing values at serving time
+raw_medians = df[FEATURE_COLUMNS].median().values
+
 # Fill missing values with forward fill then backward fill
 df[FEATURE_COLUMNS] = df[FEATURE_COLUMNS].fillna(method='ffill').fillna(method='bfill').fillna(df[FEATURE_COLUMNS].mean())
 
@@ -74,29 +120,49 @@ print(f"  Non-sepsis cases: {(y == 0).sum()} ({(y == 0).sum()/len(y)*100:.2f}%)"
 
 print("\n[2/6] Creating sequences for temporal modeling...")
 
-def create_sequences(X, y, sequence_length=12):
+def create_sequences(X, starts, sequence_length=12):
     """
-    Create sequences for LSTM input
-    Each sequence: [t-11, t-10, ..., t-1, t] -> predict y[t+1:t+6]
+    Create sequences for LSTM input from the rows of X
+    Each sequence: [t-11, t-10, ..., t-1, t], for the sequences starting at `starts`
+    Returns (len(starts), sequence_length, n_features)
     """
-    X_seq = []
-    y_seq = []
-    
-    for i in range(len(X) - sequence_length - FORECAST_STEPS + 1):
-        # Input sequence: past 'sequence_length' timesteps
-        X_seq.append(X[i:i + sequence_length])
-        
-        # Target: mean of next FORECAST_STEPS for binary classification
-        future_labels = y[i + sequence_length:i + sequence_length + FORECAST_STEPS]
-        y_seq.append(1 if np.mean(future_labels) > 0.5 else 0)
-    
-    return np.array(X_seq), np.array(y_seq)
+    return X[np.asarray(starts)[:, None] + np.arange(sequence_length)]
 
-X_seq, y_seq = create_sequences(X, y, SEQUENCE_LENGTH)
+def create_targets(y, starts, sequence_length=12, multi_horizon=False):
+    """
+    Target of each sequence: y[t+1:t+6] after its last step t
+    1 if sepsis for most of the next FORECAST_STEPS hours, or with
+    multi_horizon the label of each of those hours (+1h ... +6h)
+    """
+    future_labels = np.asarray(y, dtype=np.int8)[np.asarray(starts)[:, None] + sequence_length + np.arange(FORECAST_STEPS)]
+    if multi_horizon:
+        return future_labels
+    return (future_labels.mean(axis=1) > 0.5).astype(np.int8)
 
-print(f"  Sequences created: {X_seq.shape}")
-print(f"  Sequence shape: (samples={X_seq.shape[0]}, timesteps={X_seq.shape[1]}, features={X_seq.shape[2]})")
-print(f"  Sepsis sequences: {(y_seq == 1).sum()} ({(y_seq == 1).sum()/len(y_seq)*100:.2f}%)")
+def create_step_targets(y, starts, sequence_length=12, multi_horizon=False):
+    """
+    Targets after every step of the sequences starting at `starts`, for the
+    stateful model: step t of a sequence starting at i predicts y[i+t+1:i+t+7]
+    (its last step has the create_targets target).
+    Returns (len(starts), sequence_length, FORECAST_STEPS or 1) int8 labels
+    """
+    steps = np.arange(1, sequence_length + 1)[None, :, None] + np.arange(FORECAST_STEPS)[None, None, :]
+    targets = np.asarray(y, dtype=np.int8)[np.asarray(starts)[:, None, None] + steps]
+    if not multi_horizon:
+        targets = (targets.mean(axis=-1, keepdims=True) > 0.5).astype(np.int8)
+    return targets
+
+# Sequences are kept as their start rows; the windows are only built by the input pipeline
+starts = np.arange(len(X) - SEQUENCE_LENGTH - FORECAST_STEPS + 1)
+y_seq = create_targets(y, starts, SEQUENCE_LENGTH, multi_horizon=MULTI_HORIZON)
+# 6-hour label of every sequence, used for stratification and the summary metrics
+y_seq_6h = (y_seq.mean(axis=1) > 0.5).astype(int) if MULTI_HORIZON else y_seq
+
+print(f"  Sequences created: {len(starts)}")
+print(f"  Sequence shape: (samples={len(starts)}, timesteps={SEQUENCE_LENGTH}, features={X.shape[1]})")
+print(f"  Sepsis sequences: {(y_seq_6h == 1).sum()} ({(y_seq_6h == 1).sum()/len(y_seq_6h)*100:.2f}%)")
+if MULTI_HORIZON:
+    print(f"  Targets: {FORECAST_STEPS} hourly labels (+1h to +{FORECAST_STEPS}h)")
 
 # ============================================================================
 # STEP 3: SCALE AND SPLIT DATA
@@ -104,34 +170,82 @@ print(f"  Sepsis sequences: {(y_seq == 1).sum()} ({(y_seq == 1).sum()/len(y_seq)
 
 print("\n[3/6] Scaling and splitting data...")
 
-# Reshape for scaling
-n_samples, n_timesteps, n_features = X_seq.shape
-X_seq_reshaped = X_seq.reshape(-1, n_features)
-
-# Scale features
-scaler = StandardScaler()
-X_seq_scaled = scaler.fit_transform(X_seq_reshaped)
-X_seq_scaled = X_seq_scaled.reshape(n_samples, n_timesteps, n_features)
-
-# Split data: train/test
-X_train, X_test, y_train, y_test = train_test_split(
-    X_seq_scaled, y_seq, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y_seq
+# Scale features (every row once; sequences are windows over the scaled rows)
+scaler = checkpoint.load('scaler')
+if scaler is None:
+    scaler = StandardScaler().fit(X)
+    checkpoint.save('scaler', scaler)
+X_scaled = scaler.transform(X).astype(np.float32)
+
+# Split sequences: train/test (*_index: start rows, y_train/y_test: 6-hour labels,
+# y_*_targets: what the model is fitted on)
+train_index, test_index = train_test_split(
+    starts, test_size=TEST_SIZE, random_state=RANDOM_STATE, stratify=y_seq_6h
 )
-
-print(f"  Train set: {X_train.shape}")
+# Validation: the last VALIDATION_SPLIT of the training sequences
+n_validation = int(len(train_index) * VALIDATION_SPLIT)
+fit_index, val_index = train_index[:-n_validation], train_index[-n_validation:]
+y_train, y_test = y_seq_6h[train_index], y_seq_6h[test_index]
+y_test_targets = y_seq[test_index]
+X_test = create_sequences(X_scaled, test_index, SEQUENCE_LENGTH)
+
+print(f"  Train set: {len(fit_index)} sequences (+{n_validation} validation)")
 print(f"  Test set: {X_test.shape}")
 print(f"  Train sepsis rate: {(y_train == 1).sum()/len(y_train)*100:.2f}%")
 print(f"  Test sepsis rate: {(y_test == 1).sum()/len(y_test)*100:.2f}%")
 
+# Input pipeline: windows are gathered from X_scaled in parallel, cached to a
+# local file during the first epoch, shuffled within SHUFFLE_BUFFER and
+# prefetched, so preparing the next batches overlaps with training.
+# (Keras reads one batch before the first epoch, which makes TensorFlow warn
+# that a cache was not fully read; the first epoch then writes it.)
+# With DATA_PARALLEL_WORKERS > 1 each worker builds the same pipeline over its shard.
+cache_dir = tempfile.mkdtemp(prefix='phase3_tfdata_', dir=DATASET_CACHE_DIR)
+fit_sequences = sequence_dataset(X_scaled, fit_index, SEQUENCE_LENGTH, os.path.join(cache_dir, 'train'))
+val_sequences = sequence_dataset(X_scaled, val_index, SEQUENCE_LENGTH, os.path.join(cache_dir, 'validation'))
+print(f"  Input pipeline: shuffle buffer {SHUFFLE_BUFFER}, cache in {cache_dir}")
+
+def fit_sequence_model(model, name, fit_targets, fit_weights, val_targets, val_weights, callbacks):
+    """
+    Fit on the training sequences with validation on val_index: model.fit on the
+    input pipeline, or fit_data_parallel() on DATA_PARALLEL_WORKERS processes.
+    Checkpointed as `name` every CHECKPOINT_EVERY epochs; with --resume, training
+    continues after the last checkpoint (or is skipped if it had finished).
+    Returns the History, including the epochs before a resume.
+    """
+    epoch_checkpoint = EpochCheckpoint(checkpoint, name, model, callbacks, every=CHECKPOINT_EVERY)
+    initial_epoch = epoch_checkpoint.restore()
+    history = keras.callbacks.History()
+    if not epoch_checkpoint.completed:
+        callbacks = callbacks + [epoch_checkpoint]
+        if DATA_PARALLEL_WORKERS > 1:
+            history = fit_data_parallel(model, X_scaled, SEQUENCE_LENGTH, fit_index, fit_targets, fit_weights,
+                                        val_index, val_targets, val_weights, workers=DATA_PARALLEL_WORKERS,
+                                        epochs=EPOCHS, batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER,
+                                        callbacks=callbacks, seed=RANDOM_STATE, initial_epoch=initial_epoch)
+        else:
+            history = model.fit(
+                training_dataset(fit_sequences, fit_targets, fit_weights, BATCH_SIZE, SHUFFLE_BUFFER,
+                                 seed=RANDOM_STATE),
+                validation_data=training_dataset(val_sequences, val_targets, val_weights, BATCH_SIZE),
+                epochs=EPOCHS,
+                initial_epoch=initial_epoch,
+                callbacks=callbacks,
+                verbose=1
+            )
+    history.history = epoch_checkpoint.history
+    return history
+
 # ============================================================================
 # STEP 4: BUILD LSTM MODEL WITH ATTENTION
 # ============================================================================
 
 print("\n[4/6] Building LSTM model with attention mechanism...")
 
-def build_lstm_model(input_shape):
+def build_lstm_model(input_shape, n_outputs=1):
     """
     Build Bidirectional LSTM with Attention and Dense layers
+    n_outputs sigmoid units: 1 for the 6-hour label, FORECAST_STEPS for hourly risks
     """
     inputs = keras.Input(shape=input_shape)
     
@@ -157,15 +271,21 @@ def build_lstm_model(input_shape):
     x = layers.Dropout(0.2)(x)
     
     # Output layer
-    outputs = layers.Dense(1, activation='sigmoid')(x)
+    outputs = layers.Dense(n_outputs, activation='sigmoid')(x)
     
     model = keras.Model(inputs=inputs, outputs=outputs)
     return model
 
-model = build_lstm_model((SEQUENCE_LENGTH, len(FEATURE_COLUMNS)))
+model = build_lstm_model((SEQUENCE_LENGTH, len(FEATURE_COLUMNS)), FORECAST_STEPS if MULTI_HORIZON else 1)
 
 # Compile model with class weights to handle imbalance
 class_weight = {0: 1, 1: 10}  # Weight sepsis class 10x higher
+
+def sequence_weights(targets):
+    """class_weight of each sequence: the sepsis weight if any of its target hours is septic."""
+    targets = np.asarray(targets).reshape(len(targets), -1)
+    return np.where(targets.max(axis=1) == 1, class_weight[1], class_weight[0])
+
 model.compile(
     optimizer=keras.optimizers.Adam(learning_rate=0.001),
     loss='binary_crossentropy',
@@ -181,19 +301,22 @@ model.summary()
 
 print("\n[5/6] Training LSTM model...")
 
+scaling = None
+if SCALING_REPORT:
+    # Throughput on the training shards, before any weights are trained
+    y_fit_targets = y_seq[fit_index]
+    scaling = scaling_report(model, X_scaled, SEQUENCE_LENGTH, fit_index, y_fit_targets,
+                             sequence_weights(y_fit_targets), default_worker_counts(),
+                             batch_size=BATCH_SIZE, shuffle_buffer=SHUFFLE_BUFFER, seed=RANDOM_STATE)
+    print_scaling_report(scaling)
+
 # Callbacks
 early_stop = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
 reduce_lr = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
 
-history = model.fit(
-    X_train, y_train,
-    validation_split=VALIDATION_SPLIT,
-    epochs=EPOCHS,
-    batch_size=BATCH_SIZE,
-    class_weight=class_weight,
-    callbacks=[early_stop, reduce_lr],
-    verbose=1
-)
+y_fit_targets, y_val_targets = y_seq[fit_index], y_seq[val_index]
+history = fit_sequence_model(model, 'lstm', y_fit_targets, sequence_weights(y_fit_targets),
+                             y_val_targets, sequence_weights(y_val_targets), [early_stop, reduce_lr])
 
 print(f"\nTraining completed in {len(history.history['loss'])} epochs")
 
@@ -203,8 +326,9 @@ print(f"\nTraining completed in {len(history.history['loss'])} epochs")
 
 print("\n[6/6] Evaluating on test set...")
 
-# Predictions
-y_pred_proba = model.predict(X_test, verbose=0)
+# Predictions; the 6-hour risk is the mean over the hourly outputs, as served by app.forecast_phase3
+y_pred_hourly = model.predict(X_test, verbose=0)
+y_pred_proba = y_pred_hourly.mean(axis=1)
 y_pred = (y_pred_proba > 0.5).astype(int).flatten()
 
 # Metrics
@@ -233,6 +357,119 @@ print(f"  True Positives:  {tp}")
 print(f"\nSensitivity (Recall):  {tp/(tp+fn):.4f} (catches {tp/(tp+fn)*100:.2f}% of sepsis)")
 print(f"Specificity:           {tn/(tn+fp):.4f} (correctly identifies {tn/(tn+fp)*100:.2f}% of non-sepsis)")
 
+horizon_auc = {}
+if MULTI_HORIZON:
+    print(f"\nPer-horizon ROC-AUC (label of that hour):")
+    for h in range(FORECAST_STEPS):
+        labels = y_test_targets[:, h]
+        horizon = f'+{h + 1}h'
+        horizon_auc[horizon] = roc_auc_score(labels, y_pred_hourly[:, h]) if labels.min() != labels.max() else float('nan')
+        print(f"  {horizon}: {horizon_auc[horizon]:.4f}")
+
+# ============================================================================
+# INT8 QUANTIZATION
+# ============================================================================
+
+print("\n[INT8] Quantizing weights...")
+
+# Calibrate on (at most 2048 of) the validation sequences held out from model.fit
+X_calibration = create_sequences(X_scaled, val_index[::max(len(val_index) // 2048, 1)], SEQUENCE_LENGTH)
+int8_clips = calibrate_sequence_model(model, X_calibration)
+save_sequence_artifact(PHASE3_INT8_ARTIFACT, model, FEATURE_COLUMNS, int8_clips=int8_clips)
+print(f"✓ Saved: {PHASE3_INT8_ARTIFACT} ({len(int8_clips)} int8 kernels, calibrated on {len(X_calibration):,} sequences)")
+
+y_int8_proba = load_sequence_artifact(PHASE3_INT8_ARTIFACT).predict(X_test.astype(np.float32)).mean(axis=1)
+int8_report = quantization_report(y_test, y_pred_proba, y_int8_proba)
+print_quantization_report(int8_report, "test set")
+
+# ============================================================================
+# STATEFUL (CAUSAL) VARIANT
+# ============================================================================
+
+def build_stateful_lstm_model(input_shape, n_outputs=1):
+    """
+    Unidirectional LSTMs with the output head applied at every timestep, so the
+    prediction after hour t only depends on hours <= t. The server advances it
+    one hour at a time from each patient's LSTM state (lstm_state.py).
+    """
+    inputs = keras.Input(shape=input_shape)
+    x = layers.LSTM(64, return_sequences=True, dropout=0.2)(inputs)
+    x = layers.LSTM(32, return_sequences=True, dropout=0.2)(x)
+    x = layers.Dense(32, activation='relu')(x)
+    x = layers.Dropout(0.2)(x)
+    outputs = layers.Dense(n_outputs, activation='sigmoid')(x)
+    return keras.Model(inputs=inputs, outputs=outputs)
+
+def seconds_per_update(update, n):
+    """Mean wall time of update(i) for i in range(n)."""
+    start = time.perf_counter()
+    for i in range(n):
+        update(i)
+    return (time.perf_counter() - start) / n
+
+stateful_report = None
+if STATEFUL_VARIANT:
+    print("\n[STATEFUL] Training causal LSTM for one-hour updates...")
+    y_fit_steps = create_step_targets(y, fit_index, SEQUENCE_LENGTH, multi_horizon=MULTI_HORIZON)
+    y_val_steps = create_step_targets(y, val_index, SEQUENCE_LENGTH, multi_horizon=MULTI_HORIZON)
+    stateful_model = build_stateful_lstm_model((None, len(FEATURE_COLUMNS)), y_fit_steps.shape[-1])
+    stateful_model.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=0.001),
+        loss='binary_crossentropy',
+        metrics=['accuracy']
+    )
+    # Per-step weights: steps followed by a septic hour count 10x, as in class_weight
+    fit_sequence_model(stateful_model, 'stateful',
+                       y_fit_steps, np.where(y_fit_steps.max(axis=-1) == 1, class_weight[1], class_weight[0]),
+                       y_val_steps, np.where(y_val_steps.max(axis=-1) == 1, class_weight[1], class_weight[0]),
+                       [EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
+                        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)])
+
+    # Forecast after the last hour of each test sequence, where the current model predicts
+    y_stateful_proba = stateful_model.predict(X_test, verbose=0)[:, -1].mean(axis=1)
+    y_stateful = (y_stateful_proba > 0.5).astype(int)
+    save_sequence_artifact(PHASE3_STATEFUL_ARTIFACT, stateful_model, FEATURE_COLUMNS)
+    print(f"✓ Saved: {PHASE3_STATEFUL_ARTIFACT}")
+
+    # Served path: SEQUENCE_LENGTH step() calls from the zero state end on the same forecast
+    # (lstm_state.LSTMStateStore never advances a state further than that)
+    stateful_artifact = load_sequence_artifact(PHASE3_STATEFUL_ARTIFACT)
+    X_timing = X_test[:256].astype(np.float32)
+    state = stateful_artifact.initial_state(len(X_timing))
+    for t in range(SEQUENCE_LENGTH):
+        step_outputs, state = stateful_artifact.step(X_timing[:, t], state)
+    step_max_diff = float(np.abs(step_outputs.mean(axis=1) - y_stateful_proba[:len(X_timing)]).max())
+
+    # Cost of one patient's hourly update in the numpy runtime: the current model
+    # re-reads the 12-hour window, the stateful one takes one step
+    window_model = ArtifactSequenceModel(*keras_sequence_graph(model))
+    one_state = stateful_artifact.initial_state(1)
+    window_seconds = seconds_per_update(lambda i: window_model.predict(X_timing[i:i + 1]), len(X_timing))
+    step_seconds = seconds_per_update(lambda i: stateful_artifact.step(X_timing[i, -1:], one_state), len(X_timing))
+
+    stateful_report = {
+        'accuracy': accuracy_score(y_test, y_stateful),
+        'recall': recall_score(y_test, y_stateful, zero_division=0),
+        'f1_score': f1_score(y_test, y_stateful, zero_division=0),
+        'roc_auc': roc_auc_score(y_test, y_stateful_proba),
+        'window_ms_per_update': window_seconds * 1000,
+        'step_ms_per_update': step_seconds * 1000,
+        'speedup': window_seconds / step_seconds,
+        'step_max_abs_diff': step_max_diff,
+    }
+    print(f"\n📊 STATEFUL vs CURRENT MODEL (test set, after the last hour of each sequence):")
+    print(f"  {'':<16}{'current':>10}{'stateful':>10}{'delta':>10}")
+    for key, label, current in (('accuracy', 'Accuracy', acc), ('recall', 'Recall', recall),
+                                ('f1_score', 'F1-Score', f1), ('roc_auc', 'ROC-AUC', auc)):
+        stateful_report[f'{key}_delta'] = stateful_report[key] - current
+        print(f"  {label:<16}{current:>10.4f}{stateful_report[key]:>10.4f}{stateful_report[f'{key}_delta']:>+10.4f}")
+    print(f"  {'ms per update':<16}{stateful_report['window_ms_per_update']:>10.3f}"
+          f"{stateful_report['step_ms_per_update']:>10.3f}  ({stateful_report['speedup']:.1f}x faster)")
+    print(f"  • Max |step() - predict()|: {step_max_diff:.2e}")
+
+# Both models are trained; drop the cached sequences
+shutil.rmtree(cache_dir, ignore_errors=True)
+
 # ============================================================================
 # SAVE MODEL AND COMPONENTS
 # ============================================================================
@@ -248,6 +485,9 @@ print("✓ Saved: model_phase3_lstm.h5")
 # Save scaler
 pickle.dump(scaler, open('scaler_phase3.pkl', 'wb'))
 print("✓ Saved: scaler_phase3.pkl")
+save_scaler_artifact(PHASE3_SCALER_ARTIFACT, scaler, FEATURE_COLUMNS,
+                     imputation=np.nan_to_num((raw_medians - scaler.mean_) / scaler.scale_))
+print(f"✓ Saved: {PHASE3_SCALER_ARTIFACT}")
 
 # Save training history
 pickle.dump(history.history, open('history_phase3.pkl', 'wb'))
@@ -263,12 +503,26 @@ metrics = {
     'confusion_matrix': {'tn': int(tn), 'fp': int(fp), 'fn': int(fn), 'tp': int(tp)},
     'sequence_length': SEQUENCE_LENGTH,
     'forecast_steps': FORECAST_STEPS,
+    'multi_horizon': MULTI_HORIZON,
+    'horizon_roc_auc': horizon_auc,
     'n_features': len(FEATURE_COLUMNS),
-    'feature_names': FEATURE_COLUMNS
+    'feature_names': FEATURE_COLUMNS,
+    'int8': int8_report,
+    'stateful': stateful_report,
+    'training': {
+        'data_parallel_workers': DATA_PARALLEL_WORKERS,
+        'sync_steps': SYNC_STEPS if DATA_PARALLEL_WORKERS > 1 else None,
+        'epoch_seconds': history.history.get('seconds'),
+        'scaling': scaling,
+    }
 }
 pickle.dump(metrics, open('metrics_phase3.pkl', 'wb'))
 print("✓ Saved: metrics_phase3.pkl")
 
+# All artifacts are saved; the checkpoints are no longer needed
+checkpoint.remove()
+print(f"✓ Removed checkpoints: {CHECKPOINT_DIR}")
+
 # ============================================================================
 # VISUALIZATION
 # ============================================================================
@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Staged, cached training and evaluation pipeline for the Phase 1 model.
+
+    load -> select -> split -> scale -> train -> quantize -> calibrate -> evaluate
+
+Every stage's output arrays are stored in .pipeline_cache/ under a key hashed
+from the stage name, its code version, its parameters and the keys of its
+inputs. The load stage is keyed by the SHA-256 of the CSV contents. Re-running
+with the same settings reuses every stage; changing only the classifier
+re-runs train and evaluate on the cached, scaled arrays.
+
+    python training_pipeline.py                          # train and evaluate the default MLP
+    python training_pipeline.py --classifier logreg      # reuses load/select/split/scale
+    python training_pipeline.py --force train            # recompute train and everything after it
+    python training_pipeline.py --export                 # also write model_artifact(_int8).safetensors
+    python training_pipeline.py --calibration platt      # re-runs calibrate and evaluate only
+
+Unlike the standalone training scripts, the minority class is upsampled in
+the training split only, so the validation and test sets have no duplicated
+rows. The calibrate stage fits isotonic or Platt calibration on the
+validation set, tabulates it as (raw, calibrated) points for np.interp at
+serving time, and picks the decision threshold on the calibrated scores.
+
+Missing measurements are filled with the training medians (--impute median)
+or with --fill-value (--impute constant). Either way the fill values, in
+scaled space, are stored in the artifact and serving applies the same ones.
+
+The quantize stage stores the trained MLP's weights as int8, with clips
+calibrated on the validation set (see quantization.py); evaluate reports the
+int8 model's accuracy and ROC-AUC deltas against the float model.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from model_artifact import (PHASE1_ARTIFACT, PHASE1_INT8_ARTIFACT, ArtifactScaler, imputation_values,
+                            load_phase1_artifact, save_phase1_artifact)
+from quantization import calibrate_mlp, print_quantization_report, quantization_report
+
+CACHE_DIR = '.pipeline_cache'
+STAGES = ['load', 'select', 'split', 'scale', 'train', 'quantize', 'calibrate', 'evaluate']
+
+# Bump a stage's version when its code changes, to invalidate cached outputs
+STAGE_VERSIONS = {'load': 1, 'select': 2, 'split': 2, 'scale': 4, 'train': 3, 'quantize': 1, 'calibrate': 1,
+                  'evaluate': 3}
+
+# Grid size of the Platt calibration table
+PLATT_TABLE_POINTS = 256
+
+# Must match FEATURE_NAMES in app.py
+FEATURE_NAMES = [
+    'HR', 'O2Sat', 'Temp', 'SBP', 'MAP', 'DBP', 'Resp',
+    'BaseExcess', 'HCO3', 'FiO2', 'PaCO2', 'SaO2', 'Creatinine',
+    'Bilirubin_direct', 'Glucose', 'Lactate', 'Magnesium', 'Phosphate',
+    'Bilirubin_total', 'Hgb', 'WBC', 'Fibrinogen', 'Platelets',
+    'Age', 'Gender', 'HospAdmTime', 'ICULOS'
+]
+LABEL = 'SepsisLabel'
+
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageResult:
+    def __init__(self, name, key, arrays, cached):
+        self.name = name
+        self.key = key
+        self.arrays = arrays
+        self.cached = cached
+
+
+class StageCache:
+    """Content-addressed store of stage outputs (dicts of numpy arrays, saved as .npz)"""
+
+    def __init__(self, root=CACHE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, name, params, inputs):
+        spec = {
+            'stage': name,
+            'version': STAGE_VERSIONS[name],
+            'params': params,
+            'inputs': [result.key for result in inputs],
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:16]
+
+    def path(self, name, key, suffix='.npz'):
+        return os.path.join(self.root, f"{name}-{key}{suffix}")
+
+    def run(self, name, func, params, inputs=(), force=False):
+        """
+        Return the cached output of a stage, or compute and store it.
+
+        Args:
+            name: Stage name (key of STAGE_VERSIONS)
+            func: Callable(*input arrays dicts, **params) -> dict of arrays
+            params: JSON-serialisable stage parameters
+            inputs: StageResults the stage depends on
+            force: Recompute even if cached
+        """
+        key = self.key(name, params, inputs)
+        path = self.path(name, key)
+        if os.path.exists(path) and not force:
+            with np.load(path, allow_pickle=False) as data:
+                return StageResult(name, key, {k: data[k] for k in data.files}, cached=True)
+
+        arrays = func(*[result.arrays for result in inputs], **params)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+        return StageResult(name, key, arrays, cached=False)
+
+
+# ============================================================================
+# Stages
+# ============================================================================
+
+def load_stage(data_path):
+    """Parse the CSV once into a numeric matrix."""
+    import pandas as pd
+    df = pd.read_csv(data_path)
+    df = df.select_dtypes(include='number')
+    return {'values': df.to_numpy(dtype=float), 'columns': np.array(df.columns, dtype=str)}
+
+
+def select_stage(loaded, features, label, impute, fill_value):
+    """
+    Pick the feature and label columns. Missing values stay NaN for median
+    imputation (done in the scale stage) or become fill_value.
+    """
+    columns = list(loaded['columns'])
+    missing = [f for f in features + [label] if f not in columns]
+    if missing:
+        raise ValueError(f"columns not found in data: {missing}")
+    values = loaded['values']
+    X = values[:, [columns.index(f) for f in features]]
+    y = values[:, columns.index(label)].astype(np.int64)
+    if impute == 'constant':
+        X = np.where(np.isnan(X), fill_value, X)
+    return {'X': X, 'y': y}
+
+
+def split_stage(selected, test_size, val_size, seed, balance):
+    """Train/validation/test split; optionally upsample the minority class in the training part."""
+    from sklearn.model_selection import train_test_split
+    X_train, X_test, y_train, y_test = train_test_split(
+        selected['X'], selected['y'], test_size=test_size, random_state=seed, stratify=selected['y']
+    )
+    X_train, X_val, y_train, y_val = train_test_split(
+        X_train, y_train, test_size=val_size / (1 - test_size), random_state=seed, stratify=y_train
+    )
+    if balance == 'upsample':
+        rng = np.random.default_rng(seed)
+        counts = np.bincount(y_train, minlength=2)
+        minority = int(np.argmin(counts))
+        extra = rng.choice(np.flatnonzero(y_train == minority), counts.max() - counts.min(), replace=True)
+        X_train = np.concatenate([X_train, X_train[extra]])
+        y_train = np.concatenate([y_train, y_train[extra]])
+        order = rng.permutation(len(y_train))
+        X_train, y_train = X_train[order], y_train[order]
+    return {'X_train': X_train, 'X_val': X_val, 'X_test': X_test,
+            'y_train': y_train, 'y_val': y_val, 'y_test': y_test}
+
+
+def scale_stage(split, impute, fill_value):
+    """
+    Fit a StandardScaler on the training part and apply it to all parts,
+    filling missing values with the training medians as serving does. With
+    constant imputation the select stage has already filled them; the
+    artifact then gets fill_value in scaled space.
+    """
+    from sklearn.preprocessing import StandardScaler
+    scaler = StandardScaler().fit(split['X_train'])
+    if impute == 'constant':
+        imputation = (fill_value - np.nan_to_num(scaler.mean_)) / np.nan_to_num(scaler.scale_, nan=1.0)
+    else:
+        imputation = imputation_values(split['X_train'], scaler)
+
+    def transform(X):
+        return np.where(np.isnan(X), imputation, scaler.transform(X))
+
+    return {
+        'X_train': transform(split['X_train']),
+        'X_val': transform(split['X_val']),
+        'X_test': transform(split['X_test']),
+        'y_train': split['y_train'],
+        'y_val': split['y_val'],
+        'y_test': split['y_test'],
+        # Features never observed in training pass through unscaled
+        'mean': np.nan_to_num(scaler.mean_),
+        'scale': np.nan_to_num(scaler.scale_, nan=1.0),
+        'imputation': imputation,
+    }
+
+
+def make_classifier(name, seed):
+    """Classifiers selectable with --classifier."""
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.neural_network import MLPClassifier
+    if name == 'mlp':
+        # Configuration of train_model_27features.py
+        return MLPClassifier(activation='relu', solver='adam', early_stopping=True, validation_fraction=0.1,
+                             n_iter_no_change=50, hidden_layer_sizes=(64, 32, 16, 8, 2), random_state=seed,
+                             max_iter=20000, learning_rate='adaptive', learning_rate_init=1e-4, tol=1e-4)
+    if name == 'mlp_fast':
+        # Configuration of train_model_27_fast.py
+        return MLPClassifier(hidden_layer_sizes=(64, 32, 16), activation='relu', solver='adam', max_iter=500,
+                             early_stopping=True, validation_fraction=0.1, n_iter_no_change=20, random_state=seed)
+    if name == 'logreg':
+        return LogisticRegression(max_iter=1000, random_state=seed)
+    raise ValueError(f"unknown classifier '{name}'")
+
+
+CLASSIFIERS = ['mlp', 'mlp_fast', 'logreg']
+
+
+def train_stage(scaled, classifier, seed, model_path, features):
+    """Fit the classifier; keep its probabilities on every split and, for MLPs, the model artifact."""
+    model = make_classifier(classifier, seed)
+    model.fit(scaled['X_train'], scaled['y_train'])
+    if hasattr(model, 'coefs_'):
+        save_phase1_artifact(model_path, model,
+                             ArtifactScaler(scaled['mean'], scaled['scale'], scaled['imputation']),
+                             feature_names=features)
+    return {
+        'train_proba': model.predict_proba(scaled['X_train'])[:, 1],
+        'val_proba': model.predict_proba(scaled['X_val'])[:, 1],
+        'test_proba': model.predict_proba(scaled['X_test'])[:, 1],
+    }
+
+
+def quantize_stage(scaled, trained, model_path, int8_path):
+    """
+    int8 copy of the trained MLP artifact, with clips calibrated on the
+    validation set. Non-MLP classifiers have nothing to quantize.
+    """
+    if model_path is None:
+        return {}
+    artifact = load_phase1_artifact(model_path)
+    model = artifact['model']
+    clips = calibrate_mlp(model, scaled['X_val'])
+    save_phase1_artifact(int8_path, model, artifact['scaler'], feature_names=artifact['feature_names'],
+                         int8_clips=clips)
+    int8_model = load_phase1_artifact(int8_path)['model']
+    return {
+        'val_proba': int8_model.predict_proba(scaled['X_val'].astype(np.float32))[:, 1],
+        'test_proba': int8_model.predict_proba(scaled['X_test'].astype(np.float32))[:, 1],
+    }
+
+
+def calibration_table(raw, y, method):
+    """
+    Fit a calibration map on validation scores and tabulate it.
+    Returns (x, y) arrays such that np.interp(p, x, y) is the calibrated probability.
+    """
+    if method == 'isotonic':
+        from sklearn.isotonic import IsotonicRegression
+        iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds='clip').fit(raw, y)
+        # Isotonic predictions are linear interpolation between these points
+        return iso.X_thresholds_, iso.y_thresholds_
+
+    # Platt scaling on the log-odds, tabulated densely where the scores lie
+    from sklearn.linear_model import LogisticRegression
+    def logit(p):
+        p = np.clip(p, 1e-7, 1 - 1e-7)
+        return np.log(p / (1 - p))
+    platt = LogisticRegression(C=1e6).fit(logit(raw)[:, None], y)
+    grid = np.unique(np.concatenate([
+        np.linspace(0.0, 1.0, PLATT_TABLE_POINTS),
+        np.quantile(raw, np.linspace(0.0, 1.0, PLATT_TABLE_POINTS)),
+    ]))
+    return grid, platt.predict_proba(logit(grid)[:, None])[:, 1]
+
+
+def calibrate_stage(scaled, trained, method, threshold_metric):
+    """Calibration table and decision threshold, both chosen on the validation set."""
+    from sklearn.metrics import precision_recall_curve, roc_curve
+    y_val = scaled['y_val']
+    table_x, table_y = calibration_table(trained['val_proba'], y_val, method)
+    calibrated = np.interp(trained['val_proba'], table_x, table_y)
+
+    if threshold_metric == 'f1':
+        precision, recall, thresholds = precision_recall_curve(y_val, calibrated)
+        f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+        optimal_threshold = thresholds[np.argmax(f1[:-1])]
+    else:
+        # Youden's J: maximise sensitivity + specificity - 1
+        fpr, tpr, thresholds = roc_curve(y_val, calibrated)
+        optimal_threshold = min(thresholds[np.argmax(tpr - fpr)], 1.0)
+    return {'table_x': table_x, 'table_y': table_y, 'optimal_threshold': np.array(optimal_threshold)}
+
+
+def _metrics(y_true, proba, threshold, prefix=''):
+    from sklearn.metrics import accuracy_score, brier_score_loss, precision_score, recall_score
+    y_pred = (proba >= threshold).astype(np.int64)
+    return {
+        f'{prefix}accuracy': np.array(accuracy_score(y_true, y_pred)),
+        f'{prefix}precision': np.array(precision_score(y_true, y_pred, zero_division=0)),
+        f'{prefix}recall': np.array(recall_score(y_true, y_pred, zero_division=0)),
+        f'{prefix}brier': np.array(brier_score_loss(y_true, proba)),
+    }
+
+
+def evaluate_stage(scaled, trained, quantized, calibrated, threshold):
+    """
+    Test-set metrics of the raw scores at `threshold`, of the calibrated
+    scores at the optimal threshold and, for MLPs, of the int8 model.
+    """
+    from sklearn.metrics import confusion_matrix, roc_auc_score
+    y_test = scaled['y_test']
+    calibrated_proba = np.interp(trained['test_proba'], calibrated['table_x'], calibrated['table_y'])
+    optimal_threshold = float(calibrated['optimal_threshold'])
+    tn, fp, fn, tp = confusion_matrix(y_test, calibrated_proba >= optimal_threshold, labels=[0, 1]).ravel()
+    metrics = dict(
+        _metrics(y_test, trained['test_proba'], threshold),
+        **_metrics(y_test, calibrated_proba, optimal_threshold, prefix='calibrated_'),
+        train_accuracy=np.array(np.mean((trained['train_proba'] >= threshold) == scaled['y_train'])),
+        roc_auc=np.array(roc_auc_score(y_test, trained['test_proba'])),
+        confusion_matrix=np.array([[tn, fp], [fn, tp]]),
+    )
+    if 'test_proba' in quantized:
+        report = quantization_report(y_test, trained['test_proba'], quantized['test_proba'], threshold)
+        metrics.update({f'quantization_{key}': np.array(value) for key, value in report.items()})
+    return metrics
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def run_pipeline(args, cache=None):
+    """Run every stage, reusing cached outputs. Returns {stage name: StageResult}."""
+    cache = cache or StageCache(args.cache_dir)
+    force_from = STAGES.index(args.force) if args.force else len(STAGES)
+
+    def force(name):
+        return STAGES.index(name) >= force_from
+
+    results = {}
+    # Keyed by content only, so a moved or copied file still hits the cache
+    results['load'] = cache.run('load', lambda sha256: load_stage(args.data), {'sha256': file_sha256(args.data)},
+                                force=force('load'))
+    results['select'] = cache.run('select', select_stage,
+                                  {'features': FEATURE_NAMES, 'label': LABEL, 'impute': args.impute,
+                                   'fill_value': args.fill_value},
+                                  [results['load']], force=force('select'))
+    results['split'] = cache.run('split', split_stage,
+                                 {'test_size': args.test_size, 'val_size': args.val_size, 'seed': args.seed,
+                                  'balance': args.balance},
+                                 [results['select']], force=force('split'))
+    results['scale'] = cache.run('scale', scale_stage, {'impute': args.impute, 'fill_value': args.fill_value},
+                                 [results['split']], force=force('scale'))
+
+    train_params = {'classifier': args.classifier, 'seed': args.seed}
+    model_path = cache.path('train', cache.key('train', train_params, [results['scale']]), '.safetensors')
+    results['train'] = cache.run('train', lambda scaled, **p: train_stage(scaled, model_path=model_path,
+                                                                          features=FEATURE_NAMES, **p),
+                                 train_params, [results['scale']], force=force('train'))
+    results['train'].model_path = model_path if os.path.exists(model_path) else None
+
+    int8_path = cache.path('quantize', cache.key('quantize', {}, [results['scale'], results['train']]), '.safetensors')
+    results['quantize'] = cache.run('quantize', lambda scaled, trained: quantize_stage(
+                                        scaled, trained, model_path=results['train'].model_path, int8_path=int8_path),
+                                    {}, [results['scale'], results['train']], force=force('quantize'))
+    results['quantize'].model_path = int8_path if os.path.exists(int8_path) else None
+
+    results['calibrate'] = cache.run('calibrate', calibrate_stage,
+                                     {'method': args.calibration, 'threshold_metric': args.threshold_metric},
+                                     [results['scale'], results['train']], force=force('calibrate'))
+    results['evaluate'] = cache.run('evaluate', evaluate_stage, {'threshold': args.threshold},
+                                    [results['scale'], results['train'], results['quantize'], results['calibrate']],
+                                    force=force('evaluate'))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='sepsis.csv')
+    parser.add_argument('--classifier', choices=CLASSIFIERS, default='mlp')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--val-size', type=float, default=0.1, help='Calibration/threshold set, fraction of all rows')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--balance', choices=['upsample', 'none'], default='upsample')
+    parser.add_argument('--impute', choices=['median', 'constant'], default='median',
+                        help='Fill missing measurements with training medians or --fill-value')
+    parser.add_argument('--fill-value', type=float, default=0.0, help='Value for missing measurements (--impute constant)')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Threshold for the uncalibrated metrics')
+    parser.add_argument('--calibration', choices=['isotonic', 'platt'], default='isotonic')
+    parser.add_argument('--threshold-metric', choices=['youden', 'f1'], default='youden')
+    parser.add_argument('--force', choices=STAGES, help='Recompute this stage and all later ones')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--export', action='store_true',
+                        help=f'Write the trained MLP with its calibration table to {PHASE1_ARTIFACT}, '
+                             f'and its int8 version to {PHASE1_INT8_ARTIFACT}')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("PHASE 1 TRAINING PIPELINE")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    results = run_pipeline(args)
+    for i, name in enumerate(STAGES, 1):
+        result = results[name]
+        print(f"[{i}/{len(STAGES)}] {name:<9} {'cached' if result.cached else 'computed'}  ({result.key})")
+
+    metrics = results['evaluate'].arrays
+    calibration = results['calibrate'].arrays
+    optimal_threshold = float(calibration['optimal_threshold'])
+    tn, fp, fn, tp = metrics['confusion_matrix'].ravel()
+    print(f"\n📊 RESULTS ({args.classifier}):")
+    print(f"  {'':<16}{'raw @ ' + str(args.threshold):>16}{f'{args.calibration} @ {optimal_threshold:.3f}':>24}")
+    print(f"  {'Train Accuracy':<16}{float(metrics['train_accuracy']):>16.4f}")
+    for key, label in (('accuracy', 'Test Accuracy'), ('precision', 'Precision'), ('recall', 'Recall'),
+                       ('brier', 'Brier score')):
+        print(f"  {label:<16}{float(metrics[key]):>16.4f}{float(metrics['calibrated_' + key]):>24.4f}")
+    print(f"  {'ROC-AUC':<16}{float(metrics['roc_auc']):>16.4f}")
+    print(f"  • Calibrated confusion matrix: TN={tn}, FP={fp}, FN={fn}, TP={tp}")
+    print(f"  • Calibration table: {len(calibration['table_x'])} points")
+    if 'quantization_int8_roc_auc' in metrics:
+        report = {key[len('quantization_'):]: float(value) for key, value in metrics.items()
+                  if key.startswith('quantization_')}
+        print_quantization_report(report, f"test set, clips calibrated on "
+                                          f"{len(results['scale'].arrays['y_val']):,} validation rows")
+
+    if args.export:
+        model_path = results['train'].model_path
+        if model_path is None:
+            print(f"[WARNING] {args.classifier} cannot be exported as a model artifact")
+        else:
+            artifact = load_phase1_artifact(model_path)
+            save_phase1_artifact(
+                PHASE1_ARTIFACT, artifact['model'], artifact['scaler'], feature_names=FEATURE_NAMES,
+                threshold_info={'optimal_threshold': optimal_threshold, 'metric': args.threshold_metric,
+                                'calibration': args.calibration},
+                calibration=(calibration['table_x'], calibration['table_y'])
+            )
+            print(f"✓ Exported to: {PHASE1_ARTIFACT}")
+
+            int8_path = results['quantize'].model_path
+            if int8_path is not None:
+                # Calibration steps amplify small score shifts, so the int8 model gets its own table
+                int8_calibration = calibrate_stage(results['scale'].arrays, results['quantize'].arrays,
+                                                   args.calibration, args.threshold_metric)
+                artifact = load_phase1_artifact(int8_path)
+                save_phase1_artifact(
+                    PHASE1_INT8_ARTIFACT, artifact['model'], artifact['scaler'], feature_names=FEATURE_NAMES,
+                    threshold_info={'optimal_threshold': float(int8_calibration['optimal_threshold']),
+                                    'metric': args.threshold_metric, 'calibration': args.calibration},
+                    calibration=(int8_calibration['table_x'], int8_calibration['table_y'])
+                )
+                print(f"✓ Exported to: {PHASE1_INT8_ARTIFACT}")
+
+    print(f"\nDone in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
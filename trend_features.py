@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Online trend features for the 43-feature Phase 2 model.
+
+The Phase 2 model takes the 27 Phase 1 features plus TREND_FEATURES: for
+each of TREND_VITALS the change since the previous hour (`<vital>_trend_1h`)
+and the standard deviation over the last TREND_WINDOW hours
+(`<vital>_volatility`, sample std, 0 with fewer than two values).
+Missing hours carry the last measured value forward; a vital that has never
+been measured contributes 0 to both features.
+
+TrendFeatureStore keeps per-patient state and updates it with one
+observation per hour in O(1): a ring buffer of the window plus running
+mean and sum of squared deviations (Welford's method, with the removal step
+for sliding windows), so no patient history is ever re-read.
+trend_features_from_history() is the batch (pandas) definition the store
+reproduces, for building training data and for checking the two agree.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+TREND_VITALS = ['HR', 'O2Sat', 'Temp', 'Lactate', 'SBP', 'Creatinine', 'WBC', 'Glucose']
+TREND_FEATURES = [name for vital in TREND_VITALS for name in (f"{vital}_trend_1h", f"{vital}_volatility")]
+
+# Hours in the volatility window
+TREND_WINDOW = int(os.environ.get('SEPSIS_TREND_WINDOW', 6))
+
+
+class PatientTrendState:
+    """Rolling window state of one patient's TREND_VITALS"""
+
+    __slots__ = ('window', 'ring', 'pos', 'count', 'mean', 'm2', 'last', 'trend', 'hours', 'updated_at')
+
+    def __init__(self, window=TREND_WINDOW):
+        n_vitals = len(TREND_VITALS)
+        self.window = window
+        self.ring = [[0.0] * window for _ in range(n_vitals)]
+        self.pos = [0] * n_vitals
+        self.count = [0] * n_vitals
+        self.mean = [0.0] * n_vitals
+        self.m2 = [0.0] * n_vitals
+        self.last = [None] * n_vitals
+        self.trend = [0.0] * n_vitals
+        self.hours = 0
+        self.updated_at = 0.0
+
+    def update(self, values):
+        """
+        Add one hour of measurements.
+
+        Args:
+            values: one value per TREND_VITALS entry, None where not measured
+        """
+        for i, x in enumerate(values):
+            last = self.last[i]
+            if x is None:
+                # Carry the last measurement forward; never-measured vitals are skipped
+                if last is None:
+                    continue
+                x = last
+            self.trend[i] = 0.0 if last is None else x - last
+            self.last[i] = x
+
+            ring, pos = self.ring[i], self.pos[i]
+            if self.count[i] < self.window:
+                # Growing window: standard Welford update
+                self.count[i] += 1
+                delta = x - self.mean[i]
+                self.mean[i] += delta / self.count[i]
+                self.m2[i] += delta * (x - self.mean[i])
+            else:
+                # Full window: the new value replaces the oldest one
+                oldest = ring[pos]
+                old_mean = self.mean[i]
+                self.mean[i] += (x - oldest) / self.window
+                self.m2[i] = max(self.m2[i] + (x - oldest) * (x - self.mean[i] + oldest - old_mean), 0.0)
+            ring[pos] = x
+            self.pos[i] = (pos + 1) % self.window
+
+        self.hours += 1
+        self.updated_at = time.monotonic()
+
+    def features(self):
+        """(len(TREND_FEATURES),) trend and volatility values, in TREND_FEATURES order."""
+        features = np.empty(2 * len(TREND_VITALS))
+        for i in range(len(TREND_VITALS)):
+            count = self.count[i]
+            features[2 * i] = self.trend[i]
+            features[2 * i + 1] = math.sqrt(self.m2[i] / (count - 1)) if count > 1 else 0.0
+        return features
+
+
+class TrendFeatureStore:
+    """Thread-safe per-patient PatientTrendState map with LRU eviction and a time-to-live"""
+
+    def __init__(self, maxsize=10000, ttl=86400.0, window=TREND_WINDOW):
+        """
+        Args:
+            maxsize: Maximum number of patients kept
+            ttl: Seconds without an update after which a patient's state is dropped
+            window: Hours in the volatility window
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.window = window
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def update(self, patient_id, observation):
+        """
+        Add one hour of a patient's measurements and return the updated features.
+
+        Args:
+            patient_id: Any hashable patient identifier
+            observation: dict of vital -> value; missing or non-numeric values
+                         count as not measured
+
+        Returns:
+            tuple: ((len(TREND_FEATURES),) features, hours observed so far)
+        """
+        values = [None] * len(TREND_VITALS)
+        for i, vital in enumerate(TREND_VITALS):
+            try:
+                value = float(observation.get(vital, ''))
+            except (ValueError, TypeError):
+                continue
+            if math.isfinite(value):
+                values[i] = value
+
+        now = time.monotonic()
+        with self._lock:
+            state = self._states.get(patient_id)
+            if state is not None and state.updated_at + self.ttl < now:
+                state = None
+                self.expirations += 1
+            if state is None:
+                state = self._states[patient_id] = PatientTrendState(self.window)
+            self._states.move_to_end(patient_id)
+            state.update(values)
+            features, hours = state.features(), state.hours
+            while len(self._states) > self.maxsize:
+                self._states.popitem(last=False)
+                self.evictions += 1
+        return features, hours
+
+    def discard(self, patient_id):
+        """Forget a patient (e.g. on discharge). Returns whether it was known."""
+        with self._lock:
+            return self._states.pop(patient_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'patients': len(self._states),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'window_hours': self.window,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+def trend_features_from_history(history, window=TREND_WINDOW):
+    """
+    Batch definition of the trend features for one patient.
+
+    Args:
+        history: DataFrame with one row per hour (oldest first) and the
+                 TREND_VITALS columns, NaN where not measured
+        window: Hours in the volatility window
+
+    Returns:
+        DataFrame: TREND_FEATURES columns, one row per hour
+    """
+    import pandas as pd
+
+    values = history.reindex(columns=TREND_VITALS).astype(float).ffill()
+    trend = values.diff().fillna(0.0)
+    volatility = values.rolling(window, min_periods=2).std().fillna(0.0)
+    features = pd.DataFrame(index=history.index)
+    for vital in TREND_VITALS:
+        features[f"{vital}_trend_1h"] = trend[vital]
+        features[f"{vital}_volatility"] = volatility[vital]
+    return features
@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Importing this module loads the sklearn model, scaler and calibration files
+once. With gunicorn's preload_app the import happens in the master process,
+so every forked worker shares those objects copy-on-write instead of
+unpickling its own copy.
+"""
+
+from app import app, init_worker
+
+application = app
+
+__all__ = ['application', 'init_worker']